@@ -1,10 +1,26 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.forms.models import BaseInlineFormSet
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from . import jobs
 from .helpers import end_of_month
-from .models import Category, Task, SubTask
+from .pagination import EstimatedCountPaginator
+from .models import Category, Job, JobStatus, Task, SubTask
 
 
 def update_deadline(modeladmin, request, queryset):
-    queryset.update(deadline=end_of_month())
+    '''
+    На больших выборках перенос идёт пакетами в фоне (manage.py run_jobs).
+    Ставится сам запрос выборки - pk читает уже задача.
+    '''
+    job = jobs.enqueue(
+        'move_deadlines',
+        model=queryset.model._meta.label,
+        query=jobs.dump_query(queryset),
+        deadline=end_of_month().isoformat())
+    modeladmin.message_user(
+        request, f'Deadline move queued as job {job}', messages.SUCCESS)
 
 
 update_deadline.short_description = "Move the deadline to the end of the month"
@@ -12,7 +28,23 @@ update_deadline.short_description = "Move the deadline to the end of the month"
 
 @admin.register(Category)
 class CategoryModelAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('name', 'task_count')
+    # для autocomplete_fields в задачах
+    search_fields = ('name',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class LatestInlineFormSet(BaseInlineFormSet):
+    '''
+    Показывает только limit последних объектов (по Meta.ordering модели) -
+    у задачи могут быть тысячи подзадач. Остальные - по ссылке в
+    TaskModelAdmin.subtasks_summary.
+    '''
+    limit = 20
+
+    def get_queryset(self):
+        return super().get_queryset()[:self.limit]
 
 
 class TaskCategoryInline(admin.TabularInline):
@@ -22,6 +54,8 @@ class TaskCategoryInline(admin.TabularInline):
     '''
     model = Task.categories.through
     extra = 1  # Определяет количество пустых форм для ввода новых объектов.
+    # вместо <select> со всеми категориями
+    autocomplete_fields = ['category']
 
 
 class TaskSubTaskInline(admin.StackedInline):
@@ -30,33 +64,80 @@ class TaskSubTaskInline(admin.StackedInline):
     '''
     model = SubTask
     extra = 1  # Определяет количество пустых форм для ввода новых объектов.
+    formset = LatestInlineFormSet
+    exclude = ['created_at']
+    autocomplete_fields = ['owner']
 
 
 @admin.register(Task)
 class TaskModelAdmin(admin.ModelAdmin):
     # list settings
-    list_display = ('title', 'description', 'status', 'created_at', 'deadline')
+    list_display = ('title', 'description', 'status', 'owner', 'created_at', 'deadline')
+    list_select_related = ('owner',)
     search_fields = ('title', 'description')
     list_filter = ('status', 'created_at', 'deadline')
     ordering = ('deadline', 'title')
     list_per_page = 3
     actions = [update_deadline]
+    # без COUNT(*) по всей таблице (см. EstimatedCountPaginator)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     # item settings
     # fields = ('title', 'description', 'status', 'deadline')
     exclude = ['created_at', 'categories']
+    readonly_fields = ['subtasks_summary']
+    autocomplete_fields = ['owner']
     inlines = [TaskCategoryInline, TaskSubTaskInline]
 
+    @admin.display(description='subtasks')
+    def subtasks_summary(self, obj):
+        if obj.pk is None:
+            return '-'
+        count = obj.subtasks.count()
+        url = reverse('admin:myapp_subtask_changelist')
+        return format_html(
+            '{} (below - the latest {}) <a href="{}?task__id__exact={}">'
+            'all subtasks</a>',
+            count, LatestInlineFormSet.limit, url, obj.pk)
+
 
 @admin.register(SubTask)
 class SubTaskModelAdmin(admin.ModelAdmin):
     # list settings
-    list_display = ('title', 'description', 'status', 'created_at', 'deadline')
+    list_display = ('title', 'description', 'status', 'task', 'owner', 'created_at', 'deadline')
+    list_select_related = ('task', 'owner')
     search_fields = ('title', 'description')
     list_filter = ('status', 'created_at', 'deadline')
     ordering = ('deadline', 'title')
     list_per_page = 3
     actions = [update_deadline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     # item settings
     exclude = ['created_at']
+    autocomplete_fields = ['task', 'owner']
+
+
+def retry_jobs(modeladmin, request, queryset):
+    queryset.filter(status=JobStatus.FAILED).update(
+        status=JobStatus.QUEUED, attempts=0, run_at=timezone.now(),
+        finished_at=None)
+
+
+retry_jobs.short_description = "Retry failed jobs"
+
+
+@admin.register(Job)
+class JobModelAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'progress', 'total', 'attempts',
+                    'run_at', 'locked_by', 'finished_at')
+    list_filter = ('status', 'name')
+    actions = [retry_jobs]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = [field.name for field in Job._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
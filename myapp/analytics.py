@@ -0,0 +1,343 @@
+'''
+Аналитика задач по периодам для /api/tasks/analytics/: по дням, неделям
+или месяцам - создано и завершено за период, открыто (burndown) и
+просрочено на конец периода, разбивка по владельцам и категориям.
+
+Прошедшие дни хранятся в TaskRollup (задача rollup_task_analytics), на
+лету считаются только дни после последнего среза - обычно сегодняшний.
+События дня группируются в SQL по усечённым датам: created_at,
+completed_at, началу просрочки max(created_at, deadline) и её концу
+max(created_at, deadline, completed_at). Открытые и просроченные на конец
+дня - нарастающий итог этих событий от прямого подсчёта на начало
+диапазона (или от среза предыдущего дня).
+'''
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Greatest, Trunc, TruncDate
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import Category, Task, TaskRollup
+
+
+PERIODS = ('day', 'week', 'month')
+# (поля группировки, условие): все задачи владельца и задачи по категориям
+DIMENSIONS = [
+    (('owner',), Q()),
+    (('owner', 'categories'), Q(categories__isnull=False)),
+]
+# событие -> (поле, из которого берётся день; составляющие поля)
+EVENTS = {
+    'created': ('created_at', ('created_at',)),
+    'completed': ('completed_at', ('completed_at',)),
+    'overdue_in': ('overdue_from', ('created_at', 'deadline')),
+    'overdue_out': ('overdue_until', ('created_at', 'deadline', 'completed_at')),
+}
+METRICS = ('created', 'completed', 'open', 'overdue')
+ROLLUP_CHUNK_DAYS = 31
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def bucket_of(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(bucket, period):
+    if period == 'week':
+        return bucket + timedelta(days=7)
+    if period == 'month':
+        return (bucket + timedelta(days=32)).replace(day=1)
+    return bucket + timedelta(days=1)
+
+
+def tasks():
+    # у незавершённой задачи overdue_until - NULL (кроме PostgreSQL,
+    # поэтому конец просрочки всегда считается с completed_at IS NOT NULL)
+    return Task.objects.order_by().alias(
+        overdue_from=Greatest('created_at', 'deadline'),
+        overdue_until=Greatest('created_at', 'deadline', 'completed_at'))
+
+
+def events(start, end):
+    '''
+    События в [start, end): {день: {(owner_id, category_id): Counter}}.
+    category_id None - все задачи владельца.
+    '''
+    result = defaultdict(lambda: defaultdict(Counter))
+    for fields, condition in DIMENSIONS:
+        for name, (field, parts) in EVENTS.items():
+            # условие по составляющим - чтобы работали индексы по датам
+            in_range = Q()
+            for part in parts:
+                in_range |= Q(**{f'{part}__gte': start, f'{part}__lt': end})
+            queryset = tasks().filter(
+                condition, in_range,
+                **{f'{field}__gte': start, f'{field}__lt': end})
+            if name == 'overdue_out':
+                queryset = queryset.filter(completed_at__isnull=False)
+            rows = queryset.annotate(day=TruncDate(field)).values(
+                'day', *fields).annotate(task_count=Count('pk'))
+            for row in rows:
+                key = (row['owner'], row.get('categories'))
+                result[row['day']][key][name] += row['task_count']
+    return result
+
+
+def snapshot(at):
+    '''
+    Открытые и просроченные задачи на момент at прямым подсчётом:
+    {(owner_id, category_id): Counter(open=, overdue=)}.
+    '''
+    not_completed = Q(completed_at__isnull=True) | Q(completed_at__gte=at)
+    result = {}
+    for fields, condition in DIMENSIONS:
+        rows = tasks().filter(condition, created_at__lt=at).values(
+            *fields).annotate(
+            open=Count('pk', filter=not_completed),
+            overdue=Count('pk', filter=Q(overdue_from__lt=at) & not_completed))
+        for row in rows:
+            result[(row['owner'], row.get('categories'))] = Counter(
+                open=row['open'], overdue=row['overdue'])
+    return result
+
+
+def stored_snapshot(day):
+    '''
+    Снимок на конец day из TaskRollup (в формате snapshot()).
+    '''
+    return {
+        (owner_id, category_id): Counter(open=open_count, overdue=overdue)
+        for owner_id, category_id, open_count, overdue
+        in TaskRollup.objects.filter(day=day).values_list(
+            'owner_id', 'category_id', 'open', 'overdue')}
+
+
+def daily(first, end, base=None):
+    '''
+    Строки TaskRollup (не сохранённые) по дням с first до момента end и
+    снимок на end. base - снимок на начало first.
+    '''
+    start = day_start(first)
+    state = snapshot(start) if base is None else {
+        key: Counter(values) for key, values in base.items()}
+    changes = events(start, end)
+    rows = []
+    day = first
+    while day_start(day) < end:
+        day_changes = changes.get(day, {})
+        for key, counter in day_changes.items():
+            values = state.setdefault(key, Counter())
+            values['open'] += counter['created'] - counter['completed']
+            values['overdue'] += counter['overdue_in'] - counter['overdue_out']
+        for key in set(state) | set(day_changes):
+            counter = day_changes.get(key, Counter())
+            values = state.get(key, Counter())
+            row = TaskRollup(
+                day=day, owner_id=key[0], category_id=key[1],
+                created=counter['created'], completed=counter['completed'],
+                open=values['open'], overdue=values['overdue'])
+            if any(getattr(row, metric) for metric in METRICS):
+                rows.append(row)
+        day += timedelta(days=1)
+    return rows, state
+
+
+def rolled_until():
+    '''
+    Последний день в TaskRollup или None. Дни после него считаются на
+    лету от снимка этого дня.
+    '''
+    return TaskRollup.objects.aggregate(day=Max('day'))['day']
+
+
+def rollup(first=None, now=None):
+    '''
+    Пересчитывает TaskRollup с first по вчерашний день. По умолчанию
+    начинает за ANALYTICS_ROLLUP_REFRESH_DAYS дней до последнего среза -
+    поздние правки (удаления, смена статуса) попадают в недавние дни.
+    Возвращает число записанных строк.
+    '''
+    today = timezone.localdate(now)
+    if first is None:
+        last = rolled_until()
+        if last is not None:
+            first = last - timedelta(
+                days=settings.ANALYTICS_ROLLUP_REFRESH_DAYS)
+        else:
+            earliest = Task.objects.aggregate(
+                created_at=Min('created_at'))['created_at']
+            first = timezone.localdate(earliest) if earliest else today
+    written = 0
+    base = None
+    while first < today:
+        last = min(first + timedelta(days=ROLLUP_CHUNK_DAYS), today)
+        rows, base = daily(first, day_start(last), base)
+        # параллельный пересчёт тех же дней упрётся в уникальность
+        # (день, владелец, категория) и откатится - задача повторится
+        with transaction.atomic():
+            TaskRollup.objects.filter(day__gte=first, day__lt=last).delete()
+            TaskRollup.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+        first = last
+    return written
+
+
+def parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValidationError({name: ['Expected a date in YYYY-MM-DD format']})
+
+
+def parse_id(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: ['Expected an integer id']})
+
+
+def parse_params(params, now=None):
+    today = timezone.localdate(now)
+    period = params.get('period', 'day')
+    if period not in PERIODS:
+        raise ValidationError({'period': [f'Expected one of {", ".join(PERIODS)}']})
+    end = parse_day(params['end'], 'end') if params.get('end') else today
+    start = (parse_day(params['start'], 'start') if params.get('start')
+             else end - timedelta(days=29))
+    if start > end:
+        raise ValidationError({'start': ['Must not be after end']})
+    if (end - start).days >= settings.ANALYTICS_MAX_DAYS:
+        raise ValidationError({'start': [
+            f'Range is limited to {settings.ANALYTICS_MAX_DAYS} days']})
+    owner = params.get('owner')
+    category = params.get('category')
+    return {
+        'start': start,
+        'end': end,
+        'period': period,
+        'owner': parse_id(owner, 'owner') if owner else None,
+        'category': parse_id(category, 'category') if category else None,
+    }
+
+
+def live_rows(start, end, now):
+    '''
+    (первый день, строки) для дней [start, end] после последнего среза
+    до момента now.
+    '''
+    rolled = rolled_until()
+    first = start if rolled is None else max(start, rolled + timedelta(days=1))
+    if first > end:
+        return first, []
+    base = None
+    if rolled is not None and first == rolled + timedelta(days=1):
+        base = stored_snapshot(rolled)
+    stop = min(now, day_start(end + timedelta(days=1)))
+    rows, _ = daily(first, stop, base)
+    return first, rows
+
+
+def matches(row, owner, category, per_category):
+    if owner is not None and row.owner_id != owner:
+        return False
+    if category is not None:
+        return row.category_id == category
+    return (row.category_id is not None) == per_category
+
+
+def report(start, end, period='day', owner=None, category=None, now=None):
+    now = now or timezone.now()
+    end = min(end, timezone.localdate(now))
+    live_from, live = live_rows(start, end, now)
+    stored = TaskRollup.objects.filter(
+        day__gte=start, day__lte=end, day__lt=live_from)
+    if owner is not None:
+        stored = stored.filter(owner_id=owner)
+
+    def scoped(queryset, per_category=False):
+        if category is not None:
+            return queryset.filter(category_id=category)
+        return queryset.filter(category__isnull=not per_category)
+
+    # открытые и просроченные периода - на его последний день в диапазоне
+    buckets = {}
+    last_days = {}
+    bucket = bucket_of(start, period)
+    while start <= end and bucket <= end:
+        buckets[bucket] = dict.fromkeys(METRICS, 0)
+        following = next_bucket(bucket, period)
+        last_days[min(following - timedelta(days=1), end)] = bucket
+        bucket = following
+
+    sums = scoped(stored).annotate(
+        bucket=Trunc('day', period)).values('bucket').annotate(
+        created=Sum('created'), completed=Sum('completed'))
+    for row in sums:
+        buckets[row['bucket']]['created'] += row['created']
+        buckets[row['bucket']]['completed'] += row['completed']
+    ends = scoped(stored).filter(day__in=last_days).values('day').annotate(
+        open=Sum('open'), overdue=Sum('overdue'))
+    for row in ends:
+        buckets[last_days[row['day']]]['open'] += row['open']
+        buckets[last_days[row['day']]]['overdue'] += row['overdue']
+    for row in live:
+        if row.day < start or not matches(row, owner, category, False):
+            continue
+        values = buckets[bucket_of(row.day, period)]
+        values['created'] += row.created
+        values['completed'] += row.completed
+        if row.day in last_days:
+            values['open'] += row.open
+            values['overdue'] += row.overdue
+
+    def breakdown(field, per_category):
+        totals = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+        queryset = scoped(stored, per_category)
+        for row in queryset.values(field).annotate(
+                created=Sum('created'), completed=Sum('completed')):
+            totals[row[field]]['created'] += row['created']
+            totals[row[field]]['completed'] += row['completed']
+        for row in queryset.filter(day=end).values(field).annotate(
+                open=Sum('open'), overdue=Sum('overdue')):
+            totals[row[field]]['open'] += row['open']
+            totals[row[field]]['overdue'] += row['overdue']
+        for row in live:
+            if row.day < start or not matches(row, owner, category, per_category):
+                continue
+            values = totals[getattr(row, f'{field}_id')]
+            values['created'] += row.created
+            values['completed'] += row.completed
+            if row.day == end:
+                values['open'] += row.open
+                values['overdue'] += row.overdue
+        return totals
+
+    by_owner = breakdown('owner', False)
+    names = dict(User.objects.filter(pk__in=by_owner).values_list(
+        'pk', 'username'))
+    by_category = breakdown('category', True)
+    categories = dict(Category.objects.filter(
+        pk__in=by_category).values_list('pk', 'name'))
+    return {
+        'period': period,
+        'start': start,
+        'end': end,
+        'buckets': [
+            {'bucket': bucket, **values} for bucket, values in buckets.items()],
+        'by_owner': [
+            {'owner': pk, 'username': names.get(pk), **values}
+            for pk, values in sorted(by_owner.items())],
+        'by_category': [
+            {'category': pk, 'name': categories.get(pk), **values}
+            for pk, values in sorted(by_category.items())],
+    }
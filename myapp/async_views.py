@@ -0,0 +1,119 @@
+'''
+Асинхронные (ASGI) варианты эндпоинтов чтения.
+Ответы совпадают с синхронными представлениями из myapp.views, но запрос
+не занимает поток на время ожидания БД и медленного клиента.
+Поддерживается постраничная пагинация (без курсорного режима).
+'''
+from django.core.paginator import InvalidPage, Paginator
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from . import models
+from . import serializers
+from . import statistics
+from . import views
+
+
+def json_response(data, status=200):
+    # JSONRenderer или FastJSONRenderer - первый из DEFAULT_RENDERER_CLASSES
+    renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+    return HttpResponse(
+        renderer.render(data),
+        status=status,
+        content_type='application/json')
+
+
+def not_found(detail='Not found.'):
+    return json_response({'detail': detail}, status=404)
+
+
+async def list_response(request, view_class):
+    '''
+    Фильтрация, поиск и сортировка - те же backends, что у view_class
+    (они только строят queryset); count и страница читаются async ORM.
+    '''
+    view = view_class(args=(), kwargs={}, format_kwarg=None)
+    view.request = view.initialize_request(request)
+    try:
+        queryset = view.filter_queryset(view.get_queryset())
+    except APIException as exc:
+        return json_response(exc.detail, status=exc.status_code)
+    paginator = view.pagination_class()
+    paginator.keyset = False
+    paginator.request = view.request
+    django_paginator = Paginator(queryset, paginator.get_page_size(view.request))
+    django_paginator.count = await queryset.acount()
+    try:
+        page = django_paginator.page(
+            view.request.query_params.get(paginator.page_query_param, 1))
+    except InvalidPage:
+        return not_found('Invalid page.')
+    page.object_list = [obj async for obj in page.object_list]
+    paginator.page = page
+    data = view.get_serializer(page.object_list, many=True).data
+    return json_response(paginator.get_paginated_response(data).data)
+
+
+async def detail_response(request, serializer_class, queryset, pk):
+    context = {'request': request}
+    try:
+        serializer = serializer_class(context=context)
+    except APIException as exc:
+        return json_response(exc.detail, status=exc.status_code)
+    queryset = serializers.sparse_queryset(
+        serializers.eager_queryset(queryset, serializer), serializer)
+    try:
+        obj = await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        return not_found(
+            f'No {queryset.model._meta.object_name} matches the given query.')
+    return json_response(serializer_class(obj, context=context).data)
+
+
+# http://127.0.0.1:8000/api/async/tasks/
+@require_GET
+async def task_list(request):
+    return await list_response(request, views.TaskListCreateView)
+
+
+# http://127.0.0.1:8000/api/async/tasks/1
+@require_GET
+async def task_detail(request, pk):
+    return await detail_response(
+        request, serializers.TaskSerializer, models.Task.objects.all(), pk)
+
+
+# http://127.0.0.1:8000/api/async/subtasks/
+@require_GET
+async def subtask_list(request):
+    return await list_response(request, views.SubTaskListCreateView)
+
+
+# http://127.0.0.1:8000/api/async/subtasks/1
+@require_GET
+async def subtask_detail(request, pk):
+    return await detail_response(
+        request, serializers.SubTaskSerializer, models.SubTask.objects.all(),
+        pk)
+
+
+# http://127.0.0.1:8000/api/async/tasks/statistics/
+@require_GET
+async def task_statistics(request):
+    return json_response(await statistics.aread())
+
+
+# http://127.0.0.1:8000/api/async/categories/count_tasks/
+@require_GET
+async def count_tasks(request):
+    tasks_by_category = models.Category.objects.only('name', 'task_count')
+    data = [
+        {
+            "category_id": category.id,
+            "category_name": category.name,
+            "task_count": category.task_count
+        }
+        async for category in tasks_by_category
+    ]
+    return json_response(data)
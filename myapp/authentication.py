@@ -0,0 +1,151 @@
+import copy
+import time
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from . import profiling
+from . import revocation
+from .helpers import TTLCache
+
+
+# Ключ - полная строка токена, а не только подпись: иначе токен с чужим
+# payload и скопированной подписью попал бы в кеш без проверки.
+verified_tokens = TTLCache(settings.JWT_VERIFIED_CACHE_SIZE)
+refreshed_tokens = TTLCache(settings.JWT_VERIFIED_CACHE_SIZE)
+user_snapshots = TTLCache(settings.JWT_USER_CACHE_SIZE)
+
+
+def token_ttl(token):
+    return token['exp'] - time.time()
+
+
+class RevocableAccessToken(AccessToken):
+    '''
+    AccessToken, отклоняющий отозванные токены (myapp.revocation).
+    '''
+    def verify(self):
+        super().verify()
+        if revocation.is_revoked(self['jti']):
+            raise TokenError('Token is revoked')
+
+
+class RevocableRefreshToken(RefreshToken):
+    '''
+    RefreshToken с проверкой отзыва. blacklist() вызывает
+    TokenRefreshSerializer при ROTATE_REFRESH_TOKENS и
+    BLACKLIST_AFTER_ROTATION - старый токен отзывается с отсрочкой
+    REVOCATION_ROTATION_GRACE.
+    '''
+    access_token_class = RevocableAccessToken
+
+    def verify(self):
+        super().verify()
+        if revocation.is_revoked(self['jti']):
+            raise TokenError('Token is revoked')
+
+    def blacklist(self):
+        revocation.revoke(self, grace=settings.REVOCATION_ROTATION_GRACE)
+
+    def rotate(self):
+        '''
+        Отзывает этот токен и превращает его в новый refresh-токен.
+        '''
+        self.blacklist()
+        self.set_jti()
+        self.set_exp()
+        self.set_iat()
+
+
+def verify_access_token(raw_token):
+    '''
+    Проверяет access-токен один раз на процесс до истечения его срока.
+    Бросает TokenError, как AccessToken(raw_token).
+    '''
+    if isinstance(raw_token, bytes):
+        raw_token = raw_token.decode()
+    token = verified_tokens.get(raw_token)
+    if token is None:
+        token = RevocableAccessToken(raw_token)
+        verified_tokens.set(raw_token, token, token_ttl(token))
+    elif revocation.is_revoked(token['jti']):
+        raise TokenError('Token is revoked')
+    return token
+
+
+def access_token_for_refresh(raw_token):
+    '''
+    (новый access-токен, новый refresh-токен или None) по refresh-токену.
+    При ROTATE_REFRESH_TOKENS старый refresh-токен отзывается. Пока
+    выданный access-токен действителен, повторные запросы с тем же
+    refresh-токеном получают ту же пару без повторной проверки и подписи.
+    '''
+    cached = refreshed_tokens.get(raw_token)
+    if cached is not None:
+        jti, access_token, refresh_token = cached
+        if not revocation.is_revoked(jti):
+            return access_token, refresh_token
+        refreshed_tokens.delete(raw_token)
+        raise TokenError('Token is revoked')
+    refresh_token = RevocableRefreshToken(raw_token)
+    jti = refresh_token['jti']
+    access_token = refresh_token.access_token
+    if api_settings.ROTATE_REFRESH_TOKENS:
+        refresh_token.rotate()
+    else:
+        refresh_token = None
+    refreshed_tokens.set(
+        raw_token, (jti, access_token, refresh_token),
+        token_ttl(access_token))
+    verified_tokens.set(
+        str(access_token), access_token, token_ttl(access_token))
+    return access_token, refresh_token
+
+
+def revoke_tokens(user_id, *tokens):
+    '''
+    Отзывает токены пользователя user_id сразу (выход). Принимает объекты
+    токенов и строки refresh-токенов; недействительные и чужие токены
+    пропускаются.
+    '''
+    for token in tokens:
+        if isinstance(token, str):
+            try:
+                token = RevocableRefreshToken(token)
+            except TokenError:
+                continue
+        if (token is not None
+                and str(token.get(api_settings.USER_ID_CLAIM)) == str(user_id)):
+            revocation.revoke(token)
+
+
+def forget_user(user_id):
+    user_snapshots.delete(str(user_id))
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    '''
+    JWTAuthentication без повторной проверки подписи и без запроса к
+    auth_user на каждый запрос: токены берутся из verified_tokens,
+    пользователь - из снимка с коротким TTL (JWT_USER_CACHE_TTL).
+    Снимок сбрасывается сигналами сохранения/удаления пользователя.
+    '''
+    def get_validated_token(self, raw_token):
+        with profiling.timer('jwt'):
+            try:
+                return verify_access_token(raw_token)
+            except TokenError:
+                # Текст ошибки формирует стандартная проверка
+                return super().get_validated_token(raw_token)
+
+    def get_user(self, validated_token):
+        user_id = str(validated_token.get(api_settings.USER_ID_CLAIM))
+        user = user_snapshots.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_snapshots.set(
+                user_id, copy.copy(user), settings.JWT_USER_CACHE_TTL)
+            return user
+        # Копия, чтобы изменения в запросе не попадали в общий снимок
+        return copy.copy(user)
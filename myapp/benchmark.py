@@ -0,0 +1,238 @@
+'''
+Нагрузочные замеры горячих эндпоинтов API.
+Запросы выполняются либо в процессе через django.test.Client (с подсчётом
+SQL-запросов), либо по HTTP к запущенному серверу. Результат - словарь,
+который команда manage.py benchmark сохраняет в JSON для сравнения
+между коммитами.
+'''
+import json
+import math
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+
+def endpoints(username, password):
+    '''
+    (имя, метод, путь, тело) для каждого замеряемого эндпоинта.
+    '''
+    credentials = {'username': username, 'password': password}
+    return [
+        ('tasks', 'GET', reverse('task-list-create'), None),
+        ('tasks-cursor', 'GET', reverse('task-list-create') + '?cursor=', None),
+        ('subtasks', 'GET', reverse('subtask-list-create'), None),
+        ('task-statistics', 'GET', reverse('task-statistics'), None),
+        ('count-tasks', 'GET', reverse('category-count-tasks'), None),
+        ('signin', 'POST', reverse('signin'), credentials),
+    ]
+
+
+def percentile(values, percent):
+    '''
+    Перцентиль методом ближайшего ранга.
+    '''
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(durations, errors, queries, elapsed):
+    durations_ms = [duration * 1000 for duration in durations]
+    return {
+        'requests': len(durations),
+        'errors': errors,
+        'throughput_rps': round(len(durations) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(durations_ms) / len(durations_ms), 3)
+        if durations_ms else None,
+        'p50_ms': round(percentile(durations_ms, 50), 3) if durations_ms else None,
+        'p95_ms': round(percentile(durations_ms, 95), 3) if durations_ms else None,
+        'p99_ms': round(percentile(durations_ms, 99), 3) if durations_ms else None,
+        'queries': queries,
+    }
+
+
+def run_in_process(method, path, body, requests, warmup):
+    host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+    client = Client(HTTP_HOST=host)
+
+    def call():
+        if method == 'POST':
+            return client.post(path, body, content_type='application/json')
+        return client.get(path)
+
+    for _ in range(warmup):
+        call()
+    durations = []
+    errors = 0
+    queries = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as context:
+            begin = time.perf_counter()
+            response = call()
+            durations.append(time.perf_counter() - begin)
+        queries.append(len(context))
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+    return summarize(durations, errors, max(queries, default=0), elapsed)
+
+
+def run_http(base_url, method, path, body, requests, warmup, concurrency):
+    url = base_url.rstrip('/') + path
+    data = json.dumps(body).encode() if body is not None else None
+
+    def call():
+        request = urllib.request.Request(
+            url, data=data, method=method,
+            headers={'Content-Type': 'application/json'})
+        begin = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                ok = True
+        except urllib.error.HTTPError:
+            ok = False
+        return time.perf_counter() - begin, ok
+
+    for _ in range(warmup):
+        call()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: call(), range(requests)))
+    elapsed = time.perf_counter() - started
+    durations = [duration for duration, _ in results]
+    errors = sum(1 for _, ok in results if not ok)
+    # число SQL-запросов по HTTP не видно
+    return summarize(durations, errors, None, elapsed)
+
+
+def signin_storm(username, password, requests=100, concurrency=8,
+                 base_url=None):
+    '''
+    Шторм логинов: requests входов в concurrency потоков и одновременно
+    последовательные запросы к task-statistics - показывает пропускную
+    способность signin, долю ответов 503 (пул хеширования занят, см.
+    myapp.hashing) и задержку остального API во время шторма.
+    '''
+    body = {'username': username, 'password': password}
+    signin_path = reverse('signin')
+    probe_path = reverse('task-statistics')
+    host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+    local = threading.local()
+
+    def call(method, path, data=None):
+        begin = time.perf_counter()
+        if base_url:
+            request = urllib.request.Request(
+                base_url.rstrip('/') + path, method=method,
+                data=json.dumps(data).encode() if data else None,
+                headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    code = response.status
+            except urllib.error.HTTPError as error:
+                code = error.code
+        else:
+            if not hasattr(local, 'client'):
+                local.client = Client(HTTP_HOST=host)
+            if method == 'POST':
+                code = local.client.post(
+                    path, data, content_type='application/json').status_code
+            else:
+                code = local.client.get(path).status_code
+        return time.perf_counter() - begin, code
+
+    done = threading.Event()
+    probes = []
+
+    def probe():
+        while not done.is_set():
+            probes.append(call('GET', probe_path))
+
+    prober = threading.Thread(target=probe)
+    started = time.perf_counter()
+    prober.start()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(
+                lambda _: call('POST', signin_path, body), range(requests)))
+    finally:
+        done.set()
+        prober.join()
+    elapsed = time.perf_counter() - started
+    accepted = [duration for duration, code in results if code < 400]
+    return {
+        'concurrency': concurrency,
+        'signin': {
+            **summarize(accepted, sum(
+                1 for _, code in results if code >= 400 and code != 503),
+                None, elapsed),
+            'rejected_503': sum(1 for _, code in results if code == 503),
+        },
+        'probe': summarize(
+            [duration for duration, _ in probes],
+            sum(1 for _, code in probes if code >= 400), None, elapsed),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(username, password, requests=100, warmup=5, base_url=None,
+        concurrency=1, only=None):
+    results = {}
+    for name, method, path, body in endpoints(username, password):
+        if only and name not in only:
+            continue
+        if base_url:
+            results[name] = run_http(
+                base_url, method, path, body, requests, warmup, concurrency)
+        else:
+            results[name] = run_in_process(
+                method, path, body, requests, warmup)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'mode': 'http' if base_url else 'in-process',
+            'base_url': base_url,
+            'requests': requests,
+            'concurrency': concurrency if base_url else 1,
+            'database': connection.vendor,
+        },
+        'endpoints': results,
+    }
+
+
+def compare(previous, current, metric='p50_ms'):
+    '''
+    Отношение метрики текущего прогона к предыдущему по эндпоинтам
+    (больше 1 - медленнее).
+    '''
+    changes = {}
+    for name, stats in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(name, {}).get(metric)
+        after = stats.get(metric)
+        if before and after is not None:
+            changes[name] = round(after / before, 3)
+    return changes
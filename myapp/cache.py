@@ -0,0 +1,258 @@
+import functools
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.response import Response
+from . import export
+
+
+def version_key(scope):
+    return f'version:{scope}'
+
+
+def get_versions(scopes):
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Версия вытеснена из кеша - начинаем с новой метки времени,
+            # чтобы не совпасть со старыми ключами.
+            cache.set(key, time.time_ns(), None)
+
+
+def invalidate(*scopes):
+    '''
+    Меняет версии областей кеша. Повторяется после коммита, чтобы
+    конкурентный запрос не закешировал данные незакоммиченной транзакции.
+    '''
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def response_key(request, view_name, versions, per_user):
+    query = sorted(request.query_params.lists())
+    digest = hashlib.sha1(
+        f'{request.path}?{query}'.encode()).hexdigest()
+    user = request.user.pk if per_user else '-'
+    version = '.'.join(str(value) for value in versions)
+    # ETag в записи зависит от формата ответа (make_etag)
+    renderer = getattr(request, 'accepted_renderer', None)
+    format = getattr(renderer, 'format', None) or '-'
+    return f'response:{view_name}:{version}:{user}:{format}:{digest}'
+
+
+def cached_response(*scopes, per_user=False, timeout=None):
+    '''
+    Кеширует ответ GET-обработчика DRF (list/retrieve/action).
+    scopes - области инвалидации, могут содержать параметры URL:
+    @cached_response('task:{pk}')
+    Ключ учитывает путь, query-параметры, формат ответа и, при per_user,
+    пользователя.
+    Вместе с данными хранится ETag (от @conditional или хеш данных), так
+    что условный GET при попадании в кеш отвечает 304 без запросов к БД.
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method != 'GET':
+                return method(self, request, *args, **kwargs)
+            versions = get_versions(
+                [scope.format(**kwargs) for scope in scopes])
+            key = response_key(
+                request, f'{type(self).__name__}.{method.__name__}',
+                versions, per_user)
+            cached = cache.get(key)
+            if cached is not None:
+                data, status, etag, last_modified = cached
+                return not_modified(request, etag, last_modified) or (
+                    with_validators(
+                        Response(data, status=status), etag, last_modified))
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                if not response.has_header('ETag'):
+                    set_validators(
+                        response, make_etag(request, response.data), None)
+                cache.set(
+                    key, (response.data, response.status_code,
+                          response['ETag'], response.get('Last-Modified')),
+                    timeout or settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+# Условные запросы (ETag, Last-Modified)
+
+
+SAFE_METHODS = ('GET', 'HEAD')
+CONDITIONAL_HEADERS = (
+    'HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH',
+    'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE')
+
+
+def make_etag(request, *parts):
+    # JSON и browsable API - разные представления
+    renderer = getattr(request, 'accepted_renderer', None)
+    digest = hashlib.sha1(
+        repr((getattr(renderer, 'format', None), *parts)).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def object_etag(request, model, pk, updated_at):
+    # updated_at - строка в формате ответа API
+    return make_etag(request, model._meta.label, pk, updated_at)
+
+
+def object_validators(view, request, pk, **kwargs):
+    '''
+    ETag и Last-Modified объекта по updated_at (один запрос по pk).
+    '''
+    queryset = view.queryset.filter(pk=pk)
+    if request.method not in SAFE_METHODS:
+        queryset = queryset.select_for_update()
+    updated_at = queryset.values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    etag = object_etag(
+        request, view.queryset.model, int(pk),
+        export.encode_value(updated_at))
+    return etag, updated_at
+
+
+def object_response_validators(view, request, data):
+    '''
+    Те же валидаторы по уже сериализованному объекту - без запроса,
+    если updated_at не исключён из ответа (?fields=, ?exclude=).
+    '''
+    if 'updated_at' not in data:
+        return object_validators(view, request, pk=data['id'])
+    etag = object_etag(
+        request, view.queryset.model, data['id'], data['updated_at'])
+    return etag, parse_datetime(data['updated_at'])
+
+
+def list_etag(request, model, data):
+    # страница: конверт пагинации и (id, updated_at) строк
+    if isinstance(data, dict):
+        envelope = {key: value for key, value in data.items()
+                    if key != 'results'}
+        rows = data['results']
+    else:
+        envelope, rows = None, data
+    return make_etag(
+        request, model._meta.label, envelope,
+        [(row['id'], row['updated_at']) for row in rows])
+
+
+def list_validators(view, request, **kwargs):
+    '''
+    ETag страницы списка: та же страница, но только id, updated_at
+    и created_at (курсор), без предзагрузки связей и сериализации.
+    Last-Modified не отдаётся: удаление строки его не меняет.
+    '''
+    queryset = view.filter_queryset(view.get_queryset()).prefetch_related(
+        None).select_related(None).only('updated_at', 'created_at')
+    paginator = None
+    if view.pagination_class is not None:
+        paginator = view.pagination_class()
+        queryset = paginator.paginate_queryset(queryset, request, view=view)
+    data = [
+        {'id': obj.pk, 'updated_at': export.encode_value(obj.updated_at)}
+        for obj in queryset]
+    if paginator is not None:
+        data = paginator.get_paginated_response(data).data
+    return list_etag(request, view.queryset.model, data), None
+
+
+def list_response_validators(view, request, data):
+    rows = data['results'] if isinstance(data, dict) else data
+    if rows and 'updated_at' not in rows[0]:
+        return list_validators(view, request)
+    return list_etag(request, view.queryset.model, data), None
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+
+
+def with_validators(response, etag, last_modified_header):
+    response['ETag'] = etag
+    if last_modified_header:
+        response['Last-Modified'] = last_modified_header
+    return response
+
+
+def not_modified(request, etag, last_modified_header):
+    '''
+    304 по сохранённым в кеше ETag и Last-Modified или None.
+    '''
+    if request.method not in SAFE_METHODS:
+        return None
+    response = get_conditional_response(
+        request, etag=etag,
+        last_modified=last_modified_header
+        and parse_http_date_safe(last_modified_header))
+    if response is None:
+        return None
+    return with_validators(response, etag, last_modified_header)
+
+
+def conditional(validators, response_validators):
+    '''
+    Условные запросы к обработчику DRF.
+    validators(view, request, **kwargs) без сериализации возвращает
+    (etag, last_modified) текущего состояния или None, если объекта нет
+    (тогда обработчик сам ответит 404); вызывается только при условных
+    заголовках. response_validators(view, request, data) строит те же
+    значения по данным ответа 200.
+    GET/HEAD: If-None-Match/If-Modified-Since - 304 без сериализации.
+    PUT/PATCH: If-Match/If-Unmodified-Since - 412, если объект изменился;
+    проверка и запись идут в одной транзакции.
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method in SAFE_METHODS:
+                return respond(self, request, *args, **kwargs)
+            with transaction.atomic():
+                return respond(self, request, *args, **kwargs)
+
+        def respond(self, request, *args, **kwargs):
+            if any(header in request.META for header in CONDITIONAL_HEADERS):
+                current = validators(self, request, **kwargs)
+                if current is not None:
+                    etag, last_modified = current
+                    response = get_conditional_response(
+                        request, etag=etag,
+                        last_modified=last_modified
+                        and int(last_modified.timestamp()))
+                    if response is not None:
+                        if response.status_code == 304:
+                            set_validators(response, etag, last_modified)
+                        return response
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                set_validators(
+                    response,
+                    *response_validators(self, request, response.data))
+            return response
+        return wrapper
+    return decorator
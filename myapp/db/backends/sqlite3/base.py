@@ -0,0 +1,8 @@
+from django.db.backends.sqlite3 import base
+from myapp.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    '''
+    Для проверки пула без MySQL.
+    '''
@@ -0,0 +1,194 @@
+'''
+Пул соединений с БД для бэкендов myapp.db.backends.*.
+Django открывает соединение на запрос (CONN_MAX_AGE=0) и закрывает его
+по request_finished - и под WSGI, и под ASGI. Пул подменяет открытие и
+закрытие: соединение берётся из пула и возвращается в него.
+Настройки - ключ POOL в DATABASES[alias]:
+SIZE (постоянных соединений), MAX_OVERFLOW (сверх SIZE, закрываются при
+возврате), RECYCLE (секунд жизни соединения), TIMEOUT (ожидание свободного
+соединения), PRE_PING (проверка соединения перед выдачей).
+'''
+import os
+import queue
+import threading
+import time
+from django.core.exceptions import ImproperlyConfigured
+
+
+DEFAULTS = {
+    'SIZE': 5,
+    'MAX_OVERFLOW': 10,
+    'RECYCLE': 3600,
+    'TIMEOUT': 30,
+    'PRE_PING': True,
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, size, max_overflow, recycle, timeout,
+                 ping=None):
+        self.connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.recycle = recycle
+        self.timeout = timeout
+        self.ping = ping
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = {}
+        self.opened = 0
+
+    def _open(self):
+        with self._lock:
+            if self.opened >= self.size + self.max_overflow:
+                return None
+            self.opened += 1
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._lock:
+                self.opened -= 1
+            raise
+        self._created[id(connection)] = time.monotonic()
+        return connection
+
+    def _discard(self, connection):
+        self._created.pop(id(connection), None)
+        with self._lock:
+            self.opened -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _usable(self, connection):
+        created = self._created.get(id(connection), 0)
+        if self.recycle is not None and (
+                time.monotonic() - created > self.recycle):
+            return False
+        if self.ping is not None:
+            try:
+                self.ping(connection)
+            except Exception:
+                return False
+        return True
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._open()
+                if connection is not None:
+                    return connection
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f'No free connection in the pool after '
+                        f'{self.timeout}s (size {self.size}, '
+                        f'overflow {self.max_overflow})')
+                try:
+                    connection = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+            if self._usable(connection):
+                return connection
+            self._discard(connection)
+
+    def checkin(self, connection):
+        try:
+            # незавершённая транзакция не должна попасть следующему запросу
+            connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+        if self._idle.qsize() >= self.size:
+            self._discard(connection)
+        else:
+            self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def get_pool(alias, connect, options, ping):
+    global _pid
+    with _pools_lock:
+        if _pid != os.getpid():
+            # после fork соединения родителя не используются
+            _pools.clear()
+            _pid = os.getpid()
+        pool = _pools.get(alias)
+        if pool is None:
+            unknown = set(options) - set(DEFAULTS)
+            if unknown:
+                raise ImproperlyConfigured(
+                    f'Unknown POOL options for {alias}: {sorted(unknown)}')
+            options = {**DEFAULTS, **options}
+            pool = _pools[alias] = ConnectionPool(
+                connect,
+                size=options['SIZE'],
+                max_overflow=options['MAX_OVERFLOW'],
+                recycle=options['RECYCLE'],
+                timeout=options['TIMEOUT'],
+                ping=ping if options['PRE_PING'] else None)
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+class PooledDatabaseWrapperMixin:
+    '''
+    Подмешивается к DatabaseWrapper бэкенда Django.
+    '''
+    def get_pool(self, conn_params):
+        return get_pool(
+            self.alias,
+            lambda: super(PooledDatabaseWrapperMixin, self)
+            .get_new_connection(conn_params),
+            self.settings_dict.get('POOL') or {},
+            self.ping_connection)
+
+    def ping_connection(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def get_new_connection(self, conn_params):
+        # пул, выдавший соединение: close_pools() мог убрать его из _pools
+        self.connection_pool = self.get_pool(conn_params)
+        return self.connection_pool.checkout()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = getattr(self, 'connection_pool', None) or _pools.get(self.alias)
+        if pool is None:
+            with self.wrap_database_errors:
+                return self.connection.close()
+        if self.in_atomic_block:
+            # Django оставит ссылку на соединение - в пул его не отдаём,
+            # но место в пуле освобождаем
+            return pool._discard(self.connection)
+        pool.checkin(self.connection)
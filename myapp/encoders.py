@@ -0,0 +1,194 @@
+'''
+Быстрая сериализация списков только для чтения (FAST_LIST_SERIALIZATION).
+Вместо экземпляров моделей и обхода полей ModelSerializer строки
+читаются через values(), а в словари ответа их превращает кодировщик,
+собранный один раз на класс сериализатора: порядок ключей, выбор,
+даты и связи - как у сериализатора. Поля, которые так не выразить
+(SerializerMethodField, source с точкой и т.п.), отключают быстрый путь.
+'''
+from django.conf import settings
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+
+class UnsupportedField(Exception):
+    pass
+
+
+# Поля, у которых to_representation не меняет значение из БД
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField, serializers.CharField,
+    serializers.BooleanField, serializers.ReadOnlyField)
+
+
+def utc_isoformat(value):
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def datetime_converter(field):
+    # При USE_TZ и TIME_ZONE = 'UTC' значения из БД уже в нужной зоне,
+    # и enforce_timezone() можно пропустить
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if (output_format is not None and output_format.lower() == ISO_8601
+            and settings.USE_TZ and settings.TIME_ZONE == 'UTC'
+            and getattr(field, 'timezone', None) is None):
+        return utc_isoformat
+    return field.to_representation
+
+
+def choice_converter(field):
+    representations = {
+        choice: field.to_representation(choice) for choice in field.choices}
+    return lambda value: representations.get(value, value)
+
+
+def related_ordering(model, prefix):
+    return [
+        f'-{prefix}__{name[1:]}' if name.startswith('-')
+        else f'{prefix}__{name}'
+        for name in model._meta.ordering]
+
+
+class RowEncoder:
+    '''
+    Кодировщик строк values() модели serializer.Meta.model.
+    columns - имена колонок для values(); encode(rows) возвращает
+    список словарей в формате serializer(many=True).data.
+    '''
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        opts = self.model._meta
+        self.columns = [opts.pk.attname]
+        # (ключ, колонка, преобразование или None)
+        self.scalars = []
+        # (ключ, through, колонка объекта, колонка связи, сортировка)
+        self.many_to_many = []
+        # (ключ, кодировщик, колонка FK на объект)
+        self.nested = []
+        self.keys = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            self.keys.append(name)
+            source = field.source
+            if source == '*' or '.' in source or isinstance(
+                    field, serializers.SerializerMethodField):
+                raise UnsupportedField(name)
+            if isinstance(field, serializers.ListSerializer):
+                self.nested.append(self.compile_nested(name, field))
+            elif isinstance(field, serializers.ManyRelatedField):
+                self.many_to_many.append(
+                    self.compile_many_to_many(name, field))
+            else:
+                self.scalars.append(self.compile_scalar(name, field))
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+
+    def compile_scalar(self, name, field):
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            model_field = self.model._meta.get_field(field.source)
+            if not model_field.many_to_one and not model_field.one_to_one:
+                raise UnsupportedField(name)
+            converter = None
+        elif isinstance(field, (serializers.RelatedField,
+                                serializers.BaseSerializer)):
+            raise UnsupportedField(name)
+        else:
+            model_field = self.model._meta.get_field(field.source)
+            if isinstance(field, serializers.ChoiceField):
+                converter = choice_converter(field)
+            elif isinstance(field, serializers.DateTimeField):
+                converter = datetime_converter(field)
+            elif isinstance(field, PASSTHROUGH_FIELDS):
+                converter = None
+            else:
+                converter = field.to_representation
+        self.add_column(model_field.attname)
+        return name, model_field.attname, converter
+
+    def compile_many_to_many(self, name, field):
+        if not isinstance(field.child_relation,
+                          serializers.PrimaryKeyRelatedField):
+            raise UnsupportedField(name)
+        model_field = self.model._meta.get_field(field.source)
+        if not model_field.many_to_many:
+            raise UnsupportedField(name)
+        through = model_field.remote_field.through
+        source = model_field.m2m_field_name()
+        target = model_field.m2m_reverse_field_name()
+        # как prefetch_related: в порядке Meta.ordering связанной модели
+        ordering = related_ordering(model_field.related_model, target)
+        return (name, through, through._meta.get_field(source).attname,
+                through._meta.get_field(target).attname, ordering)
+
+    def compile_nested(self, name, field):
+        child_model = field.child.Meta.model
+        for model_field in child_model._meta.concrete_fields:
+            if (model_field.many_to_one
+                    and model_field.related_model is self.model
+                    and model_field.remote_field.get_accessor_name()
+                    == field.source):
+                break
+        else:
+            raise UnsupportedField(name)
+        encoder = get_encoder(field.child)
+        if encoder is None:
+            raise UnsupportedField(name)
+        return name, encoder, model_field.attname
+
+    def encode(self, rows):
+        pks = [row[self.columns[0]] for row in rows]
+        related = {}
+        for name, through, source, target, ordering in self.many_to_many:
+            values = {pk: [] for pk in pks}
+            links = through.objects.filter(**{f'{source}__in': pks})
+            for pk, related_pk in links.order_by(*ordering).values_list(
+                    source, target):
+                values[pk].append(related_pk)
+            related[name] = values
+        for name, encoder, column in self.nested:
+            values = {pk: [] for pk in pks}
+            queryset = encoder.model._default_manager.filter(
+                **{f'{column}__in': pks})
+            children = list(queryset.values(*encoder.columns, column))
+            for child, data in zip(children, encoder.encode(children)):
+                values[child[column]].append(data)
+            related[name] = values
+
+        scalars = self.scalars
+        keys = self.keys
+        result = []
+        for pk, row in zip(pks, rows):
+            data = {}
+            for name, column, converter in scalars:
+                value = row[column]
+                if value is not None and converter is not None:
+                    value = converter(value)
+                data[name] = value
+            for name, values in related.items():
+                data[name] = values[pk]
+            # порядок ключей - как в сериализаторе
+            result.append({key: data[key] for key in keys})
+        return result
+
+
+_encoders = {}
+
+
+def get_encoder(serializer):
+    '''
+    Кодировщик для класса сериализатора и набора его полей или None,
+    если быстрый путь для него невозможен. Собирается один раз.
+    '''
+    key = (type(serializer), tuple(serializer.fields))
+    if key not in _encoders:
+        try:
+            _encoders[key] = RowEncoder(serializer)
+        except UnsupportedField:
+            _encoders[key] = None
+    return _encoders[key]
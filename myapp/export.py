@@ -0,0 +1,143 @@
+import csv
+import datetime
+import json
+from functools import reduce
+from itertools import islice
+from operator import and_, or_
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework import serializers
+
+
+datetime_field = serializers.DateTimeField()
+
+
+class Echo:
+    '''
+    Псевдобуфер для csv.writer: возвращает строку вместо записи.
+    https://docs.djangoproject.com/en/5.1/howto/outputting-csv/#streaming-large-csv-files
+    '''
+    def write(self, value):
+        return value
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def encode_value(value):
+    # Даты в том же формате, что и в ответах API
+    if isinstance(value, datetime.datetime):
+        return datetime_field.to_representation(value)
+    return value
+
+
+def keyset_ordering(queryset):
+    '''
+    Сортировка queryset по полям модели с pk в конце, например
+    ['-created_at', 'pk'], или None, если сортировать так нельзя:
+    по выражению (релевантность поиска), связанному или nullable-полю.
+    '''
+    query = queryset.query
+    opts = queryset.model._meta
+    ordering = list(query.order_by or (
+        opts.ordering if query.default_ordering else ()))
+    result = []
+    for item in ordering:
+        if not isinstance(item, str):
+            return None
+        name = item.lstrip('-')
+        if name == 'pk' or name == opts.pk.name:
+            return result + [item[:-len(name)] + 'pk']
+        if name not in query.extra_select and '__' not in name:
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.concrete and not field.null and not field.is_relation:
+                result.append(item)
+                continue
+        return None
+    return result + ['pk']
+
+
+def after(ordering, row):
+    '''
+    Условие "строка после row" для сортировки keyset_ordering():
+    (a > x) OR (a = x AND b > y) ... с учётом направления полей.
+    '''
+    conditions = []
+    for index, item in enumerate(ordering):
+        name = item.lstrip('-')
+        lookup = 'lt' if item.startswith('-') else 'gt'
+        equal = [Q(**{other.lstrip('-'): row[other.lstrip('-')]})
+                 for other in ordering[:index]]
+        conditions.append(reduce(
+            and_, equal, Q(**{f'{name}__{lookup}': row[name]})))
+    return reduce(or_, conditions)
+
+
+def iter_chunks(queryset, names, chunk_size):
+    '''
+    Порции строк values('pk', *names). При сортировке по полям модели -
+    постранично по ключу (WHERE после последней строки, LIMIT chunk_size):
+    mysqlclient не умеет серверные курсоры, и iterator() на MySQL держал
+    бы в памяти весь результат. Иначе (сортировка по релевантности
+    поиска) - iterator(), с этим ограничением на MySQL.
+    '''
+    ordering = keyset_ordering(queryset)
+    if ordering is None:
+        rows = queryset.values('pk', *names).iterator(chunk_size=chunk_size)
+        yield from chunked(rows, chunk_size)
+        return
+    queryset = queryset.order_by(*ordering)
+    keys = [item.lstrip('-') for item in ordering if item.lstrip('-') != 'pk']
+    values = ['pk', *names, *(key for key in keys if key not in names)]
+    page = queryset
+    while chunk := list(page.values(*values)[:chunk_size]):
+        yield chunk
+        if len(chunk) < chunk_size:
+            break
+        page = queryset.filter(after(ordering, chunk[-1]))
+
+
+def iter_rows(queryset, fields, many_to_many=(), chunk_size=2000):
+    '''
+    Строки queryset в виде словарей через values(), порциями по
+    chunk_size (iter_chunks): в памяти одновременно находится одна
+    порция. Значения M2M-полей догружаются одним запросом на порцию.
+    '''
+    for chunk in iter_chunks(queryset, fields, chunk_size):
+        related = {}
+        for field in many_to_many:
+            through = field.remote_field.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            values = {row['pk']: [] for row in chunk}
+            for source_id, target_id in through.objects.filter(**{
+                    f'{source}__in': list(values)
+            }).values_list(source, target).order_by(source, target):
+                values[source_id].append(target_id)
+            related[field.name] = values
+        for row in chunk:
+            pk = row['pk']
+            item = {name: encode_value(row[name]) for name in fields}
+            for name, values in related.items():
+                item[name] = values[pk]
+            yield item
+
+
+def ndjson_stream(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_stream(rows, header):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([
+            ' '.join(map(str, value)) if isinstance(value, list) else value
+            for value in (row[name] for name in header)])
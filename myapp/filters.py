@@ -0,0 +1,88 @@
+import re
+
+from django.db import connections
+from rest_framework.filters import SearchFilter
+
+
+class FullTextSearchFilter(SearchFilter):
+    '''
+    Замена SearchFilter, использующая полнотекстовый индекс
+    (миграция 0004_fulltext_search): FTS5 на SQLite, FULLTEXT на MySQL.
+    Результаты сортируются по релевантности, если не задан ordering.
+    Каждое слово запроса ищется как префикс слова в тексте, все слова
+    обязательны: ?search=tas находит "task", ?search=ask - нет.
+    Слова короче min_term_length (MySQL их не индексирует) и слова без
+    букв и цифр (индекс их не хранит: "...", "a-b"), другие СУБД и другие
+    search_fields - как SearchFilter, подстрокой (icontains). Непустой
+    запрос без слов (только кавычки или запятые) ничего не находит.
+    http://127.0.0.1:8000/api/tasks/?search=task_name
+    '''
+    indexed_fields = ['title', 'description']
+    rank_field = 'search_rank'
+    # innodb_ft_min_token_size по умолчанию
+    min_term_length = 3
+
+    def get_index_name(self, queryset):
+        table = queryset.model._meta.db_table.strip('"')
+        return f'{table}_fts'
+
+    def indexed(self, term):
+        '''
+        Можно ли искать слово по индексу: все его токены (буквы и цифры)
+        не короче min_term_length.
+        '''
+        tokens = re.findall(r'\w+', term)
+        return bool(tokens) and all(
+            len(token) >= self.min_term_length for token in tokens)
+
+    def filter_queryset(self, request, queryset, view):
+        terms = [term for term in self.get_search_terms(request) if term]
+        if not terms:
+            if request.query_params.get(self.search_param, '').strip():
+                return queryset.none()
+            return queryset
+        vendor = connections[queryset.db].vendor
+        if (vendor not in ('sqlite', 'mysql')
+                or not all(map(self.indexed, terms))
+                or list(self.get_search_fields(view, request) or ())
+                != self.indexed_fields):
+            return super().filter_queryset(request, queryset, view)
+        if vendor == 'sqlite':
+            queryset = self.sqlite_search(queryset, terms)
+        else:
+            queryset = self.mysql_search(queryset, terms)
+        if not request.query_params.get('ordering'):
+            queryset = queryset.order_by(self.rank_field, '-pk')
+        return queryset
+
+    def sqlite_search(self, queryset, terms):
+        connection = connections[queryset.db]
+        table = connection.ops.quote_name(
+            queryset.model._meta.db_table.strip('"'))
+        index = self.get_index_name(queryset)
+        # Каждое слово - строка FTS5 с префиксным поиском: "слово"*
+        query = ' '.join(
+            '"%s"*' % term.replace('"', '""') for term in terms)
+        return queryset.extra(
+            tables=[index],
+            where=[f'{index}.rowid = {table}.id', f'{index} MATCH %s'],
+            params=[query],
+            # bm25 тем меньше, чем релевантнее строка
+            select={self.rank_field: f'bm25({index})'})
+
+    def mysql_search(self, queryset, terms):
+        connection = connections[queryset.db]
+        table = connection.ops.quote_name(
+            queryset.model._meta.db_table.strip('"'))
+        columns = ', '.join(f'{table}.{column}' for column in self.indexed_fields)
+        special = '+-<>()~*"@'
+        words = [
+            ''.join(c for c in term if c not in special) for term in terms]
+        query = ' '.join('+%s*' % word for word in words if word)
+        if not query:
+            return queryset
+        match = f'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)'
+        return queryset.extra(
+            where=[match], params=[query],
+            select={self.rank_field: f'-{match}'},
+            select_params=[query])
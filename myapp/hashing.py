@@ -0,0 +1,129 @@
+'''
+Хеширование паролей в отдельном ограниченном пуле потоков.
+PBKDF2 занимает процессор на сотни миллисекунд; при шторме логинов
+(например, после деплоя) все воркеры считали бы хеши, и остальной API
+ждал бы их. Пул выполняет не больше PASSWORD_HASH_WORKERS хешей
+одновременно, ещё PASSWORD_HASH_QUEUE ждут в очереди, остальные запросы
+сразу получают 503 с Retry-After.
+
+В пул уходит только вычисление хеша - запросы к БД остаются в потоке
+запроса (соединения и транзакции Django привязаны к потоку).
+'''
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth import hashers
+from django.contrib.auth.backends import ModelBackend
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from . import profiling
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many sign-ins at once, try again later'
+    default_code = 'hashing_busy'
+    # DRF выставляет по нему заголовок Retry-After
+    wait = 1
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    '''
+    PBKDF2 с числом итераций из PASSWORD_HASH_ITERATIONS. Хеши с другим
+    числом итераций пересчитываются при следующем входе
+    (OffloadedModelBackend).
+    '''
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
+
+
+_lock = threading.Lock()
+_pool = None
+
+
+def get_pool():
+    '''
+    (пул, семафор мест) - создаются при первом входе в процессе.
+    '''
+    global _pool
+    with _lock:
+        if _pool is None:
+            workers = settings.PASSWORD_HASH_WORKERS
+            _pool = (
+                ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix='password-hash'),
+                threading.BoundedSemaphore(
+                    workers + settings.PASSWORD_HASH_QUEUE))
+    return _pool
+
+
+def run(function, *args):
+    '''
+    Выполняет function в пуле и ждёт результат не дольше
+    PASSWORD_HASH_TIMEOUT. Бросает HashingBusy, если пул и очередь заняты.
+    '''
+    executor, slots = get_pool()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor.submit(function, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # место освобождается, когда хеш посчитан, даже если ждать перестали
+    future.add_done_callback(lambda _: slots.release())
+    with profiling.timer('password_hash'):
+        try:
+            return future.result(timeout=settings.PASSWORD_HASH_TIMEOUT)
+        except FutureTimeoutError:
+            raise HashingBusy()
+
+
+def make_password(password):
+    return run(hashers.make_password, password)
+
+
+def check_password(user, password):
+    '''
+    Как user.check_password(), но хеш считается в пуле. Устаревший хеш
+    (другой алгоритм или число итераций) пересчитывается и сохраняется.
+    '''
+    encoded = user.password
+    if not run(hashers.check_password, password, encoded):
+        return False
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return True
+    if (hasher.algorithm != preferred.algorithm
+            or preferred.must_update(encoded)):
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return True
+
+
+class OffloadedModelBackend(ModelBackend):
+    '''
+    ModelBackend с проверкой пароля через пул (check_password).
+    Используется authenticate() в SigninView и входом в админку;
+    HashingBusy вне DRF превращает в 503 HashingBusyMiddleware.
+    '''
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # то же время ответа, что и для существующего пользователя
+            make_password(password)
+            return None
+        if check_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
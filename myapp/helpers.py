@@ -1,4 +1,7 @@
 import calendar
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from django.utils import timezone
 
@@ -8,3 +11,46 @@ def end_of_month():
     end_of_month = calendar.monthrange(today.year, today.month)[1]
     end_of_month_date = datetime(today.year, today.month, end_of_month)
     return end_of_month_date.astimezone()
+
+
+class TTLCache:
+    '''
+    Потокобезопасный LRU-кеш процесса с индивидуальным временем жизни
+    записей. Используется для проверенных JWT и снимков пользователей.
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
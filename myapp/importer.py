@@ -0,0 +1,199 @@
+'''
+Пакетный импорт задач и подзадач из CSV/NDJSON (manage.py import_tasks).
+Файл читается потоком, строки проверяются TaskSerializer/SubTaskSerializer
+пакетами по batch_size и записываются через bulk_create
+(BulkListSerializer). Прогресс - номер последней обработанной строки -
+хранится в задаче очереди (Job.progress) и сохраняется в одной
+транзакции с пакетом, поэтому повторный запуск продолжает ровно
+с первой незаписанной строки.
+
+Колонки/ключи - поля сериализатора (title, description, status, deadline,
+task у подзадач); categories - имена категорий, в CSV через "|".
+'''
+import csv
+import json
+from itertools import islice
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from . import serializers
+from . import signals
+from .models import Category, Job, SubTask, Task
+
+
+MODELS = {
+    'task': (Task, serializers.TaskSerializer),
+    'subtask': (SubTask, serializers.SubTaskSerializer),
+}
+
+CATEGORY_SEPARATOR = '|'
+
+
+def detect_format(path):
+    return 'ndjson' if str(path).endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        for row in csv.DictReader(file):
+            # пустая ячейка - значение по умолчанию, а не пустая строка
+            row = {key: value for key, value in row.items()
+                   if key is not None and value not in ('', None)}
+            if 'categories' in row:
+                row['categories'] = [
+                    name.strip()
+                    for name in row['categories'].split(CATEGORY_SEPARATOR)
+                    if name.strip()]
+            yield row
+
+
+def read_ndjson(path):
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def read_rows(path, format=None):
+    return READERS[format or detect_format(path)](path)
+
+
+class CategoryMap:
+    '''
+    Имя категории -> id без запроса на каждую строку. Ключ - имя в нижнем
+    регистре, как в ограничении unique_lower_name.
+    '''
+    def __init__(self, create=False):
+        self.create = create
+        self.ids = {
+            name.lower(): pk
+            for pk, name in Category.objects.values_list('pk', 'name')}
+
+    def resolve(self, rows):
+        '''
+        Заменяет имена категорий на id. Возвращает {номер строки: ошибка}
+        для строк с неизвестными категориями.
+        '''
+        names = {}
+        for row in rows:
+            for name in row.get('categories') or ():
+                if isinstance(name, str) and name.lower() not in self.ids:
+                    names.setdefault(name.lower(), name)
+        if names and self.create:
+            Category.objects.bulk_create(
+                [Category(name=name) for name in names.values()],
+                ignore_conflicts=True)
+            self.ids.update(
+                (name.lower(), pk) for pk, name in Category.objects.filter(
+                    name__in=names.values()).values_list('pk', 'name'))
+        errors = {}
+        for index, row in enumerate(rows):
+            if 'categories' not in row:
+                continue
+            values = row['categories']
+            if not isinstance(values, list) or not all(
+                    isinstance(name, str) for name in values):
+                errors[index] = {'categories': ['Expected a list of names']}
+                continue
+            unknown = [name for name in values
+                       if name.lower() not in self.ids]
+            if unknown:
+                errors[index] = {'categories': [
+                    f'Unknown category: {name}' for name in unknown]}
+                continue
+            row['categories'] = [self.ids[name.lower()] for name in values]
+        return errors
+
+
+def duplicate_titles(model, rows, errors, exclude=()):
+    '''
+    Заголовки уникальны без учёта регистра - дубликаты внутри пакета и уже
+    записанные отклоняются до bulk_create, чтобы не уронить весь пакет.
+    exclude - id объектов, которые пакет переименовывает (bulk_update).
+    '''
+    titles = {
+        index: row['title'].lower() for index, row in enumerate(rows)
+        if index not in errors and isinstance(row.get('title'), str)}
+    existing = set(model.objects.annotate(lower_title=Lower('title')).filter(
+        lower_title__in=set(titles.values())).exclude(
+        pk__in=exclude).values_list('lower_title', flat=True))
+    for index, title in titles.items():
+        if title in existing:
+            errors[index] = {'title': [
+                f'{model._meta.verbose_name} with this title already exists']}
+        existing.add(title)
+
+
+def save_batch(model, serializer, owner):
+    instances = serializer.save(owner=owner)
+    # bulk_create не отправляет сигналы
+    if not serializer.signals_sent:
+        if model is Task:
+            signals.tasks_saved(instances, created=True)
+        else:
+            signals.subtasks_saved(instances)
+    return instances
+
+
+def import_rows(job, path, model, owner, format=None, batch_size=1000,
+                create_categories=False, rejects=None):
+    '''
+    Обработчик задачи очереди import_tasks. rejects - файл NDJSON,
+    куда дописываются отклонённые строки с ошибками.
+    '''
+    model, serializer_class = MODELS[model]
+    owner = User.objects.get(username=owner)
+    categories = CategoryMap(create=create_categories)
+    result = job.result or {'created': 0, 'rejected': 0}
+    rows = islice(read_rows(path, format), job.progress, None)
+    line = job.progress
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        errors = {
+            index: {'non_field_errors': ['Expected an object']}
+            for index, row in enumerate(batch) if not isinstance(row, dict)}
+        batch = [row if isinstance(row, dict) else {} for row in batch]
+        with transaction.atomic():
+            errors.update(categories.resolve(batch))
+            duplicate_titles(model, batch, errors)
+            serializer = serializer_class(data=batch, many=True)
+            if not serializer.is_valid() or errors:
+                # ошибки many=True - словарь {номер строки: ошибки}
+                # (LIST_SERIALIZER_ERRORS_AS_DICT) или список по строкам
+                item_errors = serializer.errors
+                if not isinstance(item_errors, dict):
+                    item_errors = dict(enumerate(item_errors))
+                for index, item in item_errors.items():
+                    if item:
+                        errors.setdefault(index, item)
+                # пакет без отклонённых строк проверяется ещё раз
+                serializer = serializer_class(data=[
+                    row for index, row in enumerate(batch)
+                    if index not in errors], many=True)
+                serializer.is_valid(raise_exception=True)
+            if serializer.validated_data:
+                save_batch(model, serializer, owner)
+            line += len(batch)
+            result = {
+                'created': result['created'] + len(batch) - len(errors),
+                'rejected': result['rejected'] + len(errors),
+            }
+            job.progress, job.result = line, result
+            Job.objects.filter(pk=job.pk).update(
+                progress=line, result=result, locked_at=timezone.now())
+        if rejects and errors:
+            with open(rejects, 'a', encoding='utf-8') as file:
+                for index in sorted(errors):
+                    file.write(json.dumps({
+                        'row': line - len(batch) + index + 1,
+                        'errors': errors[index],
+                    }, ensure_ascii=False) + '\n')
+    Job.objects.filter(pk=job.pk).update(total=line)
+    job.total = line
+    return result
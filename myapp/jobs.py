@@ -0,0 +1,314 @@
+'''
+Локальная очередь фоновых задач в БД (модель Job).
+Задачи ставятся enqueue() и выполняются командой manage.py run_jobs;
+воркеров может быть несколько - задачу забирает тот, чей UPDATE
+сменил её статус первым. Упавшая задача повторяется с растущей
+задержкой до max_attempts раз; задача, воркер которой пропал
+(нет отметок дольше JOB_LOCK_TIMEOUT), выдаётся заново.
+Обработчик получает job и аргументы из payload и отмечает прогресс
+через report_progress(); пакетные обработчики продолжают с job.progress.
+'''
+import base64
+import os
+import pickle
+import socket
+import time
+import traceback
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from . import analytics
+from . import cache
+from . import importer
+from . import revocation
+from . import signals
+from . import statistics
+from . import sync
+from .models import Job, JobStatus, SubTask, Task
+
+
+registry = {}
+
+
+def job(name, max_attempts=3, every=None):
+    '''
+    Регистрирует обработчик задачи name.
+    every - период в секундах для задач, которые воркер ставит сам.
+    '''
+    def decorator(handler):
+        registry[name] = {
+            'handler': handler,
+            'max_attempts': max_attempts,
+            'every': every,
+        }
+        return handler
+    return decorator
+
+
+def enqueue(name, run_at=None, **payload):
+    if name not in registry:
+        raise KeyError(f'Unknown job: {name}')
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=registry[name]['max_attempts'],
+        run_at=run_at or timezone.now())
+
+
+def report_progress(job, done, total=None):
+    '''
+    Сохраняет прогресс и продлевает блокировку воркера.
+    '''
+    job.progress = done
+    if total is not None:
+        job.total = total
+    job.locked_at = timezone.now()
+    Job.objects.filter(pk=job.pk).update(
+        progress=job.progress, total=job.total, locked_at=job.locked_at)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker, now=None):
+    '''
+    Забирает готовую к запуску задачу или None.
+    '''
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    ready = (Q(status=JobStatus.QUEUED, run_at__lte=now)
+             | Q(status=JobStatus.RUNNING, locked_at__lt=stale))
+    candidates = Job.objects.filter(ready).order_by(
+        'run_at', 'pk').values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        claimed = Job.objects.filter(ready, pk=pk).update(
+            status=JobStatus.RUNNING, locked_by=worker, locked_at=now,
+            attempts=F('attempts') + 1)
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def finish(job, **fields):
+    fields.setdefault('locked_by', '')
+    for name, value in fields.items():
+        setattr(job, name, value)
+    Job.objects.filter(pk=job.pk).update(**fields)
+
+
+def run(job):
+    '''
+    Выполняет задачу. Возвращает True, если она завершилась успешно.
+    '''
+    entry = registry.get(job.name)
+    if entry is None:
+        finish(job, status=JobStatus.FAILED, finished_at=timezone.now(),
+               error=f'Unknown job: {job.name}')
+        return False
+    try:
+        result = entry['handler'](job, **job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            finish(job, status=JobStatus.QUEUED, error=error,
+                   run_at=timezone.now() + timedelta(seconds=delay))
+        else:
+            finish(job, status=JobStatus.FAILED, error=error,
+                   finished_at=timezone.now())
+        return False
+    finish(job, status=JobStatus.DONE, result=result, error='',
+           finished_at=timezone.now())
+    return True
+
+
+def schedule_periodic(now=None, due=None):
+    '''
+    Ставит периодические задачи, если их нет в очереди и они не
+    выполнялись последние every секунд. due - {имя: когда проверить
+    снова} воркера: до этого момента задача не проверяется запросом.
+    '''
+    now = now or timezone.now()
+    due = {} if due is None else due
+    for name, entry in registry.items():
+        every = entry['every']
+        if not every or due.get(name, now) > now:
+            continue
+        period = timedelta(seconds=every)
+        state = Job.objects.filter(name=name).aggregate(
+            active=Count('pk', filter=Q(
+                status__in=[JobStatus.QUEUED, JobStatus.RUNNING])),
+            finished_at=Max('finished_at'))
+        finished_at = state['finished_at']
+        if state['active']:
+            # срок следующего запуска станет известен после этого
+            due[name] = now + period
+        elif finished_at is not None and finished_at > now - period:
+            due[name] = finished_at + period
+        else:
+            enqueue(name, run_at=now)
+            due[name] = now + period
+
+
+def work(worker=None, once=False, max_jobs=None, poll_interval=None,
+         log=None):
+    '''
+    Цикл воркера. once - выйти, когда готовых задач не осталось.
+    Возвращает число выполненных задач.
+    '''
+    worker = worker or worker_name()
+    poll_interval = (settings.JOB_POLL_INTERVAL
+                     if poll_interval is None else poll_interval)
+    processed = 0
+    due = {}
+    while max_jobs is None or processed < max_jobs:
+        close_old_connections()
+        schedule_periodic(due=due)
+        job = claim(worker)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        ok = run(job)
+        processed += 1
+        if log is not None:
+            log(job, ok)
+    return processed
+
+
+# Задачи
+
+
+def dump_query(queryset):
+    '''
+    Условия выборки для payload: Query в pickle (base64) - так Django
+    предлагает сохранять запрос для повторного выполнения. Payload пишет
+    только само приложение.
+    '''
+    return base64.b64encode(pickle.dumps(queryset.order_by('pk').query)).decode()
+
+
+def load_queryset(model, query):
+    queryset = model.objects.all()
+    queryset.query = pickle.loads(base64.b64decode(query))
+    return queryset
+
+
+def pk_ranges(pks):
+    '''
+    Сжимает возрастающие pk в отрезки [первый, последний] - выборка
+    "все по фильтру" в админке обычно укладывается в несколько отрезков.
+    '''
+    ranges = []
+    for pk in pks:
+        if ranges and pk == ranges[-1][1] + 1:
+            ranges[-1][1] = pk
+        else:
+            ranges.append([pk, pk])
+    return ranges
+
+
+def range_batches(ranges, offset, size):
+    '''
+    Пакеты (обработано после пакета, первый pk, последний pk) не длиннее
+    size, начиная с offset-го pk. Пакет не выходит за свой отрезок.
+    '''
+    done = 0
+    for first, last in ranges:
+        start = first + max(offset - done, 0)
+        done += last - first + 1
+        while start <= last:
+            stop = min(start + size - 1, last)
+            yield done - (last - stop), start, stop
+            start = stop + 1
+
+
+@job('move_deadlines')
+def move_deadlines(job, model, deadline, query=None, ranges=None):
+    '''
+    Переносит дедлайн задач или подзадач пакетами по JOB_BATCH_SIZE,
+    каждый пакет - в своей транзакции вместе с прогрессом. Выборка -
+    запрос (dump_query); при первом запуске он превращается в отрезки pk
+    (pk_ranges), и повторы продолжают по ним: перенесённые строки могут
+    уже не подходить под фильтр, например по дедлайну.
+    '''
+    model = apps.get_model(model)
+    deadline = parse_datetime(deadline)
+    if ranges is None:
+        ranges = pk_ranges(load_queryset(model, query).values_list(
+            'pk', flat=True).iterator())
+        job.payload = {**job.payload, 'ranges': ranges}
+        Job.objects.filter(pk=job.pk).update(payload=job.payload)
+    total = sum(last - first + 1 for first, last in ranges)
+    for done, first, last in range_batches(
+            ranges, job.progress, settings.JOB_BATCH_SIZE):
+        batch = range(first, last + 1)
+        with transaction.atomic():
+            now = timezone.now()
+            model.objects.filter(pk__range=(first, last)).update(
+                deadline=deadline, updated_at=now)
+            if model is SubTask:
+                task_ids = set(model.objects.filter(
+                    pk__range=(first, last)).values_list('task_id', flat=True))
+                signals.touch_tasks(task_ids, now)
+                cache.invalidate(
+                    *(f'subtask:{pk}' for pk in batch),
+                    *(f'task:{pk}' for pk in task_ids))
+            else:
+                cache.invalidate(*(f'task:{pk}' for pk in batch))
+            report_progress(job, done, total)
+    if model is Task:
+        # update() не отправляет сигналы - пересчитываем просроченные
+        statistics.refresh_overdue()
+    return {'moved': total}
+
+
+@job('sweep_overdue', every=settings.OVERDUE_SWEEP_INTERVAL)
+def sweep_overdue(job):
+    '''
+    Счётчик просроченных задач устаревает без записей - по мере того,
+    как наступают дедлайны. Периодически пересчитываем его.
+    '''
+    statistics.refresh_overdue()
+    report_progress(job, 1, 1)
+
+
+@job('recompute_statistics')
+def recompute_statistics(job):
+    fixed = statistics.reconcile()
+    report_progress(job, 1, 2)
+    categories = statistics.rebuild_category_counts()
+    report_progress(job, 2, 2)
+    return {
+        'fixed': {key: list(values) for key, values in fixed.items()},
+        'categories': categories,
+    }
+
+
+@job('prune_tombstones', every=24 * 60 * 60)
+def prune_tombstones(job):
+    return {'deleted': sync.prune_tombstones()}
+
+
+@job('rollup_task_analytics', every=settings.ANALYTICS_ROLLUP_INTERVAL)
+def rollup_task_analytics(job, first=None):
+    if first is not None:
+        first = parse_date(first)
+    return {'rows': analytics.rollup(first)}
+
+
+@job('prune_revoked_tokens', every=60 * 60)
+def prune_revoked_tokens(job):
+    return {'deleted': revocation.prune_expired()}
+
+
+@job('import_tasks', max_attempts=5)
+def import_tasks(job, **options):
+    # продолжает с job.progress - см. myapp.importer
+    return importer.import_rows(job, **options)
@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from myapp import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Measure throughput, p50/p95/p99 latency and query counts of '
+            'the API hot paths; run seed_data first')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True,
+                            help='user for signin (e.g. one from seed_data)')
+        parser.add_argument('--password', default='benchmark')
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--url', dest='base_url',
+                            help='benchmark a running server, '
+                                 'e.g. http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--endpoint', action='append', dest='only',
+                            help='limit to endpoint name (repeatable)')
+        parser.add_argument('--signin-storm', action='store_true',
+                            help='also run --requests concurrent signins '
+                                 '(--concurrency threads) and measure '
+                                 'another endpoint meanwhile')
+        parser.add_argument('--output', help='write results to JSON file')
+        parser.add_argument('--compare', help='previous results JSON file')
+
+    def handle(self, *args, **options):
+        results = benchmark.run(
+            options['username'], options['password'],
+            requests=options['requests'], warmup=options['warmup'],
+            base_url=options['base_url'],
+            concurrency=options['concurrency'], only=options['only'])
+
+        for name, stats in results['endpoints'].items():
+            self.stdout.write(
+                f'{name:16} {stats["throughput_rps"]:>9} rps  '
+                f'p50 {stats["p50_ms"]:>8} ms  p95 {stats["p95_ms"]:>8} ms  '
+                f'p99 {stats["p99_ms"]:>8} ms  queries {stats["queries"]}  '
+                f'errors {stats["errors"]}')
+
+        if options['signin_storm']:
+            storm = benchmark.signin_storm(
+                options['username'], options['password'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                base_url=options['base_url'])
+            results['signin_storm'] = storm
+            self.stdout.write(
+                f'signin storm x{storm["concurrency"]}: '
+                f'{storm["signin"]["throughput_rps"]} rps  '
+                f'p99 {storm["signin"]["p99_ms"]} ms  '
+                f'503 {storm["signin"]["rejected_503"]}  '
+                f'errors {storm["signin"]["errors"]}  |  '
+                f'task-statistics meanwhile p99 {storm["probe"]["p99_ms"]} ms')
+
+        if options['compare']:
+            try:
+                previous = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Cannot read {options["compare"]}: {error}')
+            results['compare'] = {
+                'baseline': previous.get('meta', {}).get('commit'),
+                'p50_ratio': benchmark.compare(previous, results),
+            }
+            for name, ratio in results['compare']['p50_ratio'].items():
+                self.stdout.write(f'{name:16} p50 x{ratio}')
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(self.style.SUCCESS(
+                f'Results written to {options["output"]}'))
@@ -0,0 +1,94 @@
+import os
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from myapp import importer
+from myapp import jobs
+from myapp.models import Job, JobStatus
+
+
+class Command(BaseCommand):
+    help = ('Import tasks or subtasks from a CSV or NDJSON file in batches; '
+            'an interrupted import resumes from its last committed batch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--owner', required=True,
+                            help='username of the owner of imported rows')
+        parser.add_argument('--model', choices=sorted(importer.MODELS),
+                            default='task')
+        parser.add_argument('--format', choices=sorted(importer.READERS),
+                            help='default: by file extension')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.JOB_BATCH_SIZE)
+        parser.add_argument('--create-categories', action='store_true',
+                            help='create categories missing in the database')
+        parser.add_argument('--rejects',
+                            help='append rejected rows and errors (NDJSON)')
+        parser.add_argument('--restart', action='store_true',
+                            help='ignore the checkpoint of a previous run')
+        parser.add_argument('--queue', action='store_true',
+                            help='queue the import for run_jobs')
+
+    def checkpoint(self, path, options):
+        '''
+        Незавершённый импорт того же файла в ту же модель.
+        '''
+        return Job.objects.filter(
+            name='import_tasks', payload__path=path,
+            payload__model=options['model'],
+        ).exclude(status=JobStatus.DONE).order_by('-created_at').first()
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        payload = {
+            'path': path,
+            'model': options['model'],
+            'owner': options['owner'],
+            'format': options['format'],
+            'batch_size': options['batch_size'],
+            'create_categories': options['create_categories'],
+            'rejects': options['rejects'] and os.path.abspath(
+                options['rejects']),
+        }
+        job = self.checkpoint(path, options)
+        if job is not None and options['restart']:
+            job.delete()
+            job = None
+        if job is None:
+            job = jobs.enqueue('import_tasks', **payload)
+        else:
+            stale = timezone.now() - timedelta(
+                seconds=settings.JOB_LOCK_TIMEOUT)
+            if (job.status == JobStatus.RUNNING and job.locked_at
+                    and job.locked_at >= stale):
+                raise CommandError(f'Job {job} is running on {job.locked_by}')
+            job.payload = payload
+            Job.objects.filter(pk=job.pk).update(
+                payload=payload, status=JobStatus.QUEUED,
+                run_at=timezone.now())
+            self.stdout.write(f'Resuming job {job} from row {job.progress}')
+        if options['queue']:
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job}'))
+            return
+
+        jobs.finish(job, status=JobStatus.RUNNING, attempts=job.attempts + 1,
+                    locked_by=jobs.worker_name(), locked_at=timezone.now())
+        try:
+            result = jobs.import_tasks(job, **payload)
+        except BaseException as error:
+            jobs.finish(job, status=JobStatus.FAILED,
+                        error=traceback.format_exc(),
+                        finished_at=timezone.now())
+            raise CommandError(
+                f'Import stopped after row {job.progress}: {error!r}. '
+                f'Run the command again to resume.') from error
+        jobs.finish(job, status=JobStatus.DONE, result=result, error='',
+                    finished_at=timezone.now())
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result["created"]} row(s), '
+            f'rejected {result["rejected"]}'))
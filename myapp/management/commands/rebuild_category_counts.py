@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from myapp import statistics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized Category.task_count column'
+
+    def handle(self, *args, **options):
+        updated = statistics.rebuild_category_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Fixed task counts of {updated} categories'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from myapp import jobs
+from myapp import statistics
+
+
+class Command(BaseCommand):
+    help = 'Reconcile materialized task statistics with the task table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='store_true',
+            help='queue recompute_statistics for run_jobs instead '
+                 '(also rebuilds category task counts)')
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            job = jobs.enqueue('recompute_statistics')
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job}'))
+            return
+        fixed = statistics.reconcile()
+        for key, (old, new) in fixed.items():
+            self.stdout.write(f'{key}: {old} -> {new}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled {len(fixed)} counter(s)'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from myapp import analytics
+from myapp import jobs
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily task rollup used by /api/tasks/analytics/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='first day to recompute, YYYY-MM-DD (default: a few days '
+                 'before the last rolled up day)')
+        parser.add_argument(
+            '--queue', action='store_true',
+            help='queue rollup_task_analytics for run_jobs instead')
+
+    def handle(self, *args, **options):
+        since = options['since']
+        if since and parse_date(since) is None:
+            raise CommandError('--since must be a date in YYYY-MM-DD format')
+        if options['queue']:
+            job = jobs.enqueue('rollup_task_analytics', first=since)
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job}'))
+            return
+        rows = analytics.rollup(parse_date(since) if since else None)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} rollup row(s)'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from myapp import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run the background job worker (see myapp.jobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='exit when no jobs are ready')
+        parser.add_argument('--max-jobs', type=int,
+                            help='exit after this many jobs')
+        parser.add_argument('--poll-interval', type=float,
+                            help='seconds between polls of an empty queue')
+        parser.add_argument('--worker', help='worker name in Job.locked_by')
+
+    def log(self, job, ok):
+        if ok:
+            self.stdout.write(
+                f'{job}: done ({job.progress}/{job.total or job.progress})')
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'{job}: failed, attempt {job.attempts}/{job.max_attempts}'))
+
+    def handle(self, *args, **options):
+        try:
+            processed = jobs.work(
+                worker=options['worker'], once=options['once'],
+                max_jobs=options['max_jobs'],
+                poll_interval=options['poll_interval'], log=self.log)
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
@@ -0,0 +1,87 @@
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from myapp import signals
+from myapp import statistics
+from myapp.models import Category, StatusType, SubTask, Task
+
+
+class Command(BaseCommand):
+    help = 'Seed users, categories, tasks and subtasks for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--tasks', type=int, default=1000)
+        parser.add_argument('--subtasks', type=int, default=3,
+                            help='subtasks per task')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--password', default='benchmark')
+        parser.add_argument('--seed', type=int, default=0)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        if options['tasks'] and not options['users']:
+            raise CommandError('Tasks need at least one user')
+        rnd = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        # Префикс делает имена уникальными между запусками
+        prefix = f'bench{int(timezone.now().timestamp())}'
+        now = timezone.now()
+
+        # Один хеш на всех пользователей: PBKDF2 на каждого занял бы минуты
+        password = make_password(options['password'])
+        User.objects.bulk_create(
+            User(username=f'{prefix}_user{i}', password=password)
+            for i in range(options['users']))
+        users = list(User.objects.filter(username__startswith=f'{prefix}_'))
+
+        Category.objects.bulk_create(
+            Category(name=f'{prefix} category {i}')
+            for i in range(options['categories']))
+        categories = list(Category.objects.filter(name__startswith=prefix))
+
+        through = Task.categories.through
+        task_count = options['tasks']
+        for start in range(0, task_count, batch_size):
+            tasks = [
+                Task(
+                    title=f'{prefix} task {i}',
+                    description=f'benchmark task {i} ' * rnd.randint(1, 20),
+                    status=rnd.choice(StatusType.values),
+                    deadline=now + timedelta(days=rnd.randint(-30, 60)),
+                    owner=rnd.choice(users))
+                for i in range(start, min(start + batch_size, task_count))]
+            signals.mark_completed(tasks, now)
+            tasks = Task.objects.bulk_create(tasks)
+            if tasks[0].pk is None:
+                # MySQL не возвращает id из bulk_create
+                tasks = list(Task.objects.filter(
+                    title__in=[task.title for task in tasks]))
+            if categories:
+                through.objects.bulk_create(
+                    through(task_id=task.pk, category_id=category.pk)
+                    for task in tasks
+                    for category in rnd.sample(
+                        categories, min(len(categories), rnd.randint(0, 3))))
+            SubTask.objects.bulk_create(
+                SubTask(
+                    title=f'{prefix} subtask {task.pk}-{j}',
+                    status=rnd.choice(StatusType.values),
+                    deadline=task.deadline,
+                    task=task,
+                    owner=task.owner)
+                for task in tasks
+                for j in range(options['subtasks']))
+            self.stdout.write(f'{min(start + batch_size, task_count)} tasks')
+
+        # bulk_create не отправляет сигналы - пересчитываем счётчики
+        statistics.reconcile()
+        statistics.rebuild_category_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users (password "{options["password"]}"), '
+            f'{len(categories)} categories, {task_count} tasks'))
@@ -1,10 +1,50 @@
+import time
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async)
+from django.conf import settings
+from django.http import HttpResponse
 from django.utils import timezone
-from django.utils.deprecation import MiddlewareMixin
 from rest_framework_simplejwt.exceptions import TokenError
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework_simplejwt.settings import api_settings
+from . import hashing
+from . import profiling
+from . import routers
+from .authentication import access_token_for_refresh, verify_access_token
 
 
-class JWTAuthMiddleware(MiddlewareMixin):
+class JWTAuthMiddleware:
+    '''
+    Работает и под WSGI, и под ASGI без переключения в поток:
+    проверка токенов не обращается к БД (см. myapp.authentication,
+    myapp.revocation). В поток уходит только обновление по refresh-токену
+    с ротацией - она записывает отзыв старого токена.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with profiling.timer('jwt'):
+            self.process_request(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        with profiling.timer('jwt'):
+            if (api_settings.ROTATE_REFRESH_TOKENS
+                    and self.needs_refresh(request)):
+                await sync_to_async(self.process_request)(request)
+            else:
+                self.process_request(request)
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
     def process_request(self, request):
         # Получаем токены из куков
         access_token = request.COOKIES.get('access_token')
@@ -15,7 +55,8 @@ class JWTAuthMiddleware(MiddlewareMixin):
                 # Проверяем access-токен
                 # Если токен истёк или имеет другой вид проблемы, 
                 # попытка создать объект AccessToken выбросит исключение.
-                AccessToken(access_token)
+                # Проверенные токены кешируются до истечения срока
+                verify_access_token(access_token)
                 # Когда в middleware добавляется строка 
                 # request.META['HTTP_AUTHORIZATION'] = f'Bearer {access_token}', 
                 # она имитирует ситуацию, как будто клиент отправил запрос с этим заголовком.
@@ -33,36 +74,177 @@ class JWTAuthMiddleware(MiddlewareMixin):
                 # Если access-токен недействителен, проверяем refresh-токен
                 if refresh_token:
                     try:
-                        # Проверяем и декодируем refresh-токен
-                        refresh_token_obj = RefreshToken(refresh_token)
-                        # Создаем новый access-токен
-                        new_access_token = refresh_token_obj.access_token
+                        # Проверяем refresh-токен и создаем новый access-токен
+                        # (и новый refresh-токен при ротации)
+                        new_access_token, new_refresh_token = (
+                            access_token_for_refresh(refresh_token))
                         request.META['HTTP_AUTHORIZATION'] = f'Bearer {new_access_token}'
                         request.new_access_token = new_access_token
+                        request.new_refresh_token = new_refresh_token
                     except TokenError:
                         pass
         else:
             # Если нет access-токена, но есть refresh-токен, создаем новый access-токен
             if refresh_token:
                 try:
-                    # Проверяем и декодируем refresh-токен
-                    refresh_token_obj = RefreshToken(refresh_token)
-                    # Создаем новый access-токен
-                    new_access_token = refresh_token_obj.access_token
+                    # Проверяем refresh-токен и создаем новый access-токен
+                    new_access_token, new_refresh_token = (
+                        access_token_for_refresh(refresh_token))
                     request.META['HTTP_AUTHORIZATION'] = f'Bearer {new_access_token}'
                     request.new_access_token = new_access_token
+                    request.new_refresh_token = new_refresh_token
                 except TokenError:
                     pass
 
+    def needs_refresh(self, request):
+        if not request.COOKIES.get('refresh_token'):
+            return False
+        access_token = request.COOKIES.get('access_token')
+        if not access_token:
+            return True
+        try:
+            verify_access_token(access_token)
+        except TokenError:
+            return True
+        return False
+
     def process_response(self, request, response):
-        # Если был создан новый access-токен, добавляем его в куки
-        if hasattr(request, 'new_access_token'):
-            new_access_token = request.new_access_token
-            new_access_token_exp = new_access_token['exp']
-            new_access_token_exp = timezone.datetime.fromtimestamp(
-                new_access_token_exp,
+        # Если были созданы новые токены, добавляем их в куки
+        for name in ('access_token', 'refresh_token'):
+            token = getattr(request, f'new_{name}', None)
+            if token is None:
+                continue
+            token_exp = timezone.datetime.fromtimestamp(
+                token['exp'],
                 tz=timezone.get_current_timezone())
             response.set_cookie(
-                'access_token', new_access_token,
-                expires=new_access_token_exp, httponly=True)
+                name, str(token), expires=token_exp, httponly=True)
+        return response
+
+
+class ProfilingMiddleware:
+    '''
+    Замеряет выборку запросов (PROFILING_SAMPLE_RATE): общее время, JWT,
+    SQL и сериализацию. Результат - заголовок Server-Timing и метрики
+    по маршрутам на /api/_metrics.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not profiling.sampled():
+            return self.get_response(request)
+        profile = profiling.Profile()
+        token = profiling.current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling.current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if not profiling.sampled():
+            return await self.get_response(request)
+        profile = profiling.Profile()
+        token = profiling.current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    def finish(self, request, response, profile):
+        profile.total = time.perf_counter() - profile.started
+        response['Server-Timing'] = profile.server_timing()
+        profiling.metrics.observe(
+            request.method, profiling.route_of(request), profile)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    '''
+    Разрешает чтение с реплик для безопасных запросов. После запроса,
+    изменившего данные, ставит куку, и следующие запросы клиента в течение
+    READ_YOUR_WRITES_SECONDS читают с основной БД.
+    '''
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'db_primary_until'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.routing_state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = self.begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.routing_state.reset(token)
+        return self.finish(request, response, state)
+
+    def pinned(self, request):
+        try:
+            return float(request.COOKIES.get(self.cookie_name, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def begin(self, request):
+        state = routers.RoutingState(
+            use_replica=request.method in self.safe_methods
+            and not self.pinned(request))
+        return state, routers.routing_state.set(state)
+
+    def finish(self, request, response, state):
+        if state.wrote or request.method not in self.safe_methods:
+            window = settings.READ_YOUR_WRITES_SECONDS
+            response.set_cookie(
+                self.cookie_name, str(time.time() + window),
+                max_age=window, httponly=True)
+        return response
+
+
+class HashingBusyMiddleware:
+    '''
+    503 с Retry-After, если пул хеширования паролей занят вне DRF - при
+    входе в админку authenticate() бросает HashingBusy из бэкенда, и без
+    перехвата Django ответил бы 500. Представления DRF отвечают сами.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, hashing.HashingBusy):
+            return None
+        response = HttpResponse(
+            exception.detail, status=exception.status_code,
+            content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(exception.wait)
         return response
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:33
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def fill_counters(apps, schema_editor):
+    Task = apps.get_model('myapp', 'Task')
+    TaskCounter = apps.get_model('myapp', 'TaskCounter')
+    counters = {f'status_{status}': 0 for status in range(1, 6)}
+    for row in Task.objects.order_by().values('status').annotate(
+            task_count=Count('*')):
+        counters[f'status_{row["status"]}'] = row['task_count']
+    counters['overdue'] = Task.objects.filter(
+        deadline__lt=timezone.now()).count()
+    TaskCounter.objects.bulk_create(
+        TaskCounter(key=key, value=value) for key, value in counters.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_created_at_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskCounter',
+            fields=[
+                ('key', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='counter key')),
+                ('value', models.BigIntegerField(default=0, verbose_name='counter value')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='update date and time')),
+            ],
+            options={
+                'verbose_name': 'task counter',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
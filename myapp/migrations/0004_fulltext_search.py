@@ -0,0 +1,74 @@
+from django.db import migrations
+
+
+TABLES = {
+    'my_app_task': 'my_app_task_fts',
+    'my_app_subtask': 'my_app_subtask_fts',
+}
+
+SQLITE_CREATE = [
+    # external content: индекс хранит только токены, текст - в основной таблице
+    "CREATE VIRTUAL TABLE {fts} USING fts5("
+    "title, description, content='{table}', content_rowid='id')",
+    "CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER {fts}_au AFTER UPDATE OF title, description ON {table} "
+    "BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO {fts}(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS {fts}_ai",
+    "DROP TRIGGER IF EXISTS {fts}_ad",
+    "DROP TRIGGER IF EXISTS {fts}_au",
+    "DROP TABLE IF EXISTS {fts}",
+]
+
+MYSQL_CREATE = [
+    "ALTER TABLE {table} ADD FULLTEXT INDEX {fts} (title, description)",
+]
+
+MYSQL_DROP = [
+    "ALTER TABLE {table} DROP INDEX {fts}",
+]
+
+
+def run(schema_editor, statements):
+    for table, fts in TABLES.items():
+        for statement in statements:
+            schema_editor.execute(statement.format(table=table, fts=fts))
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        run(schema_editor, SQLITE_CREATE)
+    elif vendor == 'mysql':
+        run(schema_editor, MYSQL_CREATE)
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        run(schema_editor, SQLITE_DROP)
+    elif vendor == 'mysql':
+        run(schema_editor, MYSQL_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_taskcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_task_count(apps, schema_editor):
+    Category = apps.get_model('myapp', 'Category')
+    Task = apps.get_model('myapp', 'Task')
+    counts = Task.categories.through.objects.filter(
+        category=OuterRef('pk')
+    ).order_by().values('category').annotate(
+        task_count=Count('*')).values('task_count')
+    Category.objects.update(task_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='task_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='number of tasks'),
+        ),
+        migrations.RunPython(fill_task_count, migrations.RunPython.noop),
+    ]
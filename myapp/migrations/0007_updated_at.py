@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:10
+
+import importlib
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+fulltext = importlib.import_module('myapp.migrations.0004_fulltext_search')
+
+
+def fill_updated_at(apps, schema_editor):
+    for name in ('Task', 'SubTask'):
+        apps.get_model('myapp', name).objects.update(updated_at=F('created_at'))
+
+
+def restore_fulltext_triggers(apps, schema_editor):
+    # SQLite пересоздаёт таблицу при добавлении NOT NULL-поля,
+    # и триггеры полнотекстового индекса из 0004 удаляются вместе с ней
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    fulltext.run(schema_editor, fulltext.SQLITE_DROP)
+    fulltext.run(schema_editor, fulltext.SQLITE_CREATE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_category_task_count'),
+    ]
+
+    operations = [
+        # при откате RemoveField тоже пересоздаёт таблицы
+        migrations.RunPython(
+            migrations.RunPython.noop, restore_fulltext_triggers),
+        migrations.AddField(
+            model_name='subtask',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='update date and time'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='update date and time'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.RunPython(
+            restore_fulltext_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='subtask',
+            index=models.Index(fields=['updated_at'], name='subtask_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['updated_at'], name='task_updated_at_idx'),
+        ),
+    ]
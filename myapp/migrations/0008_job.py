@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='job name')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='job arguments')),
+                ('status', models.IntegerField(choices=[(1, 'Queued'), (2, 'Running'), (3, 'Done'), (4, 'Failed')], default=1, verbose_name='job status')),
+                ('progress', models.PositiveIntegerField(default=0, verbose_name='processed items')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='total items')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='job result')),
+                ('error', models.TextField(blank=True, verbose_name='last error')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts made')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='max attempts')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='run not before')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='worker')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='lock date and time')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='creation date and time')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finish date and time')),
+            ],
+            options={
+                'verbose_name': 'job',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx')],
+            },
+        ),
+    ]
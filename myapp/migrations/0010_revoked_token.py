@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=255, unique=True, verbose_name='token id')),
+                ('user_id', models.IntegerField(blank=True, null=True, verbose_name='user id')),
+                ('revoked_from', models.DateTimeField(verbose_name='revoked from')),
+                ('expires_at', models.DateTimeField(verbose_name='token expiration date and time')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='creation date and time')),
+            ],
+            options={
+                'verbose_name': 'revoked token',
+                'indexes': [models.Index(fields=['created_at'], name='revoked_token_created_at_idx'), models.Index(fields=['expires_at'], name='revoked_token_expires_at_idx')],
+            },
+        ),
+    ]
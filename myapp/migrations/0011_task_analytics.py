@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_completed_at(apps, schema_editor):
+    # момент завершения не хранился - берём последнее изменение
+    Task = apps.get_model('myapp', 'Task')
+    Task.objects.filter(status=5).update(completed_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_revoked_token'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='day')),
+                ('created', models.PositiveIntegerField(default=0, verbose_name='tasks created')),
+                ('completed', models.PositiveIntegerField(default=0, verbose_name='tasks completed')),
+                ('open', models.IntegerField(default=0, verbose_name='open tasks at end of day')),
+                ('overdue', models.IntegerField(default=0, verbose_name='overdue tasks at end of day')),
+            ],
+            options={
+                'verbose_name': 'task rollup',
+            },
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='completion date and time'),
+        ),
+        migrations.RunPython(fill_completed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['completed_at'], name='task_completed_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='taskrollup',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myapp.category', verbose_name='task category'),
+        ),
+        migrations.AddField(
+            model_name='taskrollup',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='task owner'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrollup',
+            index=models.Index(fields=['day', 'owner'], name='task_rollup_day_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrollup',
+            index=models.Index(fields=['owner', 'day'], name='task_rollup_owner_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrollup',
+            index=models.Index(fields=['category', 'day'], name='task_rollup_category_day_idx'),
+        ),
+    ]
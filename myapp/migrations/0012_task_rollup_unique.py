@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:43
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicates(apps, schema_editor):
+    # параллельные пересчёты могли записать один день дважды -
+    # строки совпадают, оставляем первую
+    TaskRollup = apps.get_model('myapp', 'TaskRollup')
+    groups = TaskRollup.objects.order_by().values(
+        'day', 'owner', 'category').annotate(
+        keep=Min('pk'), rows=Count('pk')).filter(rows__gt=1)
+    for group in groups:
+        TaskRollup.objects.filter(
+            day=group['day'], owner=group['owner'],
+            category=group['category']).exclude(pk=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_task_analytics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='taskrollup',
+            constraint=models.UniqueConstraint(models.F('day'), models.F('owner'), django.db.models.functions.comparison.Coalesce('category', 0, output_field=models.IntegerField()), name='task_rollup_day_owner_category_unique'),
+        ),
+    ]
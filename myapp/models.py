@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.functions import Lower
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
 from .helpers import end_of_month
 
 
@@ -12,10 +13,30 @@ class StatusType(models.IntegerChoices):
     DONE = 5, "Done"
 
 
+class LoadedValuesMixin:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Запоминаем загруженные значения, чтобы сигналы видели переходы
+        # (статус, дедлайн, родительская задача) без дополнительного запроса.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
 class Category(models.Model):
     name = models.CharField(
         verbose_name='category name',
         max_length=100)
+    # Денормализованное число задач категории, поддерживается сигналами
+    # (myapp.signals) и командой rebuild_category_counts
+    task_count = models.PositiveIntegerField(
+        verbose_name='number of tasks',
+        default=0,
+        editable=False)
+    # /api/sync/ (myapp.sync)
+    updated_at = models.DateTimeField(
+        verbose_name='update date and time',
+        auto_now=True)
 
     def __str__(self):
         return self.name
@@ -27,9 +48,14 @@ class Category(models.Model):
         constraints = [
             models.UniqueConstraint(Lower('name'), name='unique_lower_name')
         ]
+        indexes = [
+            models.Index(
+                fields=['updated_at', 'id'],
+                name='category_updated_at_id_idx'),
+        ]
 
 
-class Task(models.Model):
+class Task(LoadedValuesMixin, models.Model):
     title = models.CharField(
         verbose_name='task name',
         max_length=100)
@@ -47,6 +73,15 @@ class Task(models.Model):
     created_at = models.DateTimeField(
         verbose_name='creation date and time',
         auto_now_add=True)
+    # ETag и Last-Modified (myapp.cache.conditional)
+    updated_at = models.DateTimeField(
+        verbose_name='update date and time',
+        auto_now=True)
+    # переход в DONE (myapp.signals.mark_completed), для аналитики
+    completed_at = models.DateTimeField(
+        verbose_name='completion date and time',
+        null=True,
+        blank=True)
     categories = models.ManyToManyField(
         to=Category,
         related_name='tasks',
@@ -67,6 +102,36 @@ class Task(models.Model):
         db_table = '"my_app_task"'
         verbose_name = 'task'
         ordering = ['-created_at']
+        indexes = [
+            # курсорная пагинация по (created_at, id)
+            models.Index(
+                fields=['created_at', 'id'],
+                name='task_created_at_id_idx'),
+            # /api/user-tasks/
+            models.Index(
+                fields=['owner', '-created_at'],
+                name='task_owner_created_at_idx'),
+            # ?status=...&deadline__lt=...
+            models.Index(
+                fields=['status', 'deadline'],
+                name='task_status_deadline_idx'),
+            # ?deadline__lt=..., просроченные задачи
+            models.Index(
+                fields=['deadline'],
+                name='task_deadline_idx'),
+            # валидатор списка: MAX(updated_at)
+            models.Index(
+                fields=['updated_at'],
+                name='task_updated_at_idx'),
+            # /api/sync/: изменения пользователя после курсора
+            models.Index(
+                fields=['owner', 'updated_at', 'id'],
+                name='task_owner_updated_at_idx'),
+            # /api/tasks/analytics/: завершённые за текущий день
+            models.Index(
+                fields=['completed_at'],
+                name='task_completed_at_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 Lower('title'),
@@ -74,7 +139,7 @@ class Task(models.Model):
         ]
 
 
-class SubTask(models.Model):
+class SubTask(LoadedValuesMixin, models.Model):
     title = models.CharField(
         verbose_name='subtask name',
         max_length=100)
@@ -91,6 +156,10 @@ class SubTask(models.Model):
     created_at = models.DateTimeField(
         verbose_name='creation date and time',
         auto_now_add=True)
+    # ETag и Last-Modified (myapp.cache.conditional)
+    updated_at = models.DateTimeField(
+        verbose_name='update date and time',
+        auto_now=True)
     task = models.ForeignKey(
         to=Task, on_delete=models.CASCADE,
         related_name='subtasks',
@@ -110,8 +179,269 @@ class SubTask(models.Model):
         db_table = '"my_app_subtask"'
         verbose_name = 'subtask'
         ordering = ['-created_at']
+        indexes = [
+            # курсорная пагинация по (created_at, id)
+            models.Index(
+                fields=['created_at', 'id'],
+                name='subtask_created_at_id_idx'),
+            # /api/user-subtasks/
+            models.Index(
+                fields=['owner', '-created_at'],
+                name='subtask_owner_created_at_idx'),
+            # подзадачи задачи (вложенный sub_tasks)
+            models.Index(
+                fields=['task', '-created_at'],
+                name='subtask_task_created_at_idx'),
+            models.Index(
+                fields=['status', 'deadline'],
+                name='subtask_status_deadline_idx'),
+            models.Index(
+                fields=['deadline'],
+                name='subtask_deadline_idx'),
+            models.Index(
+                fields=['updated_at'],
+                name='subtask_updated_at_idx'),
+            models.Index(
+                fields=['owner', 'updated_at', 'id'],
+                name='subtask_owner_updated_at_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 Lower('title'),
                 name='%(app_label)s_%(class)s_name_lower_unique')
         ]
+
+
+class TaskCounter(models.Model):
+    '''
+    Материализованные счётчики задач для /api/tasks/statistics/.
+    Ключи: status_<StatusType> и overdue.
+    '''
+    key = models.CharField(
+        verbose_name='counter key',
+        max_length=50,
+        primary_key=True)
+    value = models.BigIntegerField(
+        verbose_name='counter value',
+        default=0)
+    updated_at = models.DateTimeField(
+        verbose_name='update date and time',
+        auto_now=True)
+
+    def __str__(self):
+        return f'{self.key}={self.value}'
+
+    class Meta:
+        verbose_name = 'task counter'
+
+
+class Tombstone(models.Model):
+    '''
+    Запись об удалении задачи, подзадачи или категории для /api/sync/.
+    owner_id - без внешнего ключа: строка переживает удаление владельца
+    (каскадное удаление пользователя и создаёт такие записи). Старые
+    записи удаляет периодическая задача prune_tombstones.
+    '''
+    kind = models.CharField(
+        verbose_name='object kind',
+        max_length=20)
+    object_id = models.BigIntegerField(
+        verbose_name='deleted object id')
+    # None - объект виден всем (категории)
+    owner_id = models.IntegerField(
+        verbose_name='owner id',
+        null=True,
+        blank=True)
+    deleted_at = models.DateTimeField(
+        verbose_name='deletion date and time',
+        default=timezone.now)
+
+    def __str__(self):
+        return f'{self.kind} #{self.object_id}'
+
+    class Meta:
+        verbose_name = 'tombstone'
+        indexes = [
+            models.Index(
+                fields=['owner_id', 'deleted_at', 'id'],
+                name='tombstone_owner_deleted_idx'),
+            models.Index(
+                fields=['deleted_at'],
+                name='tombstone_deleted_at_idx'),
+        ]
+
+
+class JobStatus(models.IntegerChoices):
+    QUEUED = 1, "Queued"
+    RUNNING = 2, "Running"
+    DONE = 3, "Done"
+    FAILED = 4, "Failed"
+
+
+class Job(models.Model):
+    '''
+    Фоновая задача очереди myapp.jobs, выполняется командой run_jobs.
+    '''
+    name = models.CharField(
+        verbose_name='job name',
+        max_length=100)
+    payload = models.JSONField(
+        verbose_name='job arguments',
+        default=dict,
+        blank=True)
+    status = models.IntegerField(
+        verbose_name='job status',
+        choices=JobStatus.choices,
+        default=JobStatus.QUEUED)
+    # обработано / всего (единицы задаёт сама задача)
+    progress = models.PositiveIntegerField(
+        verbose_name='processed items',
+        default=0)
+    total = models.PositiveIntegerField(
+        verbose_name='total items',
+        null=True,
+        blank=True)
+    result = models.JSONField(
+        verbose_name='job result',
+        null=True,
+        blank=True)
+    error = models.TextField(
+        verbose_name='last error',
+        blank=True)
+    attempts = models.PositiveIntegerField(
+        verbose_name='attempts made',
+        default=0)
+    max_attempts = models.PositiveIntegerField(
+        verbose_name='max attempts',
+        default=3)
+    run_at = models.DateTimeField(
+        verbose_name='run not before',
+        default=timezone.now)
+    locked_by = models.CharField(
+        verbose_name='worker',
+        max_length=100,
+        blank=True)
+    locked_at = models.DateTimeField(
+        verbose_name='lock date and time',
+        null=True,
+        blank=True)
+    created_at = models.DateTimeField(
+        verbose_name='creation date and time',
+        auto_now_add=True)
+    finished_at = models.DateTimeField(
+        verbose_name='finish date and time',
+        null=True,
+        blank=True)
+
+    def __str__(self):
+        return f'#{self.pk} {self.name}'
+
+    class Meta:
+        verbose_name = 'job'
+        ordering = ['-created_at']
+        indexes = [
+            # выборка очередной задачи воркером
+            models.Index(
+                fields=['status', 'run_at'],
+                name='job_status_run_at_idx'),
+        ]
+
+
+class RevokedToken(models.Model):
+    '''
+    Отозванный JWT (выход, ротация refresh-токена). Проверки идут по копии
+    в памяти процесса (myapp.revocation), таблица нужна для синхронизации
+    процессов. Строки после истечения токена удаляет prune_revoked_tokens.
+    '''
+    jti = models.CharField(
+        verbose_name='token id',
+        max_length=255,
+        unique=True)
+    user_id = models.IntegerField(
+        verbose_name='user id',
+        null=True,
+        blank=True)
+    # при ротации старый токен ещё немного действует (параллельные запросы)
+    revoked_from = models.DateTimeField(
+        verbose_name='revoked from')
+    expires_at = models.DateTimeField(
+        verbose_name='token expiration date and time')
+    created_at = models.DateTimeField(
+        verbose_name='creation date and time',
+        default=timezone.now)
+
+    def __str__(self):
+        return self.jti
+
+    class Meta:
+        verbose_name = 'revoked token'
+        indexes = [
+            models.Index(
+                fields=['created_at'],
+                name='revoked_token_created_at_idx'),
+            models.Index(
+                fields=['expires_at'],
+                name='revoked_token_expires_at_idx'),
+        ]
+
+
+class TaskRollup(models.Model):
+    '''
+    Дневной срез задач для /api/tasks/analytics/ (myapp.analytics):
+    создано и завершено за день, открыто и просрочено на конец дня.
+    Строка на владельца (category пусто) и на владельца с категорией;
+    нулевые строки не хранятся. Пишется задачей rollup_task_analytics,
+    текущий день считается на лету.
+    '''
+    day = models.DateField(
+        verbose_name='day')
+    owner = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='task owner')
+    category = models.ForeignKey(
+        to=Category,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True,
+        verbose_name='task category')
+    created = models.PositiveIntegerField(
+        verbose_name='tasks created',
+        default=0)
+    completed = models.PositiveIntegerField(
+        verbose_name='tasks completed',
+        default=0)
+    open = models.IntegerField(
+        verbose_name='open tasks at end of day',
+        default=0)
+    overdue = models.IntegerField(
+        verbose_name='overdue tasks at end of day',
+        default=0)
+
+    def __str__(self):
+        return f'{self.day} #{self.owner_id}'
+
+    class Meta:
+        verbose_name = 'task rollup'
+        indexes = [
+            models.Index(
+                fields=['day', 'owner'],
+                name='task_rollup_day_owner_idx'),
+            models.Index(
+                fields=['owner', 'day'],
+                name='task_rollup_owner_day_idx'),
+            models.Index(
+                fields=['category', 'day'],
+                name='task_rollup_category_day_idx'),
+        ]
+        constraints = [
+            # одна строка на день, владельца и категорию, включая строку
+            # без категории: NULL в уникальном индексе MySQL не совпадает
+            # с NULL, а nulls_distinct и частичные индексы он не умеет
+            models.UniqueConstraint(
+                'day', 'owner',
+                Coalesce('category', 0, output_field=models.IntegerField()),
+                name='task_rollup_day_owner_category_unique'),
+        ]
@@ -0,0 +1,180 @@
+import base64
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimated_count(queryset):
+    '''
+    Приблизительное количество строк таблицы без полного COUNT(*).
+    Возвращает None, если оценку получить нельзя (например, queryset
+    отфильтрован - тогда статистика таблицы не подходит).
+    '''
+    if queryset.query.where:
+        return None
+    model = queryset.model
+    table = model._meta.db_table.strip('"')
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s',
+                [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [table])
+        else:
+            # SQLite: MAX(id) берётся из индекса первичного ключа за O(1)
+            cursor.execute(
+                'SELECT MAX(%s) FROM %s' % (
+                    connection.ops.quote_name(model._meta.pk.column),
+                    connection.ops.quote_name(table)))
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else 0
+
+
+class EstimatedCountPaginator(Paginator):
+    '''
+    Paginator для админки: без фильтров число строк берётся из оценки
+    estimated_count(), с фильтрами считается не дальше max_count строк.
+    Последние страницы при оценке могут оказаться пустыми.
+    '''
+    max_count = 10000
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        estimate = estimated_count(self.object_list)
+        if estimate is not None:
+            return estimate
+        return self.object_list[:self.max_count].count()
+
+
+class KeysetPaginationMixin:
+    '''
+    Курсорная (keyset) пагинация по паре (created_at, id).
+    Включается параметром cursor, вместо OFFSET использует условие
+    WHERE (created_at, id) < (последняя строка предыдущей страницы),
+    которое обслуживается составным индексом по (created_at, id).
+    http://127.0.0.1:8000/api/tasks/?cursor=
+    http://127.0.0.1:8000/api/tasks/?cursor=<next_cursor>&count=approx
+    Параметр count: none (по умолчанию), approx, exact.
+    '''
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    keyset_field = 'created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        # Направление задаётся текущей сортировкой (OrderingFilter)
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        self.descending = not ordering or ordering[0] != self.keyset_field
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(
+            prefix + self.keyset_field, prefix + 'pk')
+
+        cursor = self.decode_cursor(
+            request.query_params[self.cursor_query_param])
+        if cursor is not None:
+            value, pk = cursor
+            lookup = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.keyset_field}__{lookup}': value}) |
+                Q(**{self.keyset_field: value, f'pk__{lookup}': pk}))
+
+        self.count = self.get_count(queryset, request)
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page_results = results[:page_size]
+        return self.page_results
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param, 'none')
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'approx':
+            return estimated_count(queryset)
+        return None
+
+    def encode_cursor(self, obj):
+        if isinstance(obj, dict):
+            # строки values() (FastListMixin)
+            value, pk = obj[self.keyset_field], obj['id']
+        else:
+            value, pk = getattr(obj, self.keyset_field), obj.pk
+        raw = f'{value.isoformat()}|{pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            value, pk = base64.urlsafe_b64decode(
+                encoded.encode()).decode().rsplit('|', 1)
+            value = parse_datetime(value)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor')
+        if value is None:
+            raise NotFound('Invalid cursor')
+        return value, pk
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            self.encode_cursor(self.page_results[-1]))
+
+    def get_keyset_response(self, data):
+        return Response({
+            'count': self.count,
+            'previous_link': None,
+            'next_link': self.get_next_cursor_link(),
+            'results': data
+        })
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.get_keyset_response(data)
+        return super().get_paginated_response(data)
+
+
+class KeysetPageNumberPagination(KeysetPaginationMixin, PageNumberPagination):
+    '''
+    Стандартная постраничная пагинация DRF с курсорным режимом.
+    '''
+
+
+class CustomPagination(KeysetPaginationMixin, PageNumberPagination):
+    def get_page_number_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'page': self.page.number,
+            'previous_link': self.get_previous_link(),
+            'next_link': self.get_next_link(),
+            'results': data
+        })
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.get_keyset_response(data)
+        return self.get_page_number_response(data)
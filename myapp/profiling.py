@@ -0,0 +1,178 @@
+'''
+Профилирование запросов: общее время, проверка JWT, SQL (число и время),
+сериализация и хеширование паролей. ProfilingMiddleware отдаёт замеры в заголовке Server-Timing
+и накапливает гистограммы по маршрутам для /api/_metrics (Prometheus).
+'''
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+# Границы корзин гистограммы длительности запроса, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.timings = {
+            'db': 0.0, 'jwt': 0.0, 'serializer': 0.0, 'password_hash': 0.0}
+        self._depth = {}
+
+    def server_timing(self):
+        items = [
+            f'total;dur={self.total * 1000:.3f}',
+            f'jwt;dur={self.timings["jwt"] * 1000:.3f}',
+            f'db;dur={self.timings["db"] * 1000:.3f};'
+            f'desc="{self.queries} queries"',
+            f'serializer;dur={self.timings["serializer"] * 1000:.3f}',
+        ]
+        if self.timings['password_hash']:
+            # только signin/signup (myapp.hashing), включая ожидание пула
+            items.append(
+                f'password_hash;dur={self.timings["password_hash"] * 1000:.3f}')
+        return ', '.join(items)
+
+
+@contextmanager
+def timer(name):
+    '''
+    Добавляет время блока к замеру name текущего запроса.
+    Вложенные блоки с тем же именем не учитываются повторно.
+    '''
+    profile = current_profile.get()
+    if profile is None or profile._depth.get(name):
+        yield
+        return
+    profile._depth[name] = 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[name] += time.perf_counter() - started
+        profile._depth[name] = 0
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    '''
+    Обёртка connection.execute_wrapper: ставится на каждое соединение
+    (см. myapp.signals) и работает только внутри профилируемого запроса.
+    '''
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.timings['db'] += time.perf_counter() - started
+
+
+def install_sql_wrapper(connection):
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+class TimedDataMixin:
+    '''
+    Для сериализаторов: время построения .data идёт в замер serializer.
+    '''
+    @property
+    def data(self):
+        with timer('serializer'):
+            return super().data
+
+
+class Metrics:
+    '''
+    Гистограммы длительности и суммы замеров по (method, route) в памяти
+    процесса.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, method, route, profile):
+        with self._lock:
+            item = self._routes.setdefault((method, route), {
+                'buckets': [0] * len(BUCKETS),
+                'count': 0,
+                'sum': 0.0,
+                'queries': 0,
+                'db': 0.0,
+                'jwt': 0.0,
+                'serializer': 0.0,
+                'password_hash': 0.0,
+            })
+            for index, bound in enumerate(BUCKETS):
+                if profile.total <= bound:
+                    item['buckets'][index] += 1
+            item['count'] += 1
+            item['sum'] += profile.total
+            item['queries'] += profile.queries
+            for name in ('db', 'jwt', 'serializer', 'password_hash'):
+                item[name] += profile.timings[name]
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        with self._lock:
+            routes = {key: dict(value) for key, value in self._routes.items()}
+        lines = [
+            '# HELP api_request_duration_seconds Request duration.',
+            '# TYPE api_request_duration_seconds histogram',
+        ]
+        for (method, route), item in sorted(routes.items()):
+            labels = f'method="{method}",route="{route}"'
+            for bound, value in zip(BUCKETS, item['buckets']):
+                lines.append(
+                    f'api_request_duration_seconds_bucket'
+                    f'{{{labels},le="{bound}"}} {value}')
+            lines.append(
+                f'api_request_duration_seconds_bucket'
+                f'{{{labels},le="+Inf"}} {item["count"]}')
+            lines.append(
+                f'api_request_duration_seconds_sum{{{labels}}} {item["sum"]}')
+            lines.append(
+                f'api_request_duration_seconds_count{{{labels}}} '
+                f'{item["count"]}')
+        counters = [
+            ('api_request_queries_total', 'queries', 'SQL queries.'),
+            ('api_request_db_seconds_total', 'db', 'Time in SQL.'),
+            ('api_request_jwt_seconds_total', 'jwt', 'Time verifying JWT.'),
+            ('api_request_serializer_seconds_total', 'serializer',
+             'Time serializing responses.'),
+            ('api_request_password_hash_seconds_total', 'password_hash',
+             'Time hashing passwords, including the wait for the pool.'),
+        ]
+        for metric, key, description in counters:
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} counter')
+            for (method, route), item in sorted(routes.items()):
+                lines.append(
+                    f'{metric}{{method="{method}",route="{route}"}} '
+                    f'{item[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def sampled():
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
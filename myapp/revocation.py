@@ -0,0 +1,224 @@
+'''
+Отзыв JWT по jti без запроса к БД при проверке.
+Отозванные токены хранятся в RevokedToken и в памяти процесса: фильтр
+Блума отвечает "точно не отозван" для почти всех токенов за несколько
+хешей, а точное множество {jti: (действует с, истекает)} убирает его
+ложные срабатывания. Отзыв в этом процессе виден сразу; отзывы из других
+процессов подтягивает фоновый поток раз в REVOCATION_SYNC_INTERVAL секунд.
+Записи истёкших токенов выбрасываются из памяти при синхронизации,
+из БД - периодической задачей prune_revoked_tokens.
+'''
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from .models import RevokedToken
+
+
+logger = logging.getLogger(__name__)
+
+# Перекрытие окон синхронизации: транзакция, начатая раньше, может
+# закоммитить строку с меньшим created_at уже после прошлого прохода.
+SYNC_OVERLAP = timedelta(seconds=60)
+PRUNE_INTERVAL = 60
+
+
+class BloomFilter:
+    '''
+    Вероятностное множество строк: ложные срабатывания возможны,
+    пропусков нет. Позиции - двойное хеширование одного blake2b.
+    '''
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(
+            self.array[position >> 3] & (1 << (position & 7))
+            for position in self.positions(key))
+
+
+class RevocationSet:
+    '''
+    Фильтр Блума и точное множество отозванных jti. Запись - под
+    блокировкой, чтение - без неё: prune() подменяет оба объекта целиком.
+    '''
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._bloom = BloomFilter(bits, hashes)
+
+    def add(self, jti, revoked_from, expires_at):
+        with self._lock:
+            current = self._entries.get(jti)
+            if current is not None:
+                revoked_from = min(current[0], revoked_from)
+            # сначала точное множество: фильтр без записи дал бы "не отозван"
+            self._entries[jti] = (revoked_from, expires_at)
+            self._bloom.add(jti)
+
+    def is_revoked(self, jti, now=None):
+        if jti not in self._bloom:
+            return False
+        entry = self._entries.get(jti)
+        return entry is not None and entry[0] <= (now or time.time())
+
+    def prune(self, now=None):
+        '''
+        Выбрасывает истёкшие токены и пересобирает фильтр (из фильтра
+        Блума удалять нельзя). Возвращает число выброшенных записей.
+        '''
+        now = now or time.time()
+        with self._lock:
+            entries = {
+                jti: entry for jti, entry in self._entries.items()
+                if entry[1] > now}
+            bloom = BloomFilter(self.bits, self.hashes)
+            for jti in entries:
+                bloom.add(jti)
+            removed = len(self._entries) - len(entries)
+            self._entries = entries
+            self._bloom = bloom
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._bloom = BloomFilter(self.bits, self.hashes)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+revoked = RevocationSet(
+    settings.REVOCATION_BLOOM_BITS, settings.REVOCATION_BLOOM_HASHES)
+# created_at, с которого начнётся следующая синхронизация
+_synced_from = None
+_pruned_at = 0
+_sync_lock = threading.Lock()
+_start_lock = threading.Lock()
+_thread = None
+
+
+def from_timestamp(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def revoke(token, grace=0):
+    '''
+    Отзывает токен simplejwt. grace - сколько секунд он ещё действует
+    (ротация: параллельные запросы клиента со старым refresh-токеном).
+    '''
+    now = timezone.now()
+    revoked_from = now + timedelta(seconds=grace)
+    expires_at = from_timestamp(token['exp'])
+    RevokedToken.objects.bulk_create([RevokedToken(
+        jti=token['jti'],
+        user_id=token.get(api_settings.USER_ID_CLAIM),
+        revoked_from=revoked_from,
+        expires_at=expires_at,
+        created_at=now,
+    )], ignore_conflicts=True)
+    # уже отозванный с отсрочкой токен (выход сразу после ротации)
+    RevokedToken.objects.filter(
+        jti=token['jti'], revoked_from__gt=revoked_from,
+    ).update(revoked_from=revoked_from, created_at=now)
+    revoked.add(token['jti'], revoked_from.timestamp(), token['exp'])
+
+
+def is_revoked(jti):
+    start()
+    return revoked.is_revoked(jti)
+
+
+def sync(now=None):
+    '''
+    Подтягивает отзывы, записанные после прошлой синхронизации (всеми
+    процессами), и раз в PRUNE_INTERVAL выбрасывает истёкшие записи.
+    '''
+    global _synced_from, _pruned_at
+    now = now or timezone.now()
+    with _sync_lock:
+        rows = RevokedToken.objects.filter(expires_at__gt=now)
+        if _synced_from is not None:
+            rows = rows.filter(created_at__gte=_synced_from)
+        count = 0
+        for jti, revoked_from, expires_at in rows.values_list(
+                'jti', 'revoked_from', 'expires_at').iterator():
+            revoked.add(jti, revoked_from.timestamp(), expires_at.timestamp())
+            count += 1
+        _synced_from = now - SYNC_OVERLAP
+        if now.timestamp() - _pruned_at >= PRUNE_INTERVAL:
+            revoked.prune(now.timestamp())
+            _pruned_at = now.timestamp()
+    return count
+
+
+def reset():
+    '''
+    Забывает состояние процесса; следующая синхронизация загрузит всё.
+    '''
+    global _synced_from, _pruned_at
+    with _sync_lock:
+        revoked.clear()
+        _synced_from = None
+        _pruned_at = 0
+
+
+def sync_forever():
+    while True:
+        interval = settings.REVOCATION_SYNC_INTERVAL
+        if interval > 0:
+            try:
+                sync()
+            except DatabaseError:
+                # БД недоступна или не мигрирована - повторим в следующий раз
+                logger.warning('Token revocation sync failed', exc_info=True)
+            finally:
+                close_old_connections()
+        time.sleep(interval if interval > 0 else 1)
+
+
+def start():
+    '''
+    Запускает фоновую синхронизацию, если она ещё не идёт в этом
+    процессе. Вызывается при первой проверке отзыва (is_revoked), а не
+    при загрузке приложения: поток нужен только процессам, которые
+    проверяют токены, а не migrate или run_jobs. После fork воркера
+    поток родителя в дочернем процессе не жив - запустится новый.
+    '''
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    with _start_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(
+                target=sync_forever, daemon=True,
+                name=f'token-revocation-{os.getpid()}')
+            _thread.start()
+
+
+def prune_expired(now=None):
+    now = now or timezone.now()
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=now).delete()
+    revoked.prune(now.timestamp())
+    return deleted
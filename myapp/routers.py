@@ -0,0 +1,59 @@
+'''
+Маршрутизация чтения на реплики (DATABASE_REPLICAS).
+На реплику идут чтения только из GET/HEAD/OPTIONS-запросов
+(ReplicaRoutingMiddleware), всё остальное - на основную БД (default):
+записи, чтения после записи в том же запросе, команды manage.py, а также
+чтения клиента, который недавно писал (read-your-writes,
+READ_YOUR_WRITES_SECONDS).
+'''
+import contextvars
+import random
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+routing_state = contextvars.ContextVar('routing_state', default=None)
+
+
+class RoutingState:
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+        # реплика выбирается один раз на запрос
+        self.replica = None
+
+
+def use_primary():
+    '''
+    До конца запроса читать с основной БД - для чтений, которым
+    отставание реплики недопустимо (myapp.sync).
+    '''
+    state = routing_state.get()
+    if state is not None:
+        state.use_replica = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        replicas = settings.DATABASE_REPLICAS
+        if state is None or not state.use_replica or state.wrote or not replicas:
+            return DEFAULT_DB_ALIAS
+        if state.replica not in replicas:
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            # до конца запроса читаем то, что только что записали
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема реплик приходит с репликацией
+        return db not in settings.DATABASE_REPLICAS
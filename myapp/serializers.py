@@ -1,7 +1,14 @@
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.db import connections
+from django.db.models import Prefetch
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from . import authentication
+from . import hashing
 from . import models
+from . import profiling
+from . import signals
 
 
 def validate_deadline(value):
@@ -11,7 +18,241 @@ def validate_deadline(value):
     return value
 
 
-class CategorySerializer(serializers.ModelSerializer):
+def eager_queryset(queryset, serializer):
+    '''
+    Добавляет к queryset select_related/prefetch_related по объявленным
+    полям сериализатора, чтобы страница стоила постоянное число запросов.
+    PrimaryKeyRelatedField по FK читает <field>_id и JOIN не требует.
+    '''
+    for field in serializer.fields.values():
+        source = field.source
+        if field.write_only or source == '*' or '.' in source:
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            related_model = field.child.Meta.model
+            queryset = queryset.prefetch_related(Prefetch(
+                source,
+                queryset=eager_queryset(
+                    related_model._default_manager.all(), field.child)))
+        elif isinstance(field, serializers.ManyRelatedField):
+            queryset = queryset.prefetch_related(source)
+        elif isinstance(field, serializers.BaseSerializer):
+            queryset = queryset.select_related(source)
+        elif (isinstance(field, serializers.RelatedField)
+              and not field.use_pk_only_optimization()):
+            queryset = queryset.select_related(source)
+    return queryset
+
+
+def sparse_queryset(queryset, serializer, keep=()):
+    '''
+    Для сериализатора с выбором полей (SparseFieldsMixin) читает только
+    нужные колонки: ?fields= - через only(), ?exclude= - через defer().
+    keep - поля, нужные помимо сериализатора (например, курсор пагинации).
+    '''
+    if not getattr(serializer, 'sparse', False):
+        return queryset
+    opts = queryset.model._meta
+    concrete = {field.name for field in opts.concrete_fields}
+
+    def columns(fields):
+        return [field.source for field in fields
+                if field.source in concrete]
+
+    if serializer.excluded and not serializer.selected:
+        kept = set(columns(serializer.fields.values())) | set(keep)
+        return queryset.defer(*(
+            name for name in columns(serializer.excluded) if name not in kept))
+    return queryset.only(
+        opts.pk.name, *columns(serializer.fields.values()), *keep)
+
+
+class SparseFieldsMixin:
+    '''
+    Выбор полей ответа на GET:
+    http://127.0.0.1:8000/api/tasks/?fields=id,title,status,deadline
+    http://127.0.0.1:8000/api/tasks/?exclude=description,sub_tasks
+    id остаётся всегда. Лишние колонки не читаются (sparse_queryset),
+    вложенные списки и M2M без своих полей не загружаются.
+    '''
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = False
+        self.selected = []
+        self.excluded = []
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return
+        selected = self.parse(request, self.fields_query_param)
+        excluded = self.parse(request, self.exclude_query_param)
+        if not selected and not excluded:
+            return
+        keep = {self.Meta.model._meta.pk.name}
+        for name in set(self.fields) - keep:
+            if (selected and name not in selected) or name in excluded:
+                field = self.fields.pop(name)
+                if name in excluded:
+                    self.excluded.append(field)
+        self.sparse = True
+        self.selected = selected
+
+    def parse(self, request, param):
+        # DRF Request или HttpRequest (myapp.async_views)
+        value = getattr(request, 'query_params', request.GET).get(param)
+        if not value:
+            return []
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise serializers.ValidationError(
+                {param: [f'Unknown field(s): {", ".join(unknown)}']})
+        return names
+
+
+class PreloadedQueryset:
+    '''
+    Заменяет queryset поля PrimaryKeyRelatedField на время пакетной
+    валидации: все связанные объекты загружаются одним запросом.
+    '''
+    def __init__(self, queryset, pks):
+        self.model = queryset.model
+        to_python = self.model._meta.pk.to_python
+        valid = set()
+        for pk in pks:
+            try:
+                valid.add(to_python(pk))
+            except Exception:
+                pass
+        self.objects = queryset.in_bulk(valid)
+
+    def all(self):
+        return self
+
+    def get(self, pk):
+        obj = self.objects.get(self.model._meta.pk.to_python(pk))
+        if obj is None:
+            raise self.model.DoesNotExist
+        return obj
+
+
+class TimedListSerializer(profiling.TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class BulkListSerializer(TimedListSerializer):
+    '''
+    many=True для пакетных эндпоинтов: связи загружаются заранее,
+    запись идёт через bulk_create/bulk_update.
+    '''
+    def preload_related(self, items):
+        for name, field in self.child.fields.items():
+            if field.read_only or not isinstance(items, list):
+                continue
+            if isinstance(field, serializers.ManyRelatedField):
+                relation = field.child_relation
+                pks = [pk for item in items if isinstance(item, dict)
+                       for pk in item.get(name) or ()]
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                relation = field
+                pks = [item.get(name) for item in items
+                       if isinstance(item, dict)]
+            else:
+                continue
+            relation.queryset = PreloadedQueryset(
+                relation.get_queryset(), pks)
+
+    def run_validation(self, data=serializers.empty):
+        self.preload_related(data)
+        if self.instance is not None:
+            self.instance_map = {obj.pk: obj for obj in self.instance}
+        return super().run_validation(data)
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            self.child.instance = self.instance_map.get(data.get('id'))
+            self.child.initial_data = data
+        return super().run_child_validation(data)
+
+    def split_many_to_many(self, validated_data):
+        model = self.child.Meta.model
+        m2m_names = [field.name for field in model._meta.many_to_many]
+        m2m = [
+            {name: attrs.pop(name) for name in m2m_names if name in attrs}
+            for attrs in validated_data]
+        return m2m
+
+    def set_many_to_many(self, instances, m2m, clear):
+        model = self.child.Meta.model
+        for field in model._meta.many_to_many:
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            changed = [
+                (instance, values[field.name])
+                for instance, values in zip(instances, m2m)
+                if field.name in values]
+            if not changed:
+                continue
+            removed = []
+            if clear:
+                links = through.objects.filter(**{
+                    f'{source}__in': [instance for instance, _ in changed]})
+                removed = list(links.values_list(f'{target}_id', flat=True))
+                links.delete()
+            through.objects.bulk_create(
+                through(**{source: instance, target: related})
+                for instance, related_objects in changed
+                for related in related_objects)
+            signals.through_rows_changed(
+                through,
+                [related.pk for _, related_objects in changed
+                 for related in related_objects],
+                removed)
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        m2m = self.split_many_to_many(validated_data)
+        instances = [model(**attrs) for attrs in validated_data]
+        if model is models.Task:
+            signals.mark_completed(instances)
+        connection = connections[model.objects.db]
+        self.signals_sent = (
+            not connection.features.can_return_rows_from_bulk_insert)
+        if self.signals_sent:
+            # MySQL не возвращает id из bulk_create - они нужны для M2M
+            for instance in instances:
+                instance.save(force_insert=True)
+        else:
+            model.objects.bulk_create(instances)
+        self.set_many_to_many(instances, m2m, clear=False)
+        return instances
+
+    def update(self, instances, validated_data):
+        m2m = self.split_many_to_many(validated_data)
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+                fields.add(name)
+        self.signals_sent = False
+        # bulk_update не заполняет auto_now, а изменение M2M тоже
+        # меняет представление объекта
+        now = timezone.now()
+        for instance in instances:
+            instance.updated_at = now
+        fields.add('updated_at')
+        if self.child.Meta.model is models.Task:
+            signals.mark_completed(instances, now)
+            fields.add('completed_at')
+        self.child.Meta.model.objects.bulk_update(instances, fields)
+        self.set_many_to_many(instances, m2m, clear=True)
+        return instances
+
+
+class CategorySerializer(profiling.TimedDataMixin, serializers.ModelSerializer):
     def create(self, validated_data):
         name = validated_data.get('name')
         if models.Category.objects.filter(name=name).exists():
@@ -30,9 +271,11 @@ class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Category
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
 
-class SubTaskSerializer(serializers.ModelSerializer):
+class SubTaskSerializer(SparseFieldsMixin, profiling.TimedDataMixin,
+                        serializers.ModelSerializer):
     deadline = serializers.DateTimeField(
         required=False,
         validators=[validate_deadline])
@@ -41,20 +284,32 @@ class SubTaskSerializer(serializers.ModelSerializer):
         model = models.SubTask
         fields = '__all__'
         read_only_fields = ['created_at', 'owner']
+        list_serializer_class = BulkListSerializer
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsMixin, profiling.TimedDataMixin,
+                     serializers.ModelSerializer):
     deadline = serializers.DateTimeField(
         required=False,
         validators=[validate_deadline])
     sub_tasks = SubTaskSerializer(
+        source='subtasks',
         read_only=True,
         many=True)
 
     class Meta:
         model = models.Task
         fields = '__all__'
-        read_only_fields = ['created_at', 'owner']
+        # completed_at ставит myapp.signals.mark_completed
+        read_only_fields = ['created_at', 'updated_at', 'completed_at', 'owner']
+        list_serializer_class = BulkListSerializer
+
+
+class SyncTaskSerializer(TaskSerializer):
+    '''
+    Задача в /api/sync/ - подзадачи приходят там отдельным списком.
+    '''
+    sub_tasks = None
 
 
 # authentication
@@ -67,10 +322,12 @@ class SignupSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            password=validated_data['password'],
-            email=validated_data.get('email', ''))
+        # как create_user(), но хеш считается в пуле (myapp.hashing)
+        user = User.objects.create(
+            username=User.normalize_username(validated_data['username']),
+            password=hashing.make_password(validated_data['password']),
+            email=User.objects.normalize_email(
+                validated_data.get('email', '')))
         return user
 
 
@@ -78,3 +335,11 @@ class SigninSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'password']
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    '''
+    /api/token/refresh/ с проверкой отзыва; при ROTATE_REFRESH_TOKENS
+    старый refresh-токен отзывается (RevocableRefreshToken.blacklist).
+    '''
+    token_class = authentication.RevocableRefreshToken
@@ -0,0 +1,229 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from . import authentication
+from . import cache
+from . import profiling
+from . import statistics
+from .models import Category, StatusType, SubTask, Task, Tombstone
+
+
+def tasks_saved(instances, created):
+    '''
+    Обновляет счётчики статистики и кеш после сохранения задач.
+    Вызывается сигналами и напрямую после bulk_create/bulk_update.
+    '''
+    cutoff = statistics.overdue_cutoff()
+    deltas = []
+    for instance in instances:
+        deltas.append(statistics.task_deltas(
+            instance.status, instance.deadline, 1, cutoff))
+        loaded = getattr(instance, '_loaded_values', None)
+        if not created:
+            if (loaded is None or 'status' not in loaded
+                    or 'deadline' not in loaded):
+                # Старое состояние неизвестно - счётчики поправит reconcile
+                deltas.pop()
+                continue
+            deltas.append(statistics.task_deltas(
+                loaded['status'], loaded['deadline'], -1, cutoff))
+        instance._loaded_values = {
+            **(loaded or {}),
+            'status': instance.status,
+            'deadline': instance.deadline,
+        }
+    statistics.apply_deltas(statistics.merge_deltas(*deltas))
+    cache.invalidate(
+        'category', *(f'task:{instance.pk}' for instance in instances))
+
+
+def touch_tasks(task_ids, now=None):
+    '''
+    Подзадачи и категории входят в представление задачи - при их изменении
+    сдвигаем updated_at задачи, чтобы сменились ETag и Last-Modified.
+    '''
+    task_ids = set(task_ids)
+    if task_ids:
+        Task.objects.filter(pk__in=task_ids).update(
+            updated_at=now or timezone.now())
+
+
+def subtasks_saved(instances, touch=True):
+    scopes = set()
+    task_ids = set()
+    for instance in instances:
+        task_ids.add(instance.task_id)
+        loaded = getattr(instance, '_loaded_values', None) or {}
+        if loaded.get('task_id'):
+            task_ids.add(loaded['task_id'])
+        scopes.add(f'subtask:{instance.pk}')
+        instance._loaded_values = {**loaded, 'task_id': instance.task_id}
+    if touch:
+        touch_tasks(task_ids)
+    cache.invalidate(*scopes, *(f'task:{pk}' for pk in task_ids))
+
+
+def mark_completed(instances, now=None):
+    '''
+    Ставит completed_at при переходе задачи в DONE и сбрасывает при
+    выходе из него. Вызывается pre_save и напрямую перед
+    bulk_create/bulk_update.
+    '''
+    now = now or timezone.now()
+    for instance in instances:
+        if instance.status != StatusType.DONE:
+            instance.completed_at = None
+        elif instance.completed_at is None:
+            instance.completed_at = now
+
+
+@receiver(pre_save, sender=Task)
+def task_saving(sender, instance, **kwargs):
+    mark_completed([instance])
+
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance, created, **kwargs):
+    tasks_saved([instance], created)
+
+
+def record_deletion(kind, instance, owner_id=None):
+    # удаления для /api/sync/ (myapp.sync)
+    Tombstone.objects.create(
+        kind=kind, object_id=instance.pk, owner_id=owner_id)
+
+
+@receiver(post_delete, sender=Task)
+def task_deleted(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    statistics.apply_deltas(statistics.task_deltas(
+        loaded.get('status', instance.status),
+        loaded.get('deadline', instance.deadline), -1,
+        statistics.overdue_cutoff()))
+    record_deletion('task', instance, instance.owner_id)
+    cache.invalidate(f'task:{instance.pk}', 'category')
+
+
+@receiver(post_save, sender=SubTask)
+@receiver(post_delete, sender=SubTask)
+def subtask_changed(sender, instance, origin=None, **kwargs):
+    # при каскадном удалении задачи трогать её updated_at незачем
+    cascade = (isinstance(origin, Task)
+               or getattr(origin, 'model', None) is Task)
+    subtasks_saved([instance], touch=not cascade)
+
+
+@receiver(post_delete, sender=SubTask)
+def subtask_deleted(sender, instance, **kwargs):
+    record_deletion('subtask', instance, instance.owner_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    cache.invalidate('category')
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    record_deletion('category', instance)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # Удаление категории убирает её из задач без m2m_changed
+    task_ids = list(instance.tasks.values_list('pk', flat=True))
+    touch_tasks(task_ids)
+    cache.invalidate(*(f'task:{pk}' for pk in task_ids))
+
+
+@receiver(m2m_changed, sender=Task.categories.through)
+def task_categories_changed(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    # для clear pk_set не передаётся - задачи собираются в pre_clear
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        task_ids = [instance.pk]
+    elif action == 'pre_clear':
+        task_ids = list(instance.tasks.values_list('pk', flat=True))
+    else:
+        task_ids = pk_set
+    now = timezone.now()
+    if not reverse:
+        instance.updated_at = now
+    touch_tasks(task_ids, now)
+    cache.invalidate('category', *(f'task:{pk}' for pk in task_ids))
+
+
+# Category.task_count
+
+
+@receiver(m2m_changed, sender=Task.categories.through)
+def task_categories_counted(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    # remove/clear получают pk_set без проверки существования связей,
+    # поэтому реально удаляемые связи собираются в pre_* событиях
+    through = sender.objects
+    if action == 'post_add':
+        if reverse:
+            statistics.adjust_category_counts({instance.pk: len(pk_set)})
+        else:
+            statistics.adjust_category_counts(dict.fromkeys(pk_set, 1))
+    elif action in ('pre_remove', 'pre_clear'):
+        if reverse:
+            links = through.filter(category=instance)
+            if action == 'pre_remove':
+                links = links.filter(task__in=pk_set)
+            instance._removed_task_links = links.count()
+        else:
+            links = through.filter(task=instance)
+            if action == 'pre_remove':
+                links = links.filter(category__in=pk_set)
+            instance._removed_category_ids = list(
+                links.values_list('category_id', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        if reverse:
+            statistics.adjust_category_counts(
+                {instance.pk: -instance.__dict__.pop('_removed_task_links', 0)})
+        else:
+            statistics.adjust_category_counts(dict.fromkeys(
+                instance.__dict__.pop('_removed_category_ids', ()), -1))
+
+
+@receiver(pre_delete, sender=Task)
+def task_deleting(sender, instance, **kwargs):
+    # Связи с категориями удаляются каскадно, без m2m_changed
+    category_ids = Task.categories.through.objects.filter(
+        task=instance).values_list('category_id', flat=True)
+    statistics.adjust_category_counts(dict.fromkeys(category_ids, -1))
+
+
+def through_rows_changed(through, added, removed):
+    '''
+    Для пакетной записи связей в обход m2m_changed (BulkListSerializer):
+    added/removed - списки id связанных объектов по строкам связей.
+    '''
+    if through is not Task.categories.through:
+        return
+    deltas = {}
+    for category_id in added:
+        deltas[category_id] = deltas.get(category_id, 0) + 1
+    for category_id in removed:
+        deltas[category_id] = deltas.get(category_id, 0) - 1
+    statistics.adjust_category_counts(deltas)
+    cache.invalidate('category')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    authentication.forget_user(instance.pk)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    profiling.install_sql_wrapper(connection)
@@ -0,0 +1,170 @@
+from collections import defaultdict
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db import transaction
+from django.utils import timezone
+from .models import Category, StatusType, Task, TaskCounter
+
+
+OVERDUE = 'overdue'
+
+
+def status_key(status):
+    return f'status_{int(status)}'
+
+
+def apply_deltas(deltas):
+    '''
+    Инкрементально изменяет счётчики: {'status_1': 1, 'overdue': -1}.
+    '''
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        updated = TaskCounter.objects.filter(key=key).update(
+            value=F('value') + delta)
+        if not updated:
+            TaskCounter.objects.get_or_create(key=key)
+            TaskCounter.objects.filter(key=key).update(
+                value=F('value') + delta)
+
+
+def overdue_cutoff():
+    '''
+    Момент, на который посчитан счётчик overdue (updated_at его строки,
+    apply_deltas его не сдвигает). None - счётчика ещё нет.
+    '''
+    return TaskCounter.objects.filter(key=OVERDUE).values_list(
+        'updated_at', flat=True).first()
+
+
+def task_deltas(status, deadline, sign, cutoff=None):
+    '''
+    Изменения счётчиков от задачи. Просроченной считается задача с
+    дедлайном до cutoff - момента последнего пересчёта overdue, а не до
+    текущего: иначе дедлайны, наступившие после него, сдвигали бы счётчик
+    без парного +1 от пересчёта.
+    '''
+    deltas = {status_key(status): sign}
+    if deadline is not None and cutoff is not None and deadline < cutoff:
+        deltas[OVERDUE] = sign
+    return deltas
+
+
+def merge_deltas(*items):
+    result = {}
+    for deltas in items:
+        for key, delta in deltas.items():
+            result[key] = result.get(key, 0) + delta
+    return result
+
+
+def compute(now=None):
+    '''
+    Полный пересчёт счётчиков по таблице задач.
+    '''
+    now = now or timezone.now()
+    values = {status_key(status): 0 for status in StatusType.values}
+    for row in Task.objects.order_by().values('status').annotate(
+            task_count=Count('*')):
+        values[status_key(row['status'])] = row['task_count']
+    values[OVERDUE] = Task.objects.filter(deadline__lt=now).count()
+    return values
+
+
+@transaction.atomic
+def reconcile():
+    '''
+    Сверяет материализованные счётчики с таблицей задач.
+    Возвращает словарь исправлений {key: (было, стало)}.
+    '''
+    now = timezone.now()
+    values = compute(now)
+    current = dict(
+        TaskCounter.objects.select_for_update().values_list('key', 'value'))
+    fixed = {}
+    for key, value in values.items():
+        if current.get(key) != value:
+            TaskCounter.objects.update_or_create(
+                key=key, defaults={'value': value})
+            fixed[key] = (current.get(key), value)
+    TaskCounter.objects.filter(key=OVERDUE).update(updated_at=now)
+    return fixed
+
+
+@transaction.atomic
+def refresh_overdue(now=None):
+    '''
+    Пересчитывает overdue на момент now и запоминает его в updated_at.
+    '''
+    now = now or timezone.now()
+    TaskCounter.objects.get_or_create(key=OVERDUE)
+    TaskCounter.objects.filter(key=OVERDUE).update(
+        value=Task.objects.filter(deadline__lt=now).count(), updated_at=now)
+
+
+def read():
+    '''
+    Данные для TaskStatisticsView одним запросом к таблице счётчиков.
+    '''
+    return from_counters(
+        dict(TaskCounter.objects.values_list('key', 'value')))
+
+
+async def aread():
+    counters = {
+        key: value
+        async for key, value in TaskCounter.objects.values_list('key', 'value')
+    }
+    return from_counters(counters)
+
+
+def from_counters(counters):
+    by_status = [
+        {
+            "status": status.label,
+            "tasks_count": counters[status_key(status)]
+        }
+        for status in StatusType
+        if counters.get(status_key(status))
+    ]
+    return {
+        'tasks': sum(item['tasks_count'] for item in by_status),
+        'tasks_by_status': by_status,
+        'tasks_lt_now': counters.get(OVERDUE, 0),
+    }
+
+
+# число задач категорий (Category.task_count)
+
+
+def adjust_category_counts(deltas):
+    '''
+    Инкрементально меняет Category.task_count: {category_id: delta}.
+    Категории с одинаковым delta обновляются одним запросом.
+    '''
+    by_delta = defaultdict(list)
+    for category_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(category_id)
+    now = timezone.now()
+    for delta, category_ids in by_delta.items():
+        Category.objects.filter(pk__in=category_ids).update(
+            task_count=F('task_count') + delta, updated_at=now)
+
+
+def rebuild_category_counts(queryset=None):
+    '''
+    Пересчитывает task_count одним UPDATE с подзапросом по таблице связей.
+    Меняются только расходящиеся строки - у остальных не сдвигается
+    updated_at (/api/sync/). Возвращает число исправленных категорий.
+    '''
+    through = Task.categories.through
+    counts = through.objects.filter(
+        category=OuterRef('pk')
+    ).order_by().values('category').annotate(
+        task_count=Count('*')).values('task_count')
+    actual = Coalesce(Subquery(counts), 0)
+    queryset = Category.objects.all() if queryset is None else queryset
+    return queryset.annotate(actual_count=actual).exclude(
+        task_count=F('actual_count')).update(
+        task_count=actual, updated_at=timezone.now())
@@ -0,0 +1,163 @@
+'''
+Дельта-синхронизация для клиентов: /api/sync/?since=<token>.
+Возвращает задачи и подзадачи пользователя, категории и удаления
+(Tombstone), изменившиеся после токена. Токен - курсор (updated_at, id)
+по каждому списку; без since отдаётся всё (полная синхронизация).
+
+Строки с updated_at позже now - SYNC_SAFETY_WINDOW отдаются повторно
+в следующем ответе: транзакция, начатая раньше, может закоммитить строку
+с меньшим updated_at уже после этого запроса, а часы серверов могут
+расходиться. Клиент применяет сначала deleted, затем строки.
+'''
+import base64
+import binascii
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from . import encoders
+from . import serializers
+from .models import Category, SubTask, Task, Tombstone
+
+
+class TokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Sync token has expired, sync again without since'
+    default_code = 'token_expired'
+
+
+# ключ ответа -> (модель, сериализатор, вид в Tombstone, только свои)
+FEEDS = {
+    'tasks': (Task, serializers.SyncTaskSerializer, 'task', True),
+    'subtasks': (SubTask, serializers.SubTaskSerializer, 'subtask', True),
+    'categories': (Category, serializers.CategorySerializer, 'category', False),
+}
+DELETED = 'deleted'
+
+
+def encode_token(cursors):
+    raw = json.dumps(
+        {name: [value.isoformat(), pk] for name, (value, pk) in cursors.items()},
+        separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_token(token):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token.encode()))
+        cursors = {
+            name: (parse_datetime(raw[name][0]), int(raw[name][1]))
+            for name in [*FEEDS, DELETED]}
+    except (binascii.Error, KeyError, IndexError, TypeError, ValueError,
+            UnicodeDecodeError):
+        raise ValidationError({'since': ['Invalid sync token']})
+    if any(value is None for value, _ in cursors.values()):
+        raise ValidationError({'since': ['Invalid sync token']})
+    return cursors
+
+
+def after(queryset, field, cursor):
+    if cursor is None:
+        return queryset.order_by(field, 'pk')
+    value, pk = cursor
+    return queryset.filter(
+        Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+    ).order_by(field, 'pk')
+
+
+def next_cursor(cursor, keys, has_more, horizon):
+    '''
+    Курсор следующего запроса. Без продолжения он не заходит дальше
+    horizon - строки за ним будут отданы ещё раз.
+    '''
+    if has_more:
+        return keys[-1]
+    limit = (horizon, 0)
+    if keys:
+        limit = min(keys[-1], limit)
+    return limit if cursor is None else max(cursor, limit)
+
+
+def feed(queryset, serializer_class, cursor, limit, context):
+    '''
+    Страница изменений: (данные, ключи (updated_at, id) строк).
+    '''
+    queryset = after(queryset, 'updated_at', cursor)
+    serializer = serializer_class(context=context)
+    encoder = (settings.FAST_LIST_SERIALIZATION
+               and encoders.get_encoder(serializer))
+    if encoder:
+        pk = encoder.columns[0]
+        columns = [*encoder.columns]
+        if 'updated_at' not in columns:
+            columns.append('updated_at')
+        rows = list(queryset.values(*columns)[:limit + 1])
+        keys = [(row['updated_at'], row[pk]) for row in rows]
+        return encoder.encode(rows[:limit]), keys
+    objects = list(
+        serializers.eager_queryset(queryset, serializer)[:limit + 1])
+    keys = [(obj.updated_at, obj.pk) for obj in objects]
+    data = serializer_class(objects[:limit], many=True, context=context).data
+    return data, keys
+
+
+def changes(user, token=None, context=None):
+    now = timezone.now()
+    horizon = now - timedelta(seconds=settings.SYNC_SAFETY_WINDOW)
+    if token:
+        cursors = decode_token(token)
+        expires = now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        if cursors[DELETED][0] < expires:
+            # удаления старше SYNC_TOMBSTONE_DAYS уже стёрты
+            raise TokenExpired()
+    else:
+        # при полной синхронизации прошлые удаления не нужны
+        cursors = dict.fromkeys(FEEDS)
+        cursors[DELETED] = (horizon, 0)
+    limit = settings.SYNC_PAGE_SIZE
+    data = {}
+    next_cursors = {}
+    has_more = False
+    for name, (model, serializer_class, kind, own) in FEEDS.items():
+        queryset = model.objects.all()
+        if own:
+            queryset = queryset.filter(owner=user)
+        data[name], keys = feed(
+            queryset, serializer_class, cursors[name], limit, context)
+        more = len(keys) > limit
+        next_cursors[name] = next_cursor(
+            cursors[name], keys[:limit], more, horizon)
+        has_more = has_more or more
+
+    tombstones = after(
+        Tombstone.objects.filter(Q(owner_id=user.pk) | Q(owner_id=None)),
+        'deleted_at', cursors[DELETED])
+    rows = list(tombstones.values_list(
+        'deleted_at', 'pk', 'kind', 'object_id')[:limit + 1])
+    deleted = {name: [] for name in FEEDS}
+    names = {kind: name for name, (_, _, kind, _) in FEEDS.items()}
+    for _, _, kind, object_id in rows[:limit]:
+        if kind in names:
+            deleted[names[kind]].append(object_id)
+    more = len(rows) > limit
+    next_cursors[DELETED] = next_cursor(
+        cursors[DELETED], [row[:2] for row in rows[:limit]], more, horizon)
+    has_more = has_more or more
+
+    return {
+        'next': encode_token(next_cursors),
+        'has_more': has_more,
+        **data,
+        DELETED: deleted,
+    }
+
+
+def prune_tombstones(now=None):
+    now = now or timezone.now()
+    expires = now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=expires).delete()
+    return deleted
@@ -1,3 +1,1866 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import sqlite3
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache as django_cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Max, Min
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from . import authentication
+from . import encoders
+from . import hashing
+from . import importer
+from . import jobs
+from . import models
+from . import pagination
+from .db import pool
+from . import profiling
+from . import routers
+from . import revocation
+from . import serializers
+from . import statistics
+from . import sync
+from . import views
+from . import admin as admin_module
+from . import analytics
+from .admin import update_deadline
 
-# Create your tests here.
+
+class KeysetPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        for i in range(7):
+            models.Task.objects.create(title=f'task {i}', owner=cls.user)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [task['id'] for task in response.data['results']]
+            url = response.data['next_link']
+        return ids
+
+    def test_cursor_walks_all_rows_once(self):
+        url = reverse('task-list-create') + '?cursor='
+        ids = self.walk(url)
+        expected = list(models.Task.objects.order_by(
+            '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_cursor_ascending_ordering(self):
+        url = reverse('task-list-create') + '?cursor=&ordering=created_at'
+        ids = self.walk(url)
+        expected = list(models.Task.objects.order_by(
+            'created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_count_modes(self):
+        url = reverse('task-list-create')
+        response = self.client.get(url + '?cursor=')
+        self.assertIsNone(response.data['count'])
+        response = self.client.get(url + '?cursor=&count=exact')
+        self.assertEqual(response.data['count'], 7)
+        response = self.client.get(url + '?cursor=&count=approx')
+        self.assertGreaterEqual(response.data['count'], 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('task-list-create') + '?cursor=xx')
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_mode_unchanged(self):
+        response = self.client.get(reverse('task-list-create'))
+        self.assertEqual(response.data['count'], 7)
+        self.assertIn('next', response.data)
+
+
+class TaskQueryCountTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        categories = [
+            models.Category.objects.create(name=f'category {i}')
+            for i in range(3)]
+        for i in range(20):
+            task = models.Task.objects.create(
+                title=f'task {i}', owner=cls.user)
+            task.categories.set(categories)
+            for j in range(2):
+                models.SubTask.objects.create(
+                    title=f'subtask {i}-{j}', task=task, owner=cls.user)
+
+    def count_queries(self, url, page_size):
+        with mock.patch.object(
+                pagination.KeysetPageNumberPagination, 'page_size', page_size):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), page_size)
+        return len(context)
+
+    def test_nested_subtasks_returned(self):
+        response = self.client.get(reverse('task-list-create'))
+        task = response.data['results'][0]
+        self.assertEqual(len(task['sub_tasks']), 2)
+        self.assertEqual(len(task['categories']), 3)
+
+    def test_task_list_query_count_is_flat(self):
+        url = reverse('task-list-create')
+        self.assertEqual(
+            self.count_queries(url, 2), self.count_queries(url, 10))
+
+    def test_user_task_list_query_count_is_flat(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('user-tasks')
+        self.assertEqual(
+            self.count_queries(url, 2), self.count_queries(url, 10))
+
+
+class TaskStatisticsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+
+    def create_task(self, title, **kwargs):
+        return models.Task.objects.create(
+            title=title, owner=self.user, **kwargs)
+
+    def test_counters_follow_writes(self):
+        past = timezone.now() - timedelta(days=1)
+        self.create_task('a')
+        task = self.create_task('b', deadline=past)
+        task.status = models.StatusType.DONE
+        task.save()
+        loaded = models.Task.objects.get(title='a')
+        loaded.deadline = past
+        loaded.save()
+        self.create_task('c').delete()
+        self.assertEqual(statistics.read(), {
+            'tasks': 2,
+            'tasks_by_status': [
+                {'status': 'New', 'tasks_count': 1},
+                {'status': 'Done', 'tasks_count': 1},
+            ],
+            'tasks_lt_now': 2,
+        })
+        self.assertEqual(statistics.reconcile(), {})
+
+    def test_overdue_deltas_use_last_sweep(self):
+        now = timezone.now()
+        statistics.refresh_overdue(now - timedelta(hours=2))
+        # дедлайн наступил после пересчёта - задача в счётчике не учтена
+        task = self.create_task('a', deadline=now - timedelta(hours=1))
+        self.assertEqual(statistics.read()['tasks_lt_now'], 0)
+        statistics.refresh_overdue()
+        self.assertEqual(statistics.read()['tasks_lt_now'], 1)
+        statistics.refresh_overdue(now - timedelta(hours=2))
+        task.delete()
+        self.assertEqual(statistics.read()['tasks_lt_now'], 0)
+        self.assertEqual(statistics.reconcile(), {})
+
+    def test_statistics_endpoint_is_single_query(self):
+        self.create_task('a')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('task-statistics'))
+        self.assertEqual(response.data['tasks'], 1)
+
+    def test_reconcile_fixes_drift(self):
+        self.create_task('a')
+        models.Task.objects.update(status=models.StatusType.BLOCKED)
+        self.assertEqual(statistics.reconcile(), {
+            'status_1': (1, 0), 'status_4': (0, 1)})
+        self.assertEqual(
+            statistics.read()['tasks_by_status'],
+            [{'status': 'Blocked', 'tasks_count': 1}])
+
+
+class ResponseCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        cls.category = models.Category.objects.create(name='category')
+        cls.task = models.Task.objects.create(title='task', owner=cls.user)
+
+    def setUp(self):
+        django_cache.clear()
+
+    def assertCached(self, url):
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            return self.client.get(url)
+
+    def test_task_detail_invalidated_by_subtask(self):
+        url = reverse('task-retrieve-update-destroy', args=[self.task.pk])
+        self.assertEqual(self.assertCached(url).data['sub_tasks'], [])
+        models.SubTask.objects.create(
+            title='subtask', task=self.task, owner=self.user)
+        self.assertEqual(len(self.client.get(url).data['sub_tasks']), 1)
+
+    def test_other_task_write_keeps_entry(self):
+        url = reverse('task-retrieve-update-destroy', args=[self.task.pk])
+        self.client.get(url)
+        models.Task.objects.create(title='other', owner=self.user)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_count_tasks_invalidated_by_m2m(self):
+        url = reverse('category-count-tasks')
+        self.assertEqual(self.assertCached(url).data[0]['task_count'], 0)
+        self.task.categories.add(self.category)
+        self.assertEqual(self.client.get(url).data[0]['task_count'], 1)
+        self.category.tasks.clear()
+        self.assertEqual(self.client.get(url).data[0]['task_count'], 0)
+
+    def test_category_list_varies_on_query(self):
+        url = reverse('category-list')
+        self.assertCached(url)
+        response = self.client.get(url + '?page=2')
+        self.assertEqual(response.status_code, 404)
+        models.Category.objects.create(name='second')
+        self.assertEqual(self.client.get(url).data['count'], 2)
+
+    def test_entry_per_renderer(self):
+        url = reverse('category-list')
+        etag = self.assertCached(url)['ETag']
+        # browsable API не получает ETag и 304 JSON-представления
+        response = self.client.get(
+            url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+# Фоновая синхронизация отзывов не читает БД, пока тест пишет RevokedToken
+@override_settings(REVOCATION_SYNC_INTERVAL=0)
+class TokenCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+
+    def setUp(self):
+        authentication.verified_tokens.clear()
+        authentication.refreshed_tokens.clear()
+        authentication.user_snapshots.clear()
+        response = self.client.post(
+            reverse('signin'), {'username': 'user', 'password': 'pass'})
+        self.access_token = response.data['access_token']
+
+    def test_token_verified_once(self):
+        with mock.patch(
+                'myapp.authentication.RevocableAccessToken',
+                wraps=authentication.RevocableAccessToken) as access_token:
+            for _ in range(3):
+                response = self.client.get(reverse('user-tasks'))
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(access_token.call_count, 1)
+
+    def test_user_loaded_once(self):
+        self.client.get(reverse('user-tasks'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('user-tasks'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            [q for q in context.captured_queries if 'auth_user' in q['sql']])
+
+    def test_user_change_drops_snapshot(self):
+        self.client.get(reverse('user-tasks'))
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('user-tasks'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_reuses_new_access_token(self):
+        # параллельные запросы со старым refresh-токеном получают ту же пару
+        refresh_token = self.client.cookies['refresh_token'].value
+        self.client.cookies.pop('access_token')
+        first = self.client.get(reverse('user-tasks'))
+        # значения до того, как клиент перепишет общие с ответом куки
+        issued = [first.cookies[name].value
+                  for name in ('access_token', 'refresh_token')]
+        self.client.cookies.pop('access_token')
+        self.client.cookies['refresh_token'] = refresh_token
+        second = self.client.get(reverse('user-tasks'))
+        self.assertEqual(issued, [
+            second.cookies[name].value
+            for name in ('access_token', 'refresh_token')])
+        self.assertNotEqual(issued[1], refresh_token)
+
+
+class BulkWriteTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        cls.other = User.objects.create_user(username='other', password='pass')
+        cls.category = models.Category.objects.create(name='category')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create(self):
+        items = [
+            {'title': f'task {i}', 'categories': [self.category.pk]}
+            for i in range(50)]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse('task-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 50)
+        self.assertLess(len(context), 30)
+        self.assertEqual(
+            self.category.tasks.filter(owner=self.user).count(), 50)
+        self.assertEqual(statistics.read()['tasks'], 50)
+
+    def test_bulk_create_is_atomic(self):
+        items = [{'title': 'task 1'}, {'status': 99}]
+        response = self.client.post(reverse('task-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {'status': 424})
+        self.assertEqual(response.data[1]['status'], 400)
+        self.assertFalse(models.Task.objects.exists())
+
+    def test_duplicate_titles_reported_per_item(self):
+        models.Task.objects.create(title='Taken', owner=self.other)
+        items = [{'title': 'free'}, {'title': 'taken'},
+                 {'title': 'same'}, {'title': 'SAME'}]
+        response = self.client.post(reverse('task-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [result['status'] for result in response.data], [424, 400, 424, 400])
+        self.assertIn('title', response.data[1]['errors'])
+        self.assertNotIn('UNIQUE', str(response.data))
+
+        first = models.Task.objects.create(title='first', owner=self.user)
+        second = models.Task.objects.create(title='second', owner=self.user)
+        items = [{'id': first.pk, 'title': 'TAKEN'},
+                 {'id': second.pk, 'title': 'first'}]
+        response = self.client.patch(reverse('task-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [result['status'] for result in response.data], [400, 424])
+        # заголовок, который пакет освобождает, можно занять
+        items[0]['title'] = 'renamed'
+        response = self.client.patch(reverse('task-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_create_subtasks(self):
+        task = models.Task.objects.create(title='task', owner=self.user)
+        items = [{'title': 'a', 'task': task.pk}, {'title': 'b', 'task': 0}]
+        response = self.client.post(
+            reverse('subtask-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('task', response.data[1]['errors'])
+        items[1]['task'] = task.pk
+        response = self.client.post(
+            reverse('subtask-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(task.subtasks.count(), 2)
+
+    def test_bulk_update_enforces_ownership(self):
+        own = models.Task.objects.create(title='own', owner=self.user)
+        foreign = models.Task.objects.create(title='foreign', owner=self.other)
+        items = [
+            {'id': own.pk, 'status': models.StatusType.DONE},
+            {'id': foreign.pk, 'status': models.StatusType.DONE}]
+        response = self.client.patch(
+            reverse('task-bulk'), items, format='json')
+        self.assertEqual(response.status_code, 403)
+        own.refresh_from_db()
+        self.assertEqual(own.status, models.StatusType.NEW)
+
+        response = self.client.patch(
+            reverse('task-bulk'), items[:1], format='json')
+        self.assertEqual(response.status_code, 200)
+        own.refresh_from_db()
+        self.assertEqual(own.status, models.StatusType.DONE)
+        self.assertEqual(statistics.reconcile(), {})
+
+    def test_bulk_delete(self):
+        tasks = [
+            models.Task.objects.create(title=f'task {i}', owner=self.user)
+            for i in range(3)]
+        ids = [task.pk for task in tasks]
+        response = self.client.delete(
+            reverse('task-bulk'), ids + [0], format='json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.delete(reverse('task-bulk'), ids, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(models.Task.objects.exists())
+        self.assertEqual(statistics.read()['tasks'], 0)
+
+
+class ExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        category = models.Category.objects.create(name='category')
+        for i in range(5):
+            task = models.Task.objects.create(
+                title=f'task {i}', owner=cls.user,
+                status=models.StatusType.DONE if i % 2 else
+                models.StatusType.NEW)
+            task.categories.add(category)
+
+    def read(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_serializer(self):
+        lines = self.read(reverse('task-export')).splitlines()
+        rows = [json.loads(line) for line in lines]
+        expected = serializers.TaskSerializer(
+            models.Task.objects.all(), many=True).data
+        for row, item in zip(rows, expected):
+            item = dict(item)
+            item.pop('sub_tasks')
+            self.assertEqual(row, item)
+        self.assertEqual(len(rows), 5)
+
+    def test_filters_and_csv(self):
+        content = self.read(
+            reverse('task-export') + '?status=5&output=csv&ordering=created_at')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['title'] for row in rows], ['task 1', 'task 3'])
+
+    def test_chunked_reads(self):
+        with mock.patch.object(views.TaskExportView, 'export_chunk_size', 2):
+            lines = self.read(reverse('task-export')).splitlines()
+        self.assertEqual(len(lines), 5)
+
+    def test_keyset_pages_keep_order(self):
+        # одинаковый created_at - порядок внутри него по pk
+        models.Task.objects.update(created_at=timezone.now())
+        for ordering in ('-created_at', 'created_at'):
+            expected = list(models.Task.objects.order_by(
+                ordering, 'pk').values_list('title', flat=True))
+            with mock.patch.object(
+                    views.TaskExportView, 'export_chunk_size', 2), \
+                    CaptureQueriesContext(connection) as context:
+                lines = self.read(
+                    reverse('task-export') + f'?ordering={ordering}')
+            self.assertEqual(
+                [json.loads(line)['title'] for line in lines.splitlines()],
+                expected)
+            pages = [query['sql'] for query in context.captured_queries
+                     if 'LIMIT 2' in query['sql']]
+            self.assertEqual(len(pages), 3)
+
+
+class FullTextSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        models.Task.objects.create(
+            title='Write report', description='quarterly numbers',
+            owner=cls.user)
+        models.Task.objects.create(
+            title='Review numbers', description='report report report',
+            owner=cls.user)
+        models.Task.objects.create(
+            title='Plan vacation', owner=cls.user)
+
+    def search(self, query, url='task-list-create'):
+        response = self.client.get(reverse(url), {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [task['title'] for task in response.data['results']]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(
+            self.search('repo'), ['Review numbers', 'Write report'])
+        self.assertEqual(self.search('report quarter'), ['Write report'])
+        self.assertEqual(self.search('"unbalanced'), [])
+
+    def test_prefix_not_substring(self):
+        # полнотекстовый поиск находит начало слова, но не середину
+        self.assertEqual(self.search('eport'), [])
+        self.assertCountEqual(
+            self.search('numb'), ['Review numbers', 'Write report'])
+        # короткие слова ищутся подстрокой
+        self.assertEqual(self.search('ew'), ['Review numbers'])
+
+    def test_search_without_words(self):
+        # только кавычки и разделители - искать нечего
+        for query in ('"""', ',', '""'):
+            self.assertEqual(self.search(query), [])
+        self.assertEqual(len(self.search(' ')), 3)
+        # пунктуация без слов - подстрокой, как короткие слова
+        for query in ('...', 'a-b'):
+            self.assertEqual(self.search(query), [])
+        models.Task.objects.create(
+            title='Fix a-b test...', owner=self.user)
+        self.assertEqual(self.search('...'), ['Fix a-b test...'])
+        self.assertEqual(self.search('a-b'), ['Fix a-b test...'])
+
+    def test_index_follows_writes(self):
+        task = models.Task.objects.get(title='Plan vacation')
+        task.title = 'Plan holiday'
+        task.save()
+        self.assertEqual(self.search('vacation'), [])
+        self.assertEqual(self.search('holiday'), ['Plan holiday'])
+        task.delete()
+        self.assertEqual(self.search('holiday'), [])
+
+    def test_export_search(self):
+        response = self.client.get(reverse('task-export'), {'search': 'repo'})
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(
+            [json.loads(line)['title'] for line in lines],
+            ['Review numbers', 'Write report'])
+
+    def test_subtask_search(self):
+        task = models.Task.objects.get(title='Write report')
+        models.SubTask.objects.create(
+            title='Collect data', task=task, owner=self.user)
+        self.assertEqual(
+            self.search('collect', 'subtask-list-create'), ['Collect data'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class QueryPlanTests(APITestCase):
+    '''
+    Планы запросов списков: запросы к my_app_task/my_app_subtask
+    не должны читать всю таблицу или сортировать её целиком.
+    '''
+    tables = ('my_app_task', 'my_app_subtask')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        for i in range(20):
+            task = models.Task.objects.create(
+                title=f'task {i}', owner=cls.user)
+            models.SubTask.objects.create(
+                title=f'subtask {i}', task=task, owner=cls.user)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def plans(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or not any(
+                        f'FROM "{table}"' in sql for table in self.tables):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append(
+                    (sql, [row[-1] for row in cursor.fetchall()]))
+        self.assertTrue(plans)
+        return plans
+
+    def assertIndexed(self, url):
+        for sql, plan in self.plans(url):
+            message = f'{url}: {sql}\n{plan}'
+            for table in self.tables:
+                self.assertNotIn(f'SCAN {table}', plan, message)
+            # Сортировка допустима только для строк, найденных по индексу
+            if ' LIMIT ' in sql and any('TEMP B-TREE' in s for s in plan):
+                self.assertTrue(
+                    any(s.startswith('SEARCH') for s in plan), message)
+
+    def test_task_lists(self):
+        url = reverse('task-list-create')
+        self.assertIndexed(url)
+        self.assertIndexed(url + '?ordering=created_at')
+        self.assertIndexed(url + '?status=1')
+        self.assertIndexed(url + '?deadline__lt=2000-01-01T00:00:00Z')
+        self.assertIndexed(url + '?status=1&deadline__gt=2000-01-01T00:00:00Z')
+        self.assertIndexed(url + '?cursor=')
+
+    def test_subtask_lists(self):
+        url = reverse('subtask-list-create')
+        self.assertIndexed(url)
+        self.assertIndexed(url + '?status=1')
+        self.assertIndexed(url + '?deadline__lt=2000-01-01T00:00:00Z')
+        self.assertIndexed(url + '?cursor=&ordering=created_at')
+
+    def test_user_lists(self):
+        self.client.force_authenticate(self.user)
+        self.assertIndexed(reverse('user-tasks'))
+        self.assertIndexed(reverse('user-tasks') + '?cursor=')
+        self.assertIndexed(reverse('user-subtasks'))
+
+
+class AsyncViewTests(APITestCase):
+    '''
+    Асинхронные эндпоинты отдают то же, что и синхронные.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        for i in range(4):
+            task = models.Task.objects.create(
+                title=f'task {i}', owner=cls.user)
+            models.SubTask.objects.create(
+                title=f'subtask {i}', task=task, owner=cls.user)
+
+    def setUp(self):
+        django_cache.clear()
+
+    def assertSameResponse(self, async_url, sync_url):
+        expected = self.client.get(sync_url)
+        response = async_to_sync(self.async_client.get)(async_url)
+        self.assertEqual(response.status_code, expected.status_code)
+        # ссылки пагинации отличаются только префиксом пути
+        content = response.content.decode().replace('/api/async/', '/api/')
+        self.assertEqual(
+            json.loads(content), json.loads(expected.content.decode()))
+
+    def test_lists(self):
+        for query in ('', '?page=2', '?status=1&ordering=created_at',
+                      '?page=9', '?status=x'):
+            self.assertSameResponse(
+                reverse('async-task-list') + query,
+                reverse('task-list-create') + query)
+        self.assertSameResponse(
+            reverse('async-subtask-list') + '?page=2',
+            reverse('subtask-list-create') + '?page=2')
+
+    def test_details(self):
+        task = models.Task.objects.first()
+        self.assertSameResponse(
+            reverse('async-task-detail', args=[task.pk]),
+            reverse('task-retrieve-update-destroy', args=[task.pk]))
+        self.assertSameResponse(
+            reverse('async-task-detail', args=[0]),
+            reverse('task-retrieve-update-destroy', args=[0]))
+        subtask = models.SubTask.objects.first()
+        self.assertSameResponse(
+            reverse('async-subtask-detail', args=[subtask.pk]),
+            reverse('subtask-retrieve-update-destroy', args=[subtask.pk]))
+
+    def test_statistics_and_counts(self):
+        self.assertSameResponse(
+            reverse('async-task-statistics'), reverse('task-statistics'))
+        self.assertSameResponse(
+            reverse('async-count-tasks'), reverse('category-count-tasks'))
+
+
+class BenchmarkCommandTests(APITestCase):
+    def test_seed_and_benchmark(self):
+        call_command(
+            'seed_data', users=2, categories=3, tasks=30, subtasks=2,
+            batch_size=7, stdout=io.StringIO())
+        self.assertEqual(models.Task.objects.count(), 30)
+        self.assertEqual(models.SubTask.objects.count(), 60)
+        self.assertEqual(statistics.read()['tasks'], 30)
+
+        username = User.objects.first().username
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / 'results.json'
+            call_command(
+                'benchmark', username=username, requests=3, warmup=1,
+                output=str(output), stdout=io.StringIO())
+            results = json.loads(output.read_text())
+            call_command(
+                'benchmark', username=username, requests=3, warmup=0,
+                endpoint=['tasks'], compare=str(output), stdout=io.StringIO())
+        self.assertEqual(
+            set(results['endpoints']),
+            {'tasks', 'tasks-cursor', 'subtasks', 'task-statistics',
+             'count-tasks', 'signin'})
+        for stats in results['endpoints'].values():
+            self.assertEqual(stats['errors'], 0)
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(results['endpoints']['task-statistics']['queries'], 1)
+
+
+class ProfilingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        models.Task.objects.create(title='task', owner=cls.user)
+
+    def setUp(self):
+        profiling.metrics.reset()
+
+    def timings(self, response):
+        result = {}
+        for item in response['Server-Timing'].split(', '):
+            name, *params = item.split(';')
+            result[name] = dict(param.split('=', 1) for param in params)
+        return result
+
+    def test_server_timing_header(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('user-tasks'))
+        timings = self.timings(response)
+        self.assertEqual(
+            set(timings), {'total', 'jwt', 'db', 'serializer'})
+        self.assertEqual(
+            timings['db']['desc'], f'"{len(context)} queries"')
+        self.assertGreater(float(timings['serializer']['dur']), 0)
+        self.assertGreaterEqual(
+            float(timings['total']['dur']), float(timings['db']['dur']))
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('task-list-create'))
+        self.client.get(reverse('task-list-create'))
+        self.client.force_login(User.objects.create_user(
+            username='staff', password='pass', is_staff=True))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        labels = 'method="GET",route="api/tasks/"'
+        self.assertIn(
+            f'api_request_duration_seconds_count{{{labels}}} 2', text)
+        self.assertIn(
+            f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+            text)
+        self.assertIn(f'api_request_queries_total{{{labels}}}', text)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_require_staff_or_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.logout()
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_sampling_disabled(self):
+        response = self.client.get(reverse('task-list-create'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(profiling.metrics.render().count('_count'), 0)
+
+
+class CategoryTaskCountTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        cls.first = models.Category.objects.create(name='first')
+        cls.second = models.Category.objects.create(name='second')
+
+    def counts(self):
+        return dict(models.Category.objects.values_list('name', 'task_count'))
+
+    def test_counts_follow_relations(self):
+        task = models.Task.objects.create(title='a', owner=self.user)
+        other = models.Task.objects.create(title='b', owner=self.user)
+        task.categories.add(self.first, self.second)
+        task.categories.add(self.first)
+        self.second.tasks.add(other)
+        self.assertEqual(self.counts(), {'first': 1, 'second': 2})
+        task.categories.remove(self.second, self.second)
+        self.second.tasks.remove(task)
+        self.assertEqual(self.counts(), {'first': 1, 'second': 1})
+        task.categories.set([self.second])
+        self.assertEqual(self.counts(), {'first': 0, 'second': 2})
+        self.second.tasks.clear()
+        self.assertEqual(self.counts(), {'first': 0, 'second': 0})
+        other.categories.add(self.first)
+        other.delete()
+        self.assertEqual(self.counts(), {'first': 0, 'second': 0})
+
+    def test_bulk_writes_and_rebuild(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('task-bulk'), [
+            {'title': 'a', 'categories': [self.first.pk, self.second.pk]},
+            {'title': 'b', 'categories': [self.first.pk]},
+        ], format='json')
+        self.assertEqual(self.counts(), {'first': 2, 'second': 1})
+        self.client.patch(reverse('task-bulk'), [
+            {'id': response.data[0]['id'], 'categories': [self.second.pk]},
+        ], format='json')
+        self.assertEqual(self.counts(), {'first': 1, 'second': 1})
+        models.Category.objects.update(task_count=7)
+        call_command('rebuild_category_counts', stdout=io.StringIO())
+        self.assertEqual(self.counts(), {'first': 1, 'second': 1})
+
+    def test_count_tasks_reads_column(self):
+        django_cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('category-count-tasks'))
+        self.assertEqual(response.data[0], {
+            'category_id': self.first.pk,
+            'category_name': 'first',
+            'task_count': 0})
+
+
+class ConditionalRequestTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        cls.task = models.Task.objects.create(title='task', owner=cls.user)
+
+    def setUp(self):
+        django_cache.clear()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('task-retrieve-update-destroy', args=[self.task.pk])
+
+    def test_detail_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        # из кеша ответов - без запросов
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        django_cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # подзадача входит в представление задачи
+        models.SubTask.objects.create(
+            title='subtask', task=self.task, owner=self.user)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.patch(
+            self.url, {'status': 2}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url)['ETag'], response['ETag'])
+        response = self.client.patch(
+            self.url, {'status': 3}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 2)
+
+    def test_list_not_modified(self):
+        for url in (reverse('task-list-create') + '?status=1',
+                    reverse('user-tasks') + '?cursor=',
+                    reverse('subtask-list-create')):
+            response = self.client.get(url)
+            etag = response['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+        url = reverse('task-list-create')
+        etag = self.client.get(url)['ETag']
+        self.client.patch(
+            reverse('task-bulk'), [{'id': self.task.pk, 'status': 1}],
+            format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_category_not_modified(self):
+        url = reverse('category-list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        models.Category.objects.create(name='new')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+class FastSerializationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        # порядок категорий в ответе - по имени, а не по id
+        second = models.Category.objects.create(name='b')
+        first = models.Category.objects.create(name='a')
+        for i in range(5):
+            task = models.Task.objects.create(
+                title=f'task {i}', owner=cls.user, status=i % 5 + 1,
+                description=None if i % 2 else 'описание \u2028 "quoted"')
+            task.categories.set([second, first][:i % 3])
+            for j in range(i % 3):
+                models.SubTask.objects.create(
+                    title=f'subtask {i}-{j}', task=task, owner=cls.user)
+
+    def assertSameContent(self, url):
+        with CaptureQueriesContext(connection) as fast_queries:
+            fast = self.client.get(url)
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            with CaptureQueriesContext(connection) as slow_queries:
+                slow = self.client.get(url)
+        self.assertEqual(fast.status_code, 200, url)
+        self.assertEqual(fast.content, slow.content, url)
+        self.assertLessEqual(len(fast_queries), len(slow_queries), url)
+        return fast
+
+    def test_schema_parity(self):
+        for serializer in (serializers.TaskSerializer(),
+                           serializers.SubTaskSerializer()):
+            self.assertIsNotNone(encoders.get_encoder(serializer))
+        self.client.force_authenticate(self.user)
+        for name in ('task-list-create', 'subtask-list-create',
+                     'user-tasks', 'user-subtasks'):
+            url = reverse(name)
+            self.assertSameContent(url)
+            self.assertSameContent(url + '?page=2')
+            self.assertSameContent(url + '?ordering=created_at')
+            response = self.assertSameContent(url + '?cursor=')
+            self.assertSameContent(response.data['next_link'])
+        url = reverse('task-list-create')
+        self.assertSameContent(url + '?search=task&status=1')
+        response = self.assertSameContent(url)
+        categories = {
+            item['title']: item['categories']
+            for item in response.data['results']}
+        first, second = models.Category.objects.order_by('name')
+        self.assertEqual(categories['task 2'], [first.pk, second.pk])
+
+    def test_renderer_parity(self):
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import FastJSONRenderer
+        with override_settings(FAST_LIST_SERIALIZATION=False):
+            data = self.client.get(reverse('task-list-create')).data
+        for value in (data, {'text': 'юникод \u2028\u2029 \x00 "'},
+                      {'when': timezone.now(), 'big': 2 ** 70}, [],
+                      {'ratio': 0.1, 'total': 123456789.125, 'zero': -0.0}):
+            self.assertEqual(
+                FastJSONRenderer().render(value), JSONRenderer().render(value))
+        # экспонента записывается иначе, значение то же
+        value = {'large': 1e16, 'small': 1e-7}
+        fast = FastJSONRenderer().render(value)
+        self.assertEqual(fast, b'{"large":1e16,"small":1e-7}')
+        self.assertEqual(json.loads(fast), json.loads(
+            JSONRenderer().render(value)))
+        self.assertEqual(
+            FastJSONRenderer().render(
+                data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4'))
+
+class SparseFieldsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        category = models.Category.objects.create(name='category')
+        for i in range(4):
+            task = models.Task.objects.create(
+                title=f'task {i}', description='x' * 1000, owner=cls.user)
+            task.categories.add(category)
+            models.SubTask.objects.create(
+                title=f'subtask {i}', task=task, owner=cls.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_fields(self):
+        for fast in (True, False):
+            with override_settings(FAST_LIST_SERIALIZATION=fast):
+                for query in ('?', '?cursor=&'):
+                    response, queries = self.get(
+                        reverse('task-list-create') + query
+                        + 'fields=title,status,deadline')
+                    for item in response.data['results']:
+                        self.assertEqual(
+                            list(item), ['id', 'deadline', 'title', 'status'])
+                    # без description и без запросов за категориями/подзадачами
+                    self.assertFalse(
+                        [sql for sql in queries if 'description' in sql
+                         or 'my_app_subtask' in sql or 'categories' in sql])
+        response, _ = self.get(
+            reverse('subtask-list-create') + '?fields=title')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title'])
+
+    def test_exclude(self):
+        response, queries = self.get(
+            reverse('task-list-create') + '?exclude=description,sub_tasks')
+        item = response.data['results'][0]
+        self.assertNotIn('description', item)
+        self.assertNotIn('sub_tasks', item)
+        self.assertIn('categories', item)
+        self.assertFalse([sql for sql in queries if 'description' in sql])
+
+    def test_detail_and_errors(self):
+        task = models.Task.objects.get(title='task 0')
+        url = reverse('task-retrieve-update-destroy', args=[task.pk])
+        response = self.client.get(url + '?fields=title')
+        self.assertEqual(response.data, {'id': task.pk, 'title': 'task 0'})
+        response = self.client.get(
+            url + '?fields=title', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(
+            reverse('task-list-create') + '?fields=title,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)
+
+        # запись ?fields= не затрагивает
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse('task-list-create') + '?fields=title',
+            {'title': 'new', 'description': 'text'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['description'], 'text')
+
+class JobQueueTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+
+    def run_jobs(self):
+        return jobs.work(worker='test', once=True)
+
+    @override_settings(JOB_BATCH_SIZE=2)
+    def test_deadline_move_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        models.Task.objects.bulk_create(
+            models.Task(title=f't{i}', owner=self.user, deadline=past)
+            for i in range(5))
+        statistics.reconcile()
+        self.assertEqual(statistics.read()['tasks_lt_now'], 5)
+        # в payload - запрос выборки, pk в запросе админки не читаются
+        with self.assertNumQueries(1):
+            update_deadline(mock.Mock(), None, models.Task.objects.filter(
+                deadline__lt=timezone.now()))
+        job = models.Job.objects.get(name='move_deadlines')
+        self.assertNotIn('ranges', job.payload)
+        self.assertEqual(models.Task.objects.filter(
+            deadline__gt=timezone.now()).count(), 0)
+
+        self.run_jobs()
+        job.refresh_from_db()
+        # отрезки pk считает задача и сохраняет для повторов
+        first, last = models.Task.objects.aggregate(
+            first=Min('pk'), last=Max('pk')).values()
+        self.assertEqual(job.payload['ranges'], [[first, last]])
+        self.assertEqual(job.status, models.JobStatus.DONE)
+        self.assertEqual((job.progress, job.total), (5, 5))
+        self.assertEqual(job.result, {'moved': 5})
+        self.assertEqual(models.Task.objects.filter(
+            deadline__gt=timezone.now()).count(), 5)
+        self.assertEqual(statistics.read()['tasks_lt_now'], 0)
+
+    def test_pk_ranges(self):
+        ranges = jobs.pk_ranges([1, 2, 3, 7, 9, 10])
+        self.assertEqual(ranges, [[1, 3], [7, 7], [9, 10]])
+        self.assertEqual(list(jobs.range_batches(ranges, 2, 2)), [
+            (3, 3, 3), (4, 7, 7), (6, 9, 10)])
+
+    @override_settings(JOB_BATCH_SIZE=1)
+    def test_retry_resumes_from_progress(self):
+        tasks = models.Task.objects.bulk_create(
+            models.Task(title=f't{i}', owner=self.user) for i in range(3))
+        calls = []
+
+        original_update = models.Task.objects.none().__class__.update
+
+        def flaky_update(queryset, **kwargs):
+            if queryset.model is models.Task:
+                calls.append(kwargs)
+                if len(calls) == 2:
+                    raise RuntimeError('connection lost')
+            return original_update(queryset, **kwargs)
+
+        job = jobs.enqueue(
+            'move_deadlines', model='myapp.Task',
+            ranges=jobs.pk_ranges(task.pk for task in tasks),
+            deadline=timezone.now().isoformat())
+        with mock.patch('django.db.models.QuerySet.update', flaky_update):
+            jobs.run(jobs.claim('test'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.JobStatus.QUEUED)
+        self.assertEqual(job.progress, 1)
+        self.assertIn('connection lost', job.error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        # повтор - с задержкой, затем продолжение со второго пакета
+        self.assertIsNone(jobs.claim('test'))
+        with mock.patch('django.db.models.QuerySet.update', flaky_update):
+            jobs.run(jobs.claim('test', now=job.run_at))
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.JobStatus.DONE)
+        self.assertEqual((job.attempts, job.progress), (2, 3))
+
+    def test_failed_after_max_attempts(self):
+        job = jobs.enqueue(
+            'move_deadlines', model='myapp.Missing', ranges=[[1, 1]],
+            deadline=timezone.now().isoformat())
+        job.attempts = job.max_attempts - 1
+        job.save()
+        jobs.run(jobs.claim('test'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.JobStatus.FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_stale_job_is_reclaimed(self):
+        job = jobs.enqueue('recompute_statistics')
+        self.assertEqual(jobs.claim('dead').pk, job.pk)
+        self.assertIsNone(jobs.claim('test'))
+        later = timezone.now() + timedelta(hours=1)
+        self.assertEqual(jobs.claim('test', now=later).pk, job.pk)
+
+    def test_periodic_sweep_scheduled_once(self):
+        jobs.schedule_periodic()
+        jobs.schedule_periodic()
+        self.assertEqual(
+            models.Job.objects.filter(name='sweep_overdue').count(), 1)
+        self.run_jobs()
+        jobs.schedule_periodic()
+        self.assertEqual(
+            models.Job.objects.filter(name='sweep_overdue').count(), 1)
+
+    def test_periodic_checks_only_when_due(self):
+        now = timezone.now()
+        due = {}
+        jobs.schedule_periodic(now, due)
+        self.assertEqual(
+            due['sweep_overdue'],
+            now + timedelta(seconds=settings.OVERDUE_SWEEP_INTERVAL))
+        # до срока воркер не обращается к БД
+        with self.assertNumQueries(0):
+            jobs.schedule_periodic(now + timedelta(seconds=1), due)
+
+    def test_run_jobs_command(self):
+        models.Task.objects.create(title='a', owner=self.user)
+        models.Task.objects.update(status=models.StatusType.BLOCKED)
+        call_command('reconcile_statistics', queue=True, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('run_jobs', once=True, stdout=out)
+        job = models.Job.objects.get(name='recompute_statistics')
+        self.assertEqual(job.status, models.JobStatus.DONE)
+        self.assertEqual(
+            job.result['fixed'], {'status_1': [1, 0], 'status_4': [0, 1]})
+        self.assertIn('Processed 5 job(s)', out.getvalue())
+
+
+class ImportTasksTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        cls.category = models.Category.objects.create(name='Work')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write_csv(self, rows):
+        path = self.directory / 'tasks.csv'
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['title', 'status', 'deadline', 'categories'])
+            writer.writerows(rows)
+        return str(path)
+
+    def test_resume_after_failure(self):
+        future = (timezone.now() + timedelta(days=1)).isoformat()
+        past = (timezone.now() - timedelta(days=1)).isoformat()
+        path = self.write_csv([
+            ['a', '1', '', 'work'],
+            ['b', '2', past, ''],
+            ['c', '5', future, 'Work|Home'],
+            ['A', '1', '', ''],
+            ['d', '9', '', ''],
+            ['e', '3', future, 'home'],
+        ])
+        rejects = str(self.directory / 'rejects.ndjson')
+        save_batch = importer.save_batch
+        calls = []
+
+        def failing_save_batch(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+            return save_batch(*args)
+
+        with mock.patch.object(importer, 'save_batch', failing_save_batch):
+            with self.assertRaisesMessage(CommandError, 'after row 2'):
+                call_command('import_tasks', path, owner='user',
+                             batch_size=2, create_categories=True,
+                             rejects=rejects, stdout=io.StringIO())
+        self.assertEqual(models.Task.objects.count(), 1)
+
+        out = io.StringIO()
+        call_command('import_tasks', path, owner='user', batch_size=2,
+                     create_categories=True, rejects=rejects, stdout=out)
+        self.assertIn('Resuming', out.getvalue())
+        self.assertIn('Imported 3 row(s), rejected 3', out.getvalue())
+        self.assertEqual(
+            sorted(models.Task.objects.values_list('title', flat=True)),
+            ['a', 'c', 'e'])
+        self.assertEqual(
+            list(models.Task.objects.get(title='c').categories.values_list(
+                'name', flat=True)), ['Home', 'Work'])
+        rejected = [json.loads(line) for line in open(rejects)]
+        self.assertEqual([item['row'] for item in rejected], [2, 4, 5])
+        self.assertIn('deadline', rejected[0]['errors'])
+        self.assertIn('title', rejected[1]['errors'])
+
+        # счётчики поддерживаются без reconcile
+        self.assertEqual(statistics.reconcile(), {})
+        self.assertEqual(
+            dict(models.Category.objects.values_list('name', 'task_count')),
+            {'Home': 2, 'Work': 2})
+        job = models.Job.objects.get(name='import_tasks')
+        self.assertEqual(job.status, models.JobStatus.DONE)
+        self.assertEqual((job.progress, job.total), (6, 6))
+
+    def test_subtasks_from_ndjson_via_queue(self):
+        task = models.Task.objects.create(title='parent', owner=self.user)
+        path = self.directory / 'subtasks.ndjson'
+        path.write_text(
+            json.dumps({'title': 's1', 'task': task.pk}) + '\n\n'
+            + json.dumps({'title': 's2', 'task': 0}) + '\n'
+            + json.dumps(['not an object']) + '\n')
+        call_command('import_tasks', str(path), owner='user',
+                     model='subtask', queue=True, stdout=io.StringIO())
+        self.assertEqual(models.SubTask.objects.count(), 0)
+        jobs.work(worker='test', once=True)
+        job = models.Job.objects.get(name='import_tasks')
+        self.assertEqual(job.result, {'created': 1, 'rejected': 2})
+        subtask = models.SubTask.objects.get()
+        self.assertEqual((subtask.title, subtask.owner), ('s1', self.user))
+
+    def test_category_names_must_be_strings(self):
+        models.Category.objects.create(name='5')
+        path = self.directory / 'tasks.ndjson'
+        path.write_text('\n'.join(json.dumps(row) for row in [
+            {'title': 'numbers', 'categories': [5]},
+            {'title': 'names', 'categories': ['5', 'work']},
+            {'title': 'bad', 'status': 9},
+        ]))
+        rejects = str(self.directory / 'rejects.ndjson')
+        # ошибки many=True списком - формат DRF до 3.17
+        rest_framework = {
+            **settings.REST_FRAMEWORK, 'LIST_SERIALIZER_ERRORS_AS_DICT': False}
+        with override_settings(REST_FRAMEWORK=rest_framework), \
+                warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            call_command('import_tasks', str(path), owner='user',
+                         rejects=rejects, stdout=io.StringIO())
+        self.assertEqual(
+            list(models.Task.objects.values_list('title', flat=True)),
+            ['names'])
+        rejected = [json.loads(line) for line in open(rejects)]
+        self.assertEqual([item['row'] for item in rejected], [1, 3])
+        self.assertEqual(
+            rejected[0]['errors'], {'categories': ['Expected a list of names']})
+        self.assertIn('status', rejected[1]['errors'])
+
+
+@override_settings(SYNC_SAFETY_WINDOW=0)
+class SyncTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        cls.other = User.objects.create_user(username='other', password='pass')
+        cls.category = models.Category.objects.create(name='Work')
+        cls.task = models.Task.objects.create(title='task', owner=cls.user)
+        cls.task.categories.add(cls.category)
+        cls.subtask = models.SubTask.objects.create(
+            title='subtask', task=cls.task, owner=cls.user)
+        models.Task.objects.create(title='foreign', owner=cls.other)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since=None, status=200):
+        response = self.client.get(
+            reverse('sync'), {'since': since} if since else {})
+        self.assertEqual(response.status_code, status, response.data)
+        return response.data
+
+    def test_full_then_incremental(self):
+        data = self.sync()
+        self.assertEqual([item['title'] for item in data['tasks']], ['task'])
+        self.assertNotIn('sub_tasks', data['tasks'][0])
+        self.assertEqual(data['tasks'][0]['categories'], [self.category.pk])
+        self.assertEqual(
+            [item['title'] for item in data['subtasks']], ['subtask'])
+        self.assertEqual(
+            [item['name'] for item in data['categories']], ['Work'])
+        self.assertFalse(data['has_more'])
+
+        idle = self.sync(data['next'])
+        self.assertEqual(
+            (idle['tasks'], idle['subtasks'], idle['categories']),
+            ([], [], []))
+        self.assertEqual(idle['deleted'], {
+            'tasks': [], 'subtasks': [], 'categories': []})
+
+        subtask_pk, category_pk = self.subtask.pk, self.category.pk
+        self.subtask.delete()
+        self.category.delete()
+        models.Task.objects.filter(owner=self.other).delete()
+        changed = self.sync(idle['next'])
+        # удаление подзадачи и категории меняет представление задачи
+        self.assertEqual(
+            [(item['title'], item['categories'])
+             for item in changed['tasks']], [('task', [])])
+        self.assertEqual(changed['subtasks'], [])
+        self.assertEqual(changed['deleted'], {
+            'tasks': [], 'subtasks': [subtask_pk],
+            'categories': [category_pk]})
+
+    def test_paging(self):
+        models.Task.objects.bulk_create(
+            models.Task(title=f'bulk {i}', owner=self.user)
+            for i in range(4))
+        titles = []
+        token = None
+        with override_settings(SYNC_PAGE_SIZE=2):
+            for _ in range(5):
+                data = self.sync(token)
+                titles += [item['title'] for item in data['tasks']]
+                token = data['next']
+                if not data['has_more']:
+                    break
+        self.assertEqual(sorted(titles), [
+            'bulk 0', 'bulk 1', 'bulk 2', 'bulk 3', 'task'])
+        self.assertEqual(self.sync(token)['tasks'], [])
+
+    @override_settings(SYNC_SAFETY_WINDOW=60)
+    def test_recent_rows_are_repeated(self):
+        data = self.sync()
+        again = self.sync(data['next'])
+        self.assertEqual([item['title'] for item in again['tasks']], ['task'])
+
+    def test_invalid_and_expired_tokens(self):
+        self.assertIn('since', self.sync('garbage', status=400))
+        expired = sync.encode_token({
+            name: (timezone.now() - timedelta(days=365), 0)
+            for name in [*sync.FEEDS, sync.DELETED]})
+        self.sync(expired, status=410)
+
+    def test_prune_tombstones(self):
+        self.subtask.delete()
+        models.Tombstone.objects.update(
+            deleted_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(sync.prune_tombstones(), 1)
+
+
+class TaskAnalyticsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = User.objects.create_user(username='first', password='pass')
+        cls.second = User.objects.create_user(username='second', password='pass')
+        cls.admin = User.objects.create_user(
+            username='admin', password='pass', is_staff=True)
+        cls.category = models.Category.objects.create(name='work')
+        cls.today = timezone.localdate()
+
+        def at(days_ago, hour):
+            return analytics.day_start(
+                cls.today - timedelta(days=days_ago)) + timedelta(hours=hour)
+
+        # (владелец, категория, создана, дедлайн, завершена) в днях назад
+        plan = [
+            (cls.first, None, at(5, 2), at(3, 1), at(1, 3)),
+            (cls.first, cls.category, at(4, 2), at(-10, 1), None),
+            (cls.second, cls.category, at(2, 2), at(1, 1), None),
+            (cls.second, None, None, at(-10, 1), None),
+        ]
+        for number, (owner, category, created, deadline, completed) in (
+                enumerate(plan)):
+            task = models.Task.objects.create(
+                title=f'task {number}', owner=owner, deadline=deadline,
+                status=models.StatusType.DONE if completed
+                else models.StatusType.NEW)
+            if category:
+                task.categories.add(category)
+            models.Task.objects.filter(pk=task.pk).update(
+                created_at=created or task.created_at, completed_at=completed)
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def report(self, **params):
+        response = self.client.get(reverse('task-analytics'), {
+            'start': str(self.today - timedelta(days=5)), **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def series(self, data, metric):
+        return [bucket[metric] for bucket in data['buckets']]
+
+    def test_daily_series(self):
+        data = self.report()
+        self.assertEqual(self.series(data, 'created'), [1, 1, 0, 1, 0, 1])
+        self.assertEqual(self.series(data, 'completed'), [0, 0, 0, 0, 1, 0])
+        self.assertEqual(self.series(data, 'open'), [1, 2, 2, 3, 2, 3])
+        self.assertEqual(self.series(data, 'overdue'), [0, 0, 1, 1, 1, 1])
+        self.assertEqual(
+            [(item['username'], item['created'], item['completed'],
+              item['open'], item['overdue']) for item in data['by_owner']],
+            [('first', 2, 1, 1, 0), ('second', 2, 0, 2, 1)])
+        self.assertEqual(
+            [(item['name'], item['created'], item['open'], item['overdue'])
+             for item in data['by_category']], [('work', 2, 2, 1)])
+        category = self.report(category=self.category.pk)
+        self.assertEqual(self.series(category, 'open'), [0, 1, 1, 2, 2, 2])
+
+    def test_rollup_matches_live_and_only_today_is_live(self):
+        live = self.report(period='week')
+        self.assertGreater(analytics.rollup(), 0)
+        self.assertEqual(
+            analytics.rolled_until(), self.today - timedelta(days=1))
+        with mock.patch(
+                'myapp.analytics.snapshot', wraps=analytics.snapshot) as snapshot, \
+                mock.patch(
+                    'myapp.analytics.events', wraps=analytics.events) as events:
+            rolled = self.report(period='week')
+        self.assertEqual(rolled, live)
+        # сегодняшний день - от среза вчерашнего, без пересчёта истории
+        snapshot.assert_not_called()
+        self.assertEqual(
+            events.call_args.args[0], analytics.day_start(self.today))
+        self.assertEqual(sum(self.series(rolled, 'created')), 4)
+        self.assertEqual(self.series(rolled, 'open')[-1], 3)
+
+    def test_rollup_rows_are_unique(self):
+        written = analytics.rollup()
+        self.assertEqual(
+            analytics.rollup(first=self.today - timedelta(days=10)), written)
+        self.assertEqual(models.TaskRollup.objects.count(), written)
+        row = models.TaskRollup.objects.filter(category=None).first()
+        row.pk = None
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            row.save()
+
+    def test_completed_at_follows_status(self):
+        task = models.Task.objects.create(title='toggle', owner=self.first)
+        self.assertIsNone(task.completed_at)
+        task.status = models.StatusType.DONE
+        task.save()
+        self.assertIsNotNone(task.completed_at)
+        task.status = models.StatusType.IN_PROGRESS
+        task.save()
+        task.refresh_from_db()
+        self.assertIsNone(task.completed_at)
+        # клиент не задаёт completed_at сам
+        self.client.force_authenticate(self.first)
+        response = self.client.patch(
+            reverse('task-retrieve-update-destroy', args=[task.pk]),
+            {'status': models.StatusType.DONE,
+             'completed_at': '2000-01-01T00:00:00Z'})
+        self.assertEqual(response.status_code, 200)
+        task.refresh_from_db()
+        self.assertGreater(task.completed_at.year, 2000)
+
+    def test_users_see_only_their_tasks(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse('task-analytics'))
+        self.assertEqual(response.status_code, 401)
+        self.client.force_authenticate(self.second)
+        data = self.report(owner=self.first.pk)
+        self.assertEqual(
+            [item['username'] for item in data['by_owner']], ['second'])
+        self.assertEqual(sum(self.series(data, 'created')), 2)
+
+    def test_invalid_params(self):
+        for params in ({'period': 'year'}, {'start': '17.10.2026'},
+                       {'start': '2026-10-17', 'end': '2026-10-01'}):
+            response = self.client.get(reverse('task-analytics'), params)
+            self.assertEqual(response.status_code, 400)
+
+
+class AdminScalingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', password='pass')
+        cls.task = models.Task.objects.create(title='task', owner=cls.admin)
+        models.SubTask.objects.bulk_create(
+            models.SubTask(title=f'subtask {i}', task=cls.task,
+                           owner=cls.admin)
+            for i in range(30))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_changelist_without_count(self):
+        response, queries = self.get(
+            reverse('admin:myapp_subtask_changelist'))
+        self.assertFalse(
+            [sql for sql in queries if 'COUNT(' in sql.upper()], queries)
+        self.assertEqual(response.context['cl'].result_count, 30)
+        # задача и владелец - в том же запросе, что и строки
+        rows = [sql for sql in queries
+                if sql.startswith('SELECT "my_app_subtask"."id"')]
+        self.assertEqual(len(rows), 1, queries)
+        self.assertIn('JOIN "my_app_task"', rows[0])
+        self.assertIn('JOIN "auth_user"', rows[0])
+
+    def test_filtered_count_is_bounded(self):
+        paginator = pagination.EstimatedCountPaginator(
+            models.SubTask.objects.filter(task=self.task).order_by('pk'), 3)
+        paginator.max_count = 10
+        self.assertEqual(paginator.count, 10)
+
+    def test_change_page_limits_inline(self):
+        response, _ = self.get(reverse(
+            'admin:myapp_task_change', args=[self.task.pk]))
+        limit = admin_module.LatestInlineFormSet.limit
+        self.assertEqual(
+            response.context['inline_admin_formsets'][1].formset
+            .initial_form_count(), limit)
+        self.assertContains(response, f'?task__id__exact={self.task.pk}')
+        # владелец - autocomplete, а не <select> со всеми пользователями
+        self.assertContains(response, 'admin-autocomplete')
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class PasswordHashingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            cls.user = User.objects.create_user(
+                username='user', password='pass')
+
+    def setUp(self):
+        # отдельный пул на тест - его размер берётся из настроек
+        patcher = mock.patch.object(hashing, '_pool', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def signin(self, password='pass'):
+        return self.client.post(
+            reverse('signin'), {'username': 'user', 'password': password})
+
+    def test_signin_and_signup(self):
+        self.assertEqual(self.signin().status_code, 200)
+        self.assertEqual(self.signin('wrong').status_code, 401)
+        response = self.client.post(reverse('signup'), {
+            'username': 'new', 'password': 'secret', 'email': 'A@B.COM'})
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(username='new')
+        self.assertTrue(user.check_password('secret'))
+        self.assertEqual(user.email, 'A@b.com')
+
+    def test_hash_upgraded_on_signin(self):
+        with override_settings(PASSWORD_HASH_ITERATIONS=1500):
+            self.assertEqual(self.signin().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1500$'))
+        self.assertTrue(self.user.check_password('pass'))
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0)
+    def test_saturated_pool_rejects_fast(self):
+        # единственное место занято - вход сразу получает 503
+        _, slots = hashing.get_pool()
+        self.assertTrue(slots.acquire(blocking=False))
+        try:
+            response = self.signin()
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.signin().status_code, 200)
+
+    @override_settings(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0)
+    def test_saturated_pool_in_admin_login(self):
+        _, slots = hashing.get_pool()
+        self.assertTrue(slots.acquire(blocking=False))
+        try:
+            response = self.client.post(
+                reverse('admin:login'),
+                {'username': 'user', 'password': 'pass'})
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(REVOCATION_SYNC_INTERVAL=0, REVOCATION_ROTATION_GRACE=0)
+class RevocationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+
+    def setUp(self):
+        revocation.reset()
+        authentication.verified_tokens.clear()
+        authentication.refreshed_tokens.clear()
+        response = self.client.post(
+            reverse('signin'), {'username': 'user', 'password': 'pass'})
+        self.access_token = response.data['access_token']
+        self.refresh_token = response.data['refresh_token']
+
+    def refresh(self, refresh_token):
+        return self.client.post(
+            reverse('token_refresh'), {'refresh': refresh_token})
+
+    def test_signout_revokes_tokens(self):
+        self.assertEqual(self.client.get(reverse('user-tasks')).status_code, 200)
+        self.assertEqual(self.client.post(reverse('signout')).status_code, 204)
+        self.client.cookies.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token}')
+        # проверка отзыва не обращается к БД
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('user-tasks'))
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse([q for q in context.captured_queries
+                          if 'revokedtoken' in q['sql']])
+        self.client.credentials()
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 401)
+
+    def test_middleware_rotates_refresh_token(self):
+        self.client.cookies.pop('access_token')
+        response = self.client.get(reverse('user-tasks'))
+        self.assertEqual(response.status_code, 200)
+        new_refresh = response.cookies['refresh_token'].value
+        self.assertNotEqual(new_refresh, self.refresh_token)
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 401)
+        self.assertEqual(self.refresh(new_refresh).status_code, 200)
+
+    def test_refresh_view_rotates(self):
+        response = self.refresh(self.refresh_token)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], self.refresh_token)
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 401)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    @override_settings(REVOCATION_ROTATION_GRACE=60)
+    def test_rotated_token_valid_during_grace(self):
+        response = self.refresh(self.refresh_token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 200)
+
+    def test_sync_loads_revocations_of_other_processes(self):
+        token = authentication.RevocableRefreshToken(self.refresh_token)
+        now = timezone.now()
+        models.RevokedToken.objects.create(
+            jti=token['jti'], revoked_from=now,
+            expires_at=revocation.from_timestamp(token['exp']))
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 200)
+        self.assertEqual(revocation.sync(), 1)
+        self.assertTrue(revocation.is_revoked(token['jti']))
+        # следующая синхронизация читает только новые строки
+        models.RevokedToken.objects.filter(jti=token['jti']).update(
+            created_at=now - timedelta(hours=1))
+        self.assertEqual(revocation.sync(), 0)
+
+    def test_expired_entries_pruned(self):
+        now = time.time()
+        revoked = revocation.RevocationSet(1 << 10, 3)
+        revoked.add('expired', now - 20, now - 10)
+        revoked.add('active', now - 20, now + 10)
+        self.assertTrue(revoked.is_revoked('expired'))
+        self.assertEqual(revoked.prune(now), 1)
+        self.assertFalse(revoked.is_revoked('expired'))
+        self.assertTrue(revoked.is_revoked('active'))
+
+        models.RevokedToken.objects.create(
+            jti='old', revoked_from=timezone.now() - timedelta(days=2),
+            expires_at=timezone.now() - timedelta(days=1))
+        jobs.enqueue('prune_revoked_tokens')
+        jobs.work(worker='test', once=True)
+        self.assertFalse(models.RevokedToken.objects.filter(jti='old').exists())
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = revocation.BloomFilter(1 << 12, 5)
+        keys = [f'jti-{number}' for number in range(300)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        misses = sum(f'other-{number}' in bloom for number in range(1000))
+        self.assertLess(misses, 100)
+
+    def test_sync_thread_started_on_first_check(self):
+        # процессы без проверки токенов (migrate, run_jobs) потока не держат
+        with mock.patch.object(revocation, '_thread', None), \
+                mock.patch.object(revocation.threading, 'Thread') as thread:
+            revocation.is_revoked('jti')
+            revocation.is_revoked('jti')
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once_with()
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **options):
+        options = {
+            'size': 1, 'max_overflow': 1, 'recycle': 3600, 'timeout': 0.1,
+            **options}
+        return pool.ConnectionPool(
+            lambda: sqlite3.connect(':memory:', check_same_thread=False),
+            **options)
+
+    def test_reuse_and_limits(self):
+        connections_pool = self.make_pool()
+        first = connections_pool.checkout()
+        second = connections_pool.checkout()
+        with self.assertRaises(pool.PoolTimeout):
+            connections_pool.checkout()
+        connections_pool.checkin(second)
+        connections_pool.checkin(first)
+        # overflow-соединение закрыто, постоянное возвращено в пул
+        self.assertEqual(connections_pool.opened, 1)
+        self.assertIs(connections_pool.checkout(), second)
+
+    def test_recycle_and_ping(self):
+        connections_pool = self.make_pool(recycle=0)
+        first = connections_pool.checkout()
+        connections_pool.checkin(first)
+        self.assertIsNot(connections_pool.checkout(), first)
+
+        def ping(connection):
+            raise sqlite3.OperationalError('gone')
+        connections_pool = self.make_pool(ping=ping)
+        first = connections_pool.checkout()
+        connections_pool.checkin(first)
+        self.assertIsNot(connections_pool.checkout(), first)
+
+    def test_pooled_backend(self):
+        from myapp.db.backends.sqlite3.base import DatabaseWrapper
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {
+                **connection.settings_dict,
+                'ENGINE': 'myapp.db.backends.sqlite3',
+                'NAME': str(Path(directory) / 'pool.db'),
+                'POOL': {'SIZE': 1, 'MAX_OVERFLOW': 0},
+            }
+            wrapper = DatabaseWrapper(settings_dict, alias='pool_test')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('CREATE TABLE t (id INTEGER)')
+                raw = wrapper.connection
+                wrapper.close()
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM t')
+                self.assertIs(wrapper.connection, raw)
+            finally:
+                wrapper.close()
+                pool.close_pools()
+
+    def test_close_in_atomic_releases_slot(self):
+        from myapp.db.backends.sqlite3.base import DatabaseWrapper
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {
+                **connection.settings_dict,
+                'ENGINE': 'myapp.db.backends.sqlite3',
+                'NAME': str(Path(directory) / 'pool.db'),
+                'POOL': {'SIZE': 1, 'MAX_OVERFLOW': 0},
+            }
+            wrapper = DatabaseWrapper(settings_dict, alias='pool_test')
+            try:
+                with mock.patch.object(
+                        transaction, 'get_connection', return_value=wrapper):
+                    with transaction.atomic():
+                        wrapper.ensure_connection()
+                        connections_pool = wrapper.connection_pool
+                        wrapper.close()
+                        self.assertEqual(connections_pool.opened, 0)
+                self.assertIsNone(wrapper.connection)
+                # место освободилось - соединение открывается снова
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                self.assertEqual(connections_pool.opened, 1)
+            finally:
+                wrapper.close()
+                pool.close_pools()
+
+
+class ReplicaRoutingTests(APITestCase):
+    '''
+    Реплика - отдельный файл SQLite со своими данными, чтобы было видно,
+    из какой базы пришёл ответ.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['replica1'] = {
+            **connection.settings_dict,
+            'NAME': str(Path(cls.directory.name) / 'replica.db'),
+        }
+        # алиас появляется только здесь, поэтому не в атрибуте класса
+        cls.databases = {'default', 'replica1'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+        cls.directory.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='pass')
+        cls.replica_pk = 1000
+        target = sqlite3.connect(connections['replica1'].settings_dict['NAME'])
+        with target, connection.cursor() as cursor:
+            # схема без полнотекстовых таблиц и триггеров
+            cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' "
+                "AND sql IS NOT NULL AND name NOT LIKE '%fts%' "
+                "AND name NOT LIKE 'sqlite_%'")
+            for sql, in cursor.fetchall():
+                target.execute(sql)
+            target.execute(
+                'INSERT INTO auth_user (id, password, is_superuser, username, '
+                'first_name, last_name, email, is_staff, is_active, '
+                'date_joined) VALUES (?, ?, 0, ?, ?, ?, ?, 0, 1, ?)',
+                [cls.user.pk, cls.user.password, cls.user.username, '', '',
+                 '', timezone.now().isoformat()])
+            target.execute(
+                'INSERT INTO "my_app_task" (id, title, description, status, '
+                'deadline, created_at, updated_at, owner_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [cls.replica_pk, 'replica only', '', models.StatusType.NEW,
+                 timezone.now().isoformat(), timezone.now().isoformat(),
+                 timezone.now().isoformat(), cls.user.pk])
+        target.close()
+
+    def setUp(self):
+        django_cache.clear()
+
+    def detail(self):
+        return self.client.get(
+            reverse('task-retrieve-update-destroy', args=[self.replica_pk]))
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_reads_go_to_replica(self):
+        response = self.detail()
+        self.assertEqual(response.data['title'], 'replica only')
+        self.assertFalse(
+            models.Task.objects.filter(pk=self.replica_pk).exists())
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_read_your_writes(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse('task-list-create'), {'title': 'new'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('db_primary_until', response.cookies)
+        # клиент только что писал - читает с основной базы
+        self.assertEqual(self.detail().status_code, 404)
+        self.client.cookies.pop('db_primary_until')
+        self.assertEqual(self.detail().status_code, 200)
+
+    def test_without_replicas(self):
+        self.assertEqual(self.detail().status_code, 404)
+
+    @override_settings(DATABASE_REPLICAS=['replica1', 'replica2', 'replica3'])
+    def test_replica_chosen_once_per_request(self):
+        token = routers.routing_state.set(routers.RoutingState(use_replica=True))
+        try:
+            router = routers.ReplicaRouter()
+            chosen = {router.db_for_read(models.Task) for _ in range(20)}
+        finally:
+            routers.routing_state.reset(token)
+        self.assertEqual(len(chosen), 1)
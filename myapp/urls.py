@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from . import async_views
 from . import views
 
 
@@ -14,6 +15,18 @@ urlpatterns = [
         views.TaskListCreateView.as_view(),
         name='task-list-create'),
 
+    # http://127.0.0.1:8000/api/tasks/bulk
+    path(
+        'tasks/bulk/',
+        views.TaskBulkView.as_view(),
+        name='task-bulk'),
+
+    # http://127.0.0.1:8000/api/tasks/export
+    path(
+        'tasks/export/',
+        views.TaskExportView.as_view(),
+        name='task-export'),
+
     # http://127.0.0.1:8000/api/tasks/1
     path(
         'tasks/<int:pk>',
@@ -26,12 +39,30 @@ urlpatterns = [
         views.TaskStatisticsView.as_view(),
         name='task-statistics'),
 
+    # http://127.0.0.1:8000/api/tasks/analytics?start=2026-01-01&period=week
+    path(
+        'tasks/analytics/',
+        views.TaskAnalyticsView.as_view(),
+        name='task-analytics'),
+
     # http://127.0.0.1:8000/api/subtasks
     path(
         'subtasks/',
         views.SubTaskListCreateView.as_view(),
         name='subtask-list-create'),
 
+    # http://127.0.0.1:8000/api/subtasks/bulk
+    path(
+        'subtasks/bulk/',
+        views.SubTaskBulkView.as_view(),
+        name='subtask-bulk'),
+
+    # http://127.0.0.1:8000/api/subtasks/export
+    path(
+        'subtasks/export/',
+        views.SubTaskExportView.as_view(),
+        name='subtask-export'),
+
     # http://127.0.0.1:8000/api/subtasks/1
     path(
         'subtasks/<int:pk>',
@@ -52,6 +83,19 @@ urlpatterns = [
     path('signin/', views.SigninView.as_view(), name='signin'),
     path('signout/', views.signout, name='signout'),
 
+    # асинхронные варианты чтения для ASGI (myapp.async_views)
+    path('async/tasks/', async_views.task_list, name='async-task-list'),
+    path('async/tasks/<int:pk>', async_views.task_detail, name='async-task-detail'),
+    path('async/tasks/statistics/', async_views.task_statistics, name='async-task-statistics'),
+    path('async/subtasks/', async_views.subtask_list, name='async-subtask-list'),
+    path('async/subtasks/<int:pk>', async_views.subtask_detail, name='async-subtask-detail'),
+    path('async/categories/count_tasks/', async_views.count_tasks, name='async-count-tasks'),
+
+    # http://127.0.0.1:8000/api/sync/?since=<token>
+    path('sync/', views.SyncView.as_view(), name='sync'),
+
+    path('_metrics', views.metrics, name='metrics'),
+
     path('user-tasks/', views.UserTaskListView.as_view(), name='user-tasks'),
     path('user-subtasks/', views.UserSubTaskListView.as_view(), name='user-subtasks'),
 ]
@@ -1,39 +1,90 @@
+import hmac
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db.models import Count
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework import status, views, generics, viewsets
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from . import analytics
+from . import authentication
+from . import cache
+from . import encoders
+from . import export
+from . import filters
+from . import importer
 from . import models
+from . import pagination
 from . import serializers
 from . import permissions
-
-
-class CustomPagination(PageNumberPagination):
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,
-            'page': self.page.number,
-            'previous_link': self.get_previous_link(),
-            'next_link': self.get_next_link(),
-            'results': data
-        })
+from . import profiling
+from . import routers
+from . import signals
+from . import statistics
+from . import sync
+
+
+class EagerLoadingMixin:
+    '''
+    Строит queryset с предзагрузкой связей по полям сериализатора
+    и только с нужными ему колонками (?fields=, ?exclude=).
+    '''
+    def get_queryset(self):
+        serializer = self.get_serializer()
+        keyset_field = getattr(self.paginator, 'keyset_field', None)
+        return serializers.sparse_queryset(
+            serializers.eager_queryset(super().get_queryset(), serializer),
+            serializer, keep=[keyset_field] if keyset_field else [])
+
+
+class FastListMixin:
+    '''
+    Список через values() и кодировщик строк (myapp.encoders) вместо
+    сериализатора - тот же JSON без создания экземпляров моделей.
+    Отключается FAST_LIST_SERIALIZATION = False.
+    '''
+    def list(self, request, *args, **kwargs):
+        encoder = (settings.FAST_LIST_SERIALIZATION
+                   and encoders.get_encoder(self.get_serializer()))
+        if not encoder:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        columns = [*encoder.columns, *queryset.query.extra_select]
+        keyset_field = getattr(self.paginator, 'keyset_field', None)
+        if keyset_field and keyset_field not in columns:
+            columns.append(keyset_field)
+        queryset = queryset.prefetch_related(None).values(*columns)
+        page = self.paginate_queryset(queryset)
+        with profiling.timer('serializer'):
+            data = encoder.encode(list(queryset) if page is None else page)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = models.Category.objects.all()
     serializer_class = serializers.CategorySerializer
 
+    @cache.cached_response('category')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache.cached_response('category')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     # http://127.0.0.1:8000/api/categories/count_tasks/
     @action(detail=False, methods=['get'])
+    @cache.cached_response('category')
     def count_tasks(self, request):
-        tasks_by_category = models.Category.objects.annotate(
-            task_count=Count('tasks'))
+        # task_count хранится в Category (см. rebuild_category_counts)
+        tasks_by_category = models.Category.objects.only('name', 'task_count')
         data = [
             {
                 "category_id": category.id,
@@ -45,11 +96,196 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return Response(data)
 
 
-class SubTaskListCreateView(generics.ListCreateAPIView):
+class BulkWriteMixin:
+    '''
+    Пакетная запись списка объектов в одной транзакции:
+    POST - создание, PUT/PATCH - изменение (у каждого элемента есть id),
+    DELETE - удаление по списку id. Если хотя бы один элемент не прошёл
+    проверку, ничего не записывается, а в ответе для каждого элемента
+    указан его статус (424 - элемент корректен, но пакет отклонён).
+    '''
+    permission_classes = [IsAuthenticated, permissions.IsOwnerOrReadOnly]
+    conflict_message = 'The batch conflicts with a concurrent write, try again'
+
+    def get_items(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({'detail': 'Expected a list of items'})
+        return request.data
+
+    def failure_response(self, results):
+        codes = {result['status'] for result in results} - {424}
+        code = codes.pop() if len(codes) == 1 else status.HTTP_400_BAD_REQUEST
+        return Response(results, status=code)
+
+    def success_response(self, instances, code):
+        pks = [instance.pk for instance in instances]
+        objects = self.get_queryset().in_bulk(pks)
+        data = self.get_serializer(
+            [objects[pk] for pk in pks], many=True).data
+        return Response(
+            [{'id': item['id'], 'status': code, 'data': item} for item in data],
+            status=code)
+
+    def serializer_errors(self, serializer, items):
+        errors = serializer.errors
+        if isinstance(errors, dict):
+            if not all(isinstance(index, int) for index in errors):
+                raise ValidationError(errors)
+            errors = [errors.get(index) for index in range(len(items))]
+        return [
+            {'status': 400, 'errors': item} if item else {'status': 424}
+            for item in errors]
+
+    def title_errors(self, items, exclude=()):
+        '''
+        Дубликаты заголовков (без учёта регистра) в пакете и в БД -
+        {номер элемента: ошибки}; проверяются до записи, чтобы ответить
+        по каждому элементу, а не IntegrityError на весь пакет.
+        '''
+        errors = {}
+        importer.duplicate_titles(
+            self.get_queryset().model,
+            [item if isinstance(item, dict) else {} for item in items],
+            errors, exclude)
+        return errors
+
+    def item_errors(self, serializer, items, exclude=()):
+        '''
+        Результаты по элементам или None, если пакет можно записывать.
+        '''
+        valid = serializer.is_valid()
+        duplicates = self.title_errors(items, exclude)
+        if valid and not duplicates:
+            return None
+        if valid:
+            results = [{'status': 424} for _ in items]
+        else:
+            results = self.serializer_errors(serializer, items)
+        for index, errors in duplicates.items():
+            if results[index]['status'] == 424:
+                results[index] = {'status': 400, 'errors': errors}
+            else:
+                for name, messages in errors.items():
+                    results[index]['errors'].setdefault(name, messages)
+        return results
+
+    def get_objects(self, ids):
+        '''
+        Загружает объекты по id одним запросом и проверяет права на каждый.
+        Возвращает (объекты, результаты по элементам или None).
+        '''
+        objects = self.get_queryset().select_for_update().in_bulk(
+            [pk for pk in ids if isinstance(pk, int)])
+        results = []
+        seen = set()
+        for pk in ids:
+            if not isinstance(pk, int) or pk in seen:
+                results.append({'status': 400, 'errors': {
+                    'id': ['A unique integer id is required.']}})
+            elif pk not in objects:
+                results.append({'id': pk, 'status': 404, 'errors': {
+                    'detail': 'Not found.'}})
+            elif not all(
+                    permission.has_object_permission(
+                        self.request, self, objects[pk])
+                    for permission in self.get_permissions()):
+                results.append({'id': pk, 'status': 403, 'errors': {
+                    'detail': 'You do not have permission to '
+                              'perform this action.'}})
+            else:
+                results.append({'id': pk, 'status': 424})
+            seen.add(pk)
+        if any(result['status'] != 424 for result in results):
+            return objects, results
+        return objects, None
+
+    def bulk_saved(self, instances, created):
+        pass
+
+    # http://127.0.0.1:8000/api/tasks/bulk/
+    # [{"title": "task 1"}, {"title": "task 2"}]
+    def post(self, request, *args, **kwargs):
+        items = self.get_items(request)
+        serializer = self.get_serializer(data=items, many=True)
+        results = self.item_errors(serializer, items)
+        if results:
+            return self.failure_response(results)
+        try:
+            with transaction.atomic():
+                instances = serializer.save(owner=request.user)
+                if not serializer.signals_sent:
+                    self.bulk_saved(instances, created=True)
+        except IntegrityError:
+            # параллельная запись успела занять заголовок после проверки
+            raise ValidationError({'detail': self.conflict_message})
+        return self.success_response(instances, status.HTTP_201_CREATED)
+
+    # [{"id": 1, "status": 5}, {"id": 2, "status": 5}]
+    def put(self, request, *args, **kwargs):
+        return self.bulk_update(request, partial=False)
+
+    def patch(self, request, *args, **kwargs):
+        return self.bulk_update(request, partial=True)
+
+    def bulk_update(self, request, partial):
+        items = self.get_items(request)
+        ids = [item.get('id') if isinstance(item, dict) else None
+               for item in items]
+        try:
+            with transaction.atomic():
+                objects, results = self.get_objects(ids)
+                if results:
+                    return self.failure_response(results)
+                serializer = self.get_serializer(
+                    [objects[pk] for pk in ids], data=items,
+                    many=True, partial=partial)
+                # объекты, которым пакет задаёт новый заголовок
+                renamed = [pk for pk, item in zip(ids, items) if 'title' in item]
+                results = self.item_errors(serializer, items, renamed)
+                if results:
+                    return self.failure_response(results)
+                instances = serializer.save()
+                self.bulk_saved(instances, created=False)
+        except IntegrityError:
+            raise ValidationError({'detail': self.conflict_message})
+        return self.success_response(instances, status.HTTP_200_OK)
+
+    # [1, 2, 3]
+    def delete(self, request, *args, **kwargs):
+        ids = self.get_items(request)
+        with transaction.atomic():
+            objects, results = self.get_objects(ids)
+            if results:
+                return self.failure_response(results)
+            # delete() отправляет post_delete для каждого объекта
+            self.get_queryset().filter(pk__in=ids).delete()
+        return Response(
+            [{'id': pk, 'status': 204} for pk in ids],
+            status=status.HTTP_200_OK)
+
+
+class SubTaskBulkView(BulkWriteMixin, EagerLoadingMixin, generics.GenericAPIView):
+    queryset = models.SubTask.objects.all()
+    serializer_class = serializers.SubTaskSerializer
+
+    def bulk_saved(self, instances, created):
+        signals.subtasks_saved(instances)
+
+
+class TaskBulkView(BulkWriteMixin, EagerLoadingMixin, generics.GenericAPIView):
+    queryset = models.Task.objects.all()
+    serializer_class = serializers.TaskSerializer
+
+    def bulk_saved(self, instances, created):
+        signals.tasks_saved(instances, created)
+
+
+class SubTaskListCreateView(FastListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = models.SubTask.objects.all()
     serializer_class = serializers.SubTaskSerializer
-    pagination_class = CustomPagination
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    pagination_class = pagination.CustomPagination
+    filter_backends = [
+        DjangoFilterBackend, filters.FullTextSearchFilter, OrderingFilter]
     # Фильтрация по полям status и deadline_lt:
     # http://127.0.0.1:8000/api/subtasks/?status=1
     # http://127.0.0.1:8000/api/subtasks/?deadline__lt=2024-09-27T00:00:00Z
@@ -58,7 +294,8 @@ class SubTaskListCreateView(generics.ListCreateAPIView):
         'status': ['exact'],
         'deadline': ['exact', 'gt', 'lt'],
     }
-    # Поиск по полям title и description:
+    # Поиск по полям title и description (полнотекстовый, по началу слов;
+    # слова короче трёх букв - подстрокой), см. filters.FullTextSearchFilter:
     # http://127.0.0.1:8000/api/subtasks/?search=subtask_name
     search_fields = ['title', 'description']
     # Сортировка по полю created_at:
@@ -67,20 +304,44 @@ class SubTaskListCreateView(generics.ListCreateAPIView):
     # http://127.0.0.1:8000/api/subtasks/?ordering=-created_at
     ordering_fields = ['created_at']
 
+    @cache.conditional(
+        cache.list_validators, cache.list_response_validators)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
 
-class SubTaskRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class SubTaskRetrieveUpdateDestroyView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = models.SubTask.objects.all()
     serializer_class = serializers.SubTaskSerializer
     permission_classes = [permissions.IsOwnerOrReadOnly]
 
+    @cache.cached_response('subtask:{pk}')
+    @cache.conditional(
+        cache.object_validators, cache.object_response_validators)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    # Оптимистичная блокировка: заголовок If-Match с ETag из GET
+    @cache.conditional(
+        cache.object_validators, cache.object_response_validators)
+    def put(self, request, *args, **kwargs):
+        return super().put(request, *args, **kwargs)
+
+    @cache.conditional(
+        cache.object_validators, cache.object_response_validators)
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
 
-class TaskListCreateView(generics.ListCreateAPIView):
+class TaskListCreateView(FastListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = models.Task.objects.all()
     serializer_class = serializers.TaskSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    pagination_class = pagination.KeysetPageNumberPagination
+    filter_backends = [
+        DjangoFilterBackend, filters.FullTextSearchFilter, OrderingFilter]
     # Фильтрация по полям status и deadline_lt:
     # http://127.0.0.1:8000/api/tasks/?status=1
     # http://127.0.0.1:8000/api/tasks/?deadline__lt=2024-09-27T00:00:00Z
@@ -89,7 +350,8 @@ class TaskListCreateView(generics.ListCreateAPIView):
         'status': ['exact'],
         'deadline': ['exact', 'gt', 'lt'],
     }
-    # Поиск по полям title и description:
+    # Поиск по полям title и description (полнотекстовый, по началу слов;
+    # слова короче трёх букв - подстрокой), см. filters.FullTextSearchFilter:
     # http://127.0.0.1:8000/api/tasks/?search=task_name
     search_fields = ['title', 'description']
     # Сортировка по полю created_at:
@@ -98,48 +360,176 @@ class TaskListCreateView(generics.ListCreateAPIView):
     # http://127.0.0.1:8000/api/tasks/?ordering=-created_at
     ordering_fields = ['created_at']
 
+    @cache.conditional(
+        cache.list_validators, cache.list_response_validators)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
 
-class TaskRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class TaskRetrieveUpdateDestroyView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = models.Task.objects.all()
     serializer_class = serializers.TaskSerializer
     permission_classes = [permissions.IsOwnerOrReadOnly]
 
+    @cache.cached_response('task:{pk}')
+    @cache.conditional(
+        cache.object_validators, cache.object_response_validators)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    # Оптимистичная блокировка: заголовок If-Match с ETag из GET
+    @cache.conditional(
+        cache.object_validators, cache.object_response_validators)
+    def put(self, request, *args, **kwargs):
+        return super().put(request, *args, **kwargs)
+
+    @cache.conditional(
+        cache.object_validators, cache.object_response_validators)
+    def patch(self, request, *args, **kwargs):
+        return super().patch(request, *args, **kwargs)
+
+
+class ExportMixin:
+    '''
+    Потоковая выгрузка всех строк с учётом фильтров, поиска и сортировки
+    списка. Формат задаётся параметром output: ndjson (по умолчанию) или csv.
+    '''
+    pagination_class = None
+    export_chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            raise ValidationError({'output': ['Expected ndjson or csv']})
+        queryset = self.filter_queryset(self.get_queryset())
+        opts = queryset.model._meta
+        fields = [field.name for field in opts.concrete_fields]
+        rows = export.iter_rows(
+            queryset, fields, opts.many_to_many, self.export_chunk_size)
+        if output == 'csv':
+            stream = export.csv_stream(
+                rows, fields + [field.name for field in opts.many_to_many])
+            content_type = 'text/csv'
+        else:
+            stream = export.ndjson_stream(rows)
+            content_type = 'application/x-ndjson'
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{opts.model_name}s.{output}"')
+        return response
+
+
+# http://127.0.0.1:8000/api/subtasks/export/?status=1&output=csv
+class SubTaskExportView(ExportMixin, generics.GenericAPIView):
+    queryset = models.SubTask.objects.all()
+    serializer_class = serializers.SubTaskSerializer
+    filter_backends = SubTaskListCreateView.filter_backends
+    filterset_fields = SubTaskListCreateView.filterset_fields
+    search_fields = SubTaskListCreateView.search_fields
+    ordering_fields = SubTaskListCreateView.ordering_fields
+
+
+# http://127.0.0.1:8000/api/tasks/export/?search=task_name
+class TaskExportView(ExportMixin, generics.GenericAPIView):
+    queryset = models.Task.objects.all()
+    serializer_class = serializers.TaskSerializer
+    filter_backends = TaskListCreateView.filter_backends
+    filterset_fields = TaskListCreateView.filterset_fields
+    search_fields = TaskListCreateView.search_fields
+    ordering_fields = TaskListCreateView.ordering_fields
+
 
 class TaskStatisticsView(views.APIView):
     def get(self, request):
-        data = {}
-        data['tasks'] = models.Task.objects.count()
-        tasks_by_status = models.Task.objects.values(
-            'status').annotate(task_count=Count('*'))
-        data['tasks_by_status'] = [
-            {
-                "status": models.StatusType(status['status']).label,
-                "tasks_count": status['task_count']
-            }
-            for status in tasks_by_status
-        ]
-        data['tasks_lt_now'] = models.Task.objects.filter(
-            deadline__lt=timezone.now()).count()
+        # Счётчики поддерживаются сигналами (myapp.signals) и
+        # сверяются командой manage.py reconcile_statistics
+        data = statistics.read()
         return Response(data, status=status.HTTP_200_OK)
 
 
-class UserSubTaskListView(generics.ListAPIView):
+class TaskAnalyticsView(views.APIView):
+    '''
+    Создано/завершено, burndown и просрочка по дням, неделям или месяцам
+    с разбивкой по владельцам и категориям (myapp.analytics).
+    Параметры: start, end (YYYY-MM-DD), period, owner, category.
+    Все задачи видит только персонал, остальные - только свои.
+    '''
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = analytics.parse_params(request.query_params)
+        if not request.user.is_staff:
+            params['owner'] = request.user.pk
+        return Response(analytics.report(**params), status=status.HTTP_200_OK)
+
+
+class UserSubTaskListView(FastListMixin, EagerLoadingMixin, generics.ListAPIView):
+    queryset = models.SubTask.objects.all()
     serializer_class = serializers.SubTaskSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = pagination.KeysetPageNumberPagination
 
     def get_queryset(self):
-        return models.SubTask.objects.filter(owner=self.request.user)
+        return super().get_queryset().filter(owner=self.request.user)
+
+    @cache.conditional(
+        cache.list_validators, cache.list_response_validators)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
 
-class UserTaskListView(generics.ListAPIView):
+class UserTaskListView(FastListMixin, EagerLoadingMixin, generics.ListAPIView):
+    queryset = models.Task.objects.all()
     serializer_class = serializers.TaskSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = pagination.KeysetPageNumberPagination
 
     def get_queryset(self):
-        return models.Task.objects.filter(owner=self.request.user)
+        return super().get_queryset().filter(owner=self.request.user)
+
+    @cache.conditional(
+        cache.list_validators, cache.list_response_validators)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class SyncView(views.APIView):
+    '''
+    Изменения задач, подзадач и категорий пользователя с прошлой
+    синхронизации (myapp.sync). Следующий запрос - с since=<next>,
+    пока has_more - сразу, иначе по расписанию клиента.
+    '''
+    permission_classes = [IsAuthenticated]
+
+    # http://127.0.0.1:8000/api/sync/
+    # http://127.0.0.1:8000/api/sync/?since=<next>
+    def get(self, request):
+        # курсор не должен обогнать отстающую реплику
+        routers.use_primary()
+        data = sync.changes(
+            request.user, request.query_params.get('since'),
+            context={'request': request, 'view': self})
+        return Response(data, status=status.HTTP_200_OK)
+
+
+# http://127.0.0.1:8000/api/_metrics
+# Доступ: сессия персонала (вход в админку) или
+# Authorization: Bearer <METRICS_TOKEN> для Prometheus
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    allowed = request.user.is_staff or (
+        token and hmac.compare_digest(header, f'Bearer {token}'))
+    if not allowed:
+        return HttpResponse(
+            'Staff session or metrics token required', status=403,
+            content_type='text/plain; charset=utf-8')
+    return HttpResponse(
+        profiling.metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 # authentication
@@ -153,7 +543,7 @@ class SignupView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh_token = RefreshToken.for_user(user)
+            refresh_token = authentication.RevocableRefreshToken.for_user(user)
             refresh_token_str = str(refresh_token)
             refresh_token_exp = refresh_token['exp']
             refresh_token_exp = timezone.datetime.fromtimestamp(
@@ -195,7 +585,7 @@ class SigninView(generics.GenericAPIView):
         password = request.data.get('password')
         user = authenticate(request, username=username, password=password)
         if user is not None:
-            refresh_token = RefreshToken.for_user(user)
+            refresh_token = authentication.RevocableRefreshToken.for_user(user)
             refresh_token_str = str(refresh_token)
             refresh_token_exp = refresh_token['exp']
             refresh_token_exp = timezone.datetime.fromtimestamp(
@@ -231,6 +621,12 @@ class SigninView(generics.GenericAPIView):
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def signout(request):
+    # Отзываем текущий access-токен и refresh-токен из куки или тела,
+    # иначе украденные копии действовали бы до истечения срока
+    refresh_token = (request.COOKIES.get('refresh_token')
+                     or request.data.get('refresh'))
+    authentication.revoke_tokens(
+        request.user.pk, request.auth, refresh_token)
     response = Response(status=status.HTTP_204_NO_CONTENT)
     response.delete_cookie('access_token')
     response.delete_cookie('refresh_token')
@@ -21,7 +21,8 @@ env = environ.Env(
     SECRET_KEY=(str, get_random_secret_key()),
     DEBUG=(bool, False),
     ALLOWED_HOSTS=(list, []),
-    MYSQL=(bool, False)
+    MYSQL=(bool, False),
+    RESPONSE_CACHE_TIMEOUT=(int, 300),
 )
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -64,7 +65,10 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'myapp.middleware.ProfilingMiddleware',
+    'myapp.middleware.ReplicaRoutingMiddleware',
     'myapp.middleware.JWTAuthMiddleware',
+    'myapp.middleware.HashingBusyMiddleware',
 ]
 
 ROOT_URLCONF = 'myproject.urls'
@@ -95,6 +99,83 @@ DATABASES = {
     'default': env.db(['SQLITE_URL', 'MYSQL_URL'][env('MYSQL')])
 }
 
+# Постоянные соединения: CONN_MAX_AGE секунд (0 - соединение на запрос,
+# пусто или none - без ограничения), CONN_HEALTH_CHECKS - проверка перед
+# запросом. Пул соединений (DB_POOL=True, myapp.db.pool) заменяет
+# постоянные соединения, поэтому с ним CONN_MAX_AGE должен оставаться 0.
+CONN_MAX_AGE = env.str('CONN_MAX_AGE', default='0').strip()
+DATABASES['default'].update({
+    'CONN_MAX_AGE': (None if CONN_MAX_AGE.lower() in ('', 'none')
+                     else int(CONN_MAX_AGE)),
+    'CONN_HEALTH_CHECKS': env.bool('CONN_HEALTH_CHECKS', default=False),
+})
+if env.bool('DB_POOL', default=False):
+    DATABASES['default'].update({
+        'ENGINE': ['myapp.db.backends.sqlite3', 'myapp.db.backends.mysql'][
+            env('MYSQL')],
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'SIZE': env.int('DB_POOL_SIZE', default=5),
+            'MAX_OVERFLOW': env.int('DB_POOL_MAX_OVERFLOW', default=10),
+            'RECYCLE': env.int('DB_POOL_RECYCLE', default=3600),
+            'TIMEOUT': env.int('DB_POOL_TIMEOUT', default=30),
+            'PRE_PING': env.bool('DB_POOL_PRE_PING', default=True),
+        },
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# locmemcache:// для разработки и тестов, redis://127.0.0.1:6379/1 в продакшене
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
+# Время жизни закешированных ответов API (myapp.cache), секунды
+RESPONSE_CACHE_TIMEOUT = env('RESPONSE_CACHE_TIMEOUT')
+
+
+# Реплики только для чтения (myapp.routers): REPLICA_URLS - список URL
+# через запятую в том же формате, что SQLITE_URL/MYSQL_URL.
+# Например, две локальные SQLite-базы:
+# REPLICA_URLS=sqlite:///replica1.db,sqlite:///replica2.db
+DATABASE_REPLICAS = []
+for index, url in enumerate(env.list('REPLICA_URLS', default=[]), start=1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **env.db_url_config(url),
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['myapp.routers.ReplicaRouter']
+
+# Очередь фоновых задач (myapp.jobs, manage.py run_jobs)
+JOB_POLL_INTERVAL = env.float('JOB_POLL_INTERVAL', default=1.0)
+# через сколько секунд без отметок задача считается брошенной воркером
+JOB_LOCK_TIMEOUT = env.int('JOB_LOCK_TIMEOUT', default=300)
+# задержка первого повтора, дальше удваивается
+JOB_RETRY_DELAY = env.int('JOB_RETRY_DELAY', default=10)
+JOB_BATCH_SIZE = env.int('JOB_BATCH_SIZE', default=1000)
+OVERDUE_SWEEP_INTERVAL = env.int('OVERDUE_SWEEP_INTERVAL', default=300)
+
+# /api/sync/ (myapp.sync): строк каждого вида в ответе, запас в секундах
+# на транзакции и расхождение часов, срок хранения удалений в днях
+SYNC_PAGE_SIZE = env.int('SYNC_PAGE_SIZE', default=500)
+SYNC_SAFETY_WINDOW = env.int('SYNC_SAFETY_WINDOW', default=5)
+SYNC_TOMBSTONE_DAYS = env.int('SYNC_TOMBSTONE_DAYS', default=30)
+
+# /api/tasks/analytics/ (myapp.analytics): наибольший диапазон в днях,
+# сколько последних дней среза пересчитывать при каждом проходе
+ANALYTICS_MAX_DAYS = env.int('ANALYTICS_MAX_DAYS', default=731)
+ANALYTICS_ROLLUP_REFRESH_DAYS = env.int('ANALYTICS_ROLLUP_REFRESH_DAYS', default=7)
+ANALYTICS_ROLLUP_INTERVAL = env.int('ANALYTICS_ROLLUP_INTERVAL', default=3600)
+
+# Сколько секунд после записи клиент читает с основной БД
+READ_YOUR_WRITES_SECONDS = env.int('READ_YOUR_WRITES_SECONDS', default=5)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -137,11 +218,22 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Списки через values() без ModelSerializer (myapp.encoders)
+FAST_LIST_SERIALIZATION = env.bool('FAST_LIST_SERIALIZATION', default=True)
+
+# JSON через orjson (myapp.renderers), вывод не отличается от JSONRenderer
+FAST_JSON_RENDERER = env.bool('FAST_JSON_RENDERER', default=True)
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'myapp.renderers.FastJSONRenderer' if FAST_JSON_RENDERER
+        else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'PAGE_SIZE': 3,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'myapp.authentication.TokenUserAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -151,8 +243,52 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=10),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
-    # 'ROTATE_REFRESH_TOKENS': True,
-    # 'BLACKLIST_AFTER_ROTATION': True,
+    'ROTATE_REFRESH_TOKENS': True,
+    'BLACKLIST_AFTER_ROTATION': True,
+    # отзыв проверяется по памяти процесса (myapp.revocation)
+    'AUTH_TOKEN_CLASSES': ('myapp.authentication.RevocableAccessToken',),
+    'TOKEN_REFRESH_SERIALIZER': 'myapp.serializers.TokenRefreshSerializer',
     # 'AUTH_COOKIE': 'Authorization',
     # 'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+# Кеш проверенных JWT и снимков пользователей (myapp.authentication).
+# Изменение пользователя сбрасывает снимок только в своём процессе: в
+# остальных отключённый пользователь проходит ещё до JWT_USER_CACHE_TTL
+# секунд, если его токены не отозваны (myapp.revocation).
+JWT_VERIFIED_CACHE_SIZE = env.int('JWT_VERIFIED_CACHE_SIZE', default=10000)
+JWT_USER_CACHE_SIZE = env.int('JWT_USER_CACHE_SIZE', default=10000)
+JWT_USER_CACHE_TTL = env.int('JWT_USER_CACHE_TTL', default=60)
+
+# Отзыв токенов (myapp.revocation): период синхронизации с БД в секундах
+# (0 - выключена; фоновый поток запускается при первой проверке токена),
+# сколько секунд старый refresh-токен действует после ротации, размер
+# фильтра Блума в битах и число хешей
+REVOCATION_SYNC_INTERVAL = env.float('REVOCATION_SYNC_INTERVAL', default=5.0)
+REVOCATION_ROTATION_GRACE = env.int('REVOCATION_ROTATION_GRACE', default=10)
+REVOCATION_BLOOM_BITS = env.int('REVOCATION_BLOOM_BITS', default=1 << 20)
+REVOCATION_BLOOM_HASHES = env.int('REVOCATION_BLOOM_HASHES', default=7)
+
+# Хеширование паролей (myapp.hashing): итерации PBKDF2, потоков пула,
+# мест в очереди сверх них, секунд ожидания до ответа 503
+PASSWORD_HASH_ITERATIONS = env.int('PASSWORD_HASH_ITERATIONS', default=1000000)
+PASSWORD_HASH_WORKERS = env.int('PASSWORD_HASH_WORKERS', default=4)
+PASSWORD_HASH_QUEUE = env.int('PASSWORD_HASH_QUEUE', default=32)
+PASSWORD_HASH_TIMEOUT = env.float('PASSWORD_HASH_TIMEOUT', default=10.0)
+
+PASSWORD_HASHERS = [
+    'myapp.hashing.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+AUTHENTICATION_BACKENDS = ['myapp.hashing.OffloadedModelBackend']
+
+# Доля профилируемых запросов (myapp.middleware.ProfilingMiddleware):
+# 0 - выключено, 1 - каждый запрос
+PROFILING_SAMPLE_RATE = env.float('PROFILING_SAMPLE_RATE', default=1.0)
+# Токен для чтения /api/_metrics без сессии персонала
+# (Authorization: Bearer <токен>); пусто - только персонал
+METRICS_TOKEN = env.str('METRICS_TOKEN', default='')